@@ -0,0 +1,156 @@
+# Compares splits of the CPU cores into concurrent Blender renderings (jobs) of a number of threads each, pinned to their cores
+# by CpuCoreScheduler, against running as many renderings that each use all cores. The split with the highest throughput is the
+# one to configure with RENDER_MAX_CONCURRENT (or BLENDER_WORKER_POOL_SIZE) and RENDER_CPU_THREADS_PER_JOB for this host.
+#
+# Run from the fastapi-server directory, with Blender on the PATH or BLENDER_PATH set:
+#   python3 benchmarks/benchmark_cpu_scheduling.py [--jobs 1 2 4] [--renderings 8] [--points 100000] [--samples 16] [--output report.json]
+
+import os
+import sys
+import json
+import uuid
+import random
+import argparse
+import subprocess
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIRECTORY)
+
+# Blender processes of this benchmark render on the CPU, regardless of the server's configuration
+os.environ['RENDER_BACKEND'] = 'CPU'
+
+from blender_worker_pool import blender_args, blender_env
+from render_backend import CpuCoreScheduler, available_cpu_cores
+
+EVENT_LINE_PREFIX = 'DATACANVAS-EVENT '
+
+
+def write_scene_elements(path, point_count, seed=0):
+    generator = random.Random(seed)
+    points = [
+        {
+            'x': generator.uniform(0.01, 1),
+            'y': generator.uniform(0.01, 1),
+            'z': generator.uniform(0.01, 1),
+            'size': generator.uniform(0.5, 2),
+            'r': generator.random(),
+            'g': generator.random(),
+            'b': generator.random(),
+        }
+        for _ in range(point_count)
+    ]
+    scene_element = {
+        'id': 1,
+        'type': 'point-primitive',
+        'colorRGB': [0.5, 0.5, 0.5],
+        'translateXZ': {'0': 0, '1': 0},
+        'translateY': 0.25,
+        'scaleY': 1,
+        'extent': None,
+        'idBufferOnly': True,
+        'points': points,
+    }
+    with open(path, 'w') as f:
+        json.dump([scene_element], f)
+
+
+def render(directory, scene_elements_file, samples, width, height, scheduler=None, threads=None):
+    # Renders in a one-shot Blender process like run_server.py does, returns the wall-clock and sampling seconds
+    file_uuid = os.path.join(directory, f"{uuid.uuid4()}")
+    render_passes = [{'scale': 1.0, 'samples': samples, 'denoise': False, 'output_file': f"{file_uuid}.png"}]
+    cores = scheduler.acquire() if scheduler is not None else None
+    try:
+        args = blender_args([
+            "--datacanvas-blend-file-filename", file_uuid,
+            "--datacanvas-width", f"{width}",
+            "--datacanvas-height", f"{height}",
+            "--datacanvas-scene-elements-file", scene_elements_file,
+            "--datacanvas-render-passes", json.dumps(render_passes),
+        ], threads=len(cores) if cores else threads)
+        t_start = perf_counter()
+        process = subprocess.run(
+            (scheduler.command_prefix(cores) if scheduler is not None else []) + args,
+            env=blender_env(),
+            cwd=SERVER_DIRECTORY,
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        seconds = perf_counter() - t_start
+    finally:
+        if cores is not None:
+            scheduler.release(cores)
+
+    sampling_seconds = 0.0
+    for line in process.stdout.decode('utf-8', errors='replace').splitlines():
+        if line.startswith(EVENT_LINE_PREFIX):
+            event = json.loads(line[len(EVENT_LINE_PREFIX):])
+            if event.get('type') == 'render_pass':
+                sampling_seconds += event['timings']['render_sampling']
+    return seconds, sampling_seconds
+
+
+def benchmark(directory, scene_elements_file, cores, jobs, renderings, samples, width, height, split):
+    # split: the cores are divided between the jobs, otherwise every job uses all cores
+    scheduler = CpuCoreScheduler(cores, len(cores) // jobs) if split else None
+    t_start = perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(
+            lambda _: render(directory, scene_elements_file, samples, width, height, scheduler=scheduler, threads=len(cores)),
+            range(renderings),
+        ))
+    seconds = perf_counter() - t_start
+
+    latencies = sorted(result[0] for result in results)
+    return {
+        'jobs': jobs,
+        'threads_per_job': scheduler.threads_per_job if split else len(cores),
+        'split': split,
+        'renderings': renderings,
+        'seconds': seconds,
+        'renderings_per_minute': renderings / seconds * 60,
+        'latency_mean_seconds': sum(latencies) / len(latencies),
+        'latency_max_seconds': latencies[-1],
+        'sampling_mean_seconds': sum(result[1] for result in results) / len(results),
+    }
+
+
+def main():
+    cores = available_cpu_cores()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, nargs='+', default=sorted(set(jobs for jobs in [1, 2, 4, 8, 16] if jobs <= len(cores))))
+    parser.add_argument('--renderings', type=int, default=None, help="Renderings per configuration, by default twice the largest number of jobs")
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--samples', type=int, default=16)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    renderings = args.renderings or 2 * max(args.jobs)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        scene_elements_file = os.path.join(directory, 'scene_elements.json')
+        write_scene_elements(scene_elements_file, args.points)
+        for jobs in args.jobs:
+            if jobs > len(cores):
+                print(f"Skipping {jobs} jobs, there are only {len(cores)} cores")
+                continue
+            for split in ([True, False] if jobs > 1 else [True]):
+                result = benchmark(directory, scene_elements_file, cores, jobs, renderings, args.samples, args.width, args.height, split)
+                results.append(result)
+                print(f"{jobs:>3} jobs x {result['threads_per_job']:>3} threads{' (unsplit)' if not split else '          '}: {result['renderings_per_minute']:7.2f} renderings/min, latency {result['latency_mean_seconds']:7.2f}s mean, {result['latency_max_seconds']:7.2f}s max, sampling {result['sampling_mean_seconds']:7.2f}s")
+
+    best = max(results, key=lambda result: result['renderings_per_minute'])
+    print(f"Highest throughput with {best['jobs']} jobs x {best['threads_per_job']} threads")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cores': len(cores), 'points': args.points, 'samples': args.samples, 'width': args.width, 'height': args.height, 'results': results, 'best': best}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
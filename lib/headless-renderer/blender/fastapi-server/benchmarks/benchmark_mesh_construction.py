@@ -0,0 +1,106 @@
+# Compares the per-vertex (mathutils/BMesh) and the bulk (numpy/foreach_set) construction of point meshes.
+#
+# Run from the fastapi-server directory:
+#   blender --background --factory-startup --python benchmarks/benchmark_mesh_construction.py -- [--point-counts 10000 100000 1000000] [--output report.json]
+
+import os
+import sys
+import json
+import random
+import argparse
+import importlib.util
+
+from time import perf_counter
+
+import bpy
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The script's file name is not a valid module name, so it is loaded from its path
+spec = importlib.util.spec_from_file_location('headless_renderer_blender', os.path.join(SERVER_DIRECTORY, 'headless-renderer-blender.py'))
+headless_renderer_blender = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(headless_renderer_blender)
+
+from scene_arrays import points_to_columns
+
+
+def random_points(count, seed=0):
+    generator = random.Random(seed)
+    return [
+        {
+            'x': generator.uniform(0.01, 1),
+            'y': generator.uniform(0.01, 1),
+            'z': generator.uniform(0.01, 1),
+            'size': generator.uniform(0.5, 2),
+            'r': generator.random(),
+            'g': generator.random(),
+            'b': generator.random(),
+        }
+        for _ in range(count)
+    ]
+
+
+def new_mesh_object(name):
+    mesh = bpy.data.meshes.new(name)
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj, mesh
+
+
+def remove_mesh_object(obj, mesh):
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(mesh)
+
+
+def benchmark(point_count, type):
+    points = random_points(point_count)
+
+    obj, mesh = new_mesh_object('per_vertex')
+    t_start = perf_counter()
+    headless_renderer_blender.build_point_mesh_per_vertex(obj, mesh, points, type=type)
+    per_vertex_seconds = perf_counter() - t_start
+    per_vertex_vertex_count = len(mesh.vertices)
+    remove_mesh_object(obj, mesh)
+
+    obj, mesh = new_mesh_object('bulk')
+    t_start = perf_counter()
+    columns = points_to_columns(points)
+    t_columns = perf_counter()
+    headless_renderer_blender.build_point_mesh(mesh, columns, type=type)
+    bulk_seconds = perf_counter() - t_start
+    bulk_vertex_count = len(mesh.vertices)
+    remove_mesh_object(obj, mesh)
+
+    assert per_vertex_vertex_count == bulk_vertex_count
+
+    return {
+        'type': type,
+        'point_count': point_count,
+        'per_vertex_seconds': per_vertex_seconds,
+        'bulk_seconds': bulk_seconds,
+        'bulk_columns_seconds': t_columns - t_start,
+        'speedup': per_vertex_seconds / bulk_seconds,
+    }
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--point-counts', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    results = []
+    for type in ['point-primitive', 'line-primitive']:
+        for point_count in args.point_counts:
+            result = benchmark(point_count, type)
+            results.append(result)
+            print(f"{type:>16} {point_count:>9} points: per-vertex {result['per_vertex_seconds']:8.3f}s, bulk {result['bulk_seconds']:8.3f}s (of which {result['bulk_columns_seconds']:.3f}s to columns), {result['speedup']:6.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'blender_version': bpy.app.version_string, 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
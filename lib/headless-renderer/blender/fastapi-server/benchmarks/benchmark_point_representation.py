@@ -0,0 +1,152 @@
+# Compares realized, instanced, and point cloud geometry of point and line primitives: geometry node evaluation, Cycles scene
+# synchronization and rendering time, and Cycles' peak memory.
+#
+# Run from the fastapi-server directory:
+#   blender --background --factory-startup --addons cycles --python benchmarks/benchmark_point_representation.py -- [--point-counts 10000 100000 1000000] [--device CPU] [--output report.json]
+
+import os
+import re
+import sys
+import json
+import argparse
+import tempfile
+import importlib.util
+
+from time import perf_counter
+
+import bpy
+import numpy as np
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The script's file name is not a valid module name, so it is loaded from its path
+spec = importlib.util.spec_from_file_location('headless_renderer_blender', os.path.join(SERVER_DIRECTORY, 'headless-renderer-blender.py'))
+headless_renderer_blender = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(headless_renderer_blender)
+
+from scene_arrays import POINT_FIELDS
+
+peak_memory_megabytes = 0.0
+
+
+def on_render_stats(stats):
+    # e.g. "Fra:1 Mem:12.34M (Peak 15.67M) | ..."
+    global peak_memory_megabytes
+    match = re.search(r'Peak ([\d.]+)M', stats)
+    if match:
+        peak_memory_megabytes = max(peak_memory_megabytes, float(match.group(1)))
+
+
+def random_columns(count, seed=0):
+    generator = np.random.default_rng(seed)
+    columns = {field: generator.uniform(0, 1, count).astype(np.float32) for field in POINT_FIELDS}
+    for field in ['x', 'y', 'z']:
+        columns[field] = columns[field] * 0.99 + 0.01
+    columns['size'] = columns['size'] * 1.5 + 0.5
+    return columns
+
+
+def reset_scene():
+    for collection_name in ['objects', 'meshes', 'materials', 'node_groups', 'cameras', 'lights']:
+        collection = getattr(bpy.data, collection_name)
+        for data_block in list(collection):
+            collection.remove(data_block)
+
+
+def setup_scene(device, resolution):
+    scene = bpy.context.scene
+    scene.render.engine = 'CYCLES'
+    scene.cycles.device = device
+    scene.cycles.samples = 1
+    scene.cycles.use_denoising = False
+    scene.render.resolution_x, scene.render.resolution_y = resolution
+    scene.render.resolution_percentage = 100
+
+    camera = bpy.data.cameras.new('Camera')
+    camera_object = bpy.data.objects.new('Camera', camera)
+    camera_object.location = (2.5, -2.5, 2.0)
+    camera_object.rotation_euler = (1.1, 0, 0.785)
+    scene.collection.objects.link(camera_object)
+    scene.camera = camera_object
+    return scene
+
+
+def add_points_object(scene, columns, type, representation):
+    mesh = bpy.data.meshes.new(f"{type}_{representation}")
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    scene.collection.objects.link(obj)
+
+    material = bpy.data.materials.new(f"Material_{type}_{representation}")
+    material.use_nodes = True
+    obj.data.materials.append(material)
+
+    headless_renderer_blender.build_point_mesh(mesh, columns, type=type)
+    headless_renderer_blender.add_point_rendering_geometry_nodes(obj, material, type=type, representation=representation)
+    return obj
+
+
+def benchmark(point_count, type, representation, device, resolution):
+    global peak_memory_megabytes
+
+    reset_scene()
+    scene = setup_scene(device, resolution)
+    columns = random_columns(point_count)
+
+    t_start = perf_counter()
+    obj = add_points_object(scene, columns, type, representation)
+    t_build = perf_counter()
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    depsgraph.update()
+    t_evaluate = perf_counter()
+
+    evaluated = obj.evaluated_get(depsgraph)
+    instance_count = sum(1 for instance in depsgraph.object_instances if instance.is_instance and instance.parent and instance.parent.original == obj)
+    evaluated_vertex_count = len(evaluated.data.vertices) if hasattr(evaluated.data, 'vertices') else 0
+
+    peak_memory_megabytes = 0.0
+    with tempfile.TemporaryDirectory() as directory:
+        scene.render.filepath = os.path.join(directory, 'render.png')
+        t_render_start = perf_counter()
+        bpy.ops.render.render(write_still=True)
+        t_render_end = perf_counter()
+
+    return {
+        'type': type,
+        'representation': representation,
+        'point_count': point_count,
+        'build_seconds': t_build - t_start,
+        'geometry_nodes_seconds': t_evaluate - t_build,
+        'render_seconds': t_render_end - t_render_start,
+        'peak_memory_megabytes': peak_memory_megabytes,
+        'evaluated_vertex_count': evaluated_vertex_count,
+        'instance_count': instance_count,
+    }
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--point-counts', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--representations', nargs='+', default=headless_renderer_blender.POINT_REPRESENTATIONS)
+    parser.add_argument('--device', default='CPU')
+    parser.add_argument('--resolution', type=int, nargs=2, default=[640, 480])
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    bpy.app.handlers.render_stats.append(on_render_stats)
+
+    results = []
+    for type in ['point-primitive', 'line-primitive']:
+        for point_count in args.point_counts:
+            for representation in args.representations:
+                result = benchmark(point_count, type, representation, args.device, args.resolution)
+                results.append(result)
+                print(f"{type:>16} {point_count:>9} points {representation:>11}: geometry nodes {result['geometry_nodes_seconds']:8.3f}s, render {result['render_seconds']:8.3f}s, peak {result['peak_memory_megabytes']:9.1f}M")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'blender_version': bpy.app.version_string, 'device': args.device, 'resolution': args.resolution, 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# Compares the construction of cuboid scene elements through operators with a material per cuboid, and through the data API
+# with a single shared cube mesh and materials shared by color.
+#
+# Run from the fastapi-server directory:
+#   blender --background --factory-startup --python benchmarks/benchmark_scene_construction.py -- [--cuboid-counts 100 1000 10000] [--colors 16] [--output report.json]
+
+import os
+import sys
+import json
+import random
+import argparse
+import importlib.util
+
+from time import perf_counter
+
+import bpy
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The script's file name is not a valid module name, so it is loaded from its path
+spec = importlib.util.spec_from_file_location('headless_renderer_blender', os.path.join(SERVER_DIRECTORY, 'headless-renderer-blender.py'))
+headless_renderer_blender = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(headless_renderer_blender)
+
+add_cuboid = headless_renderer_blender.add_cuboid
+
+
+def random_cuboids(count, color_count, seed=0):
+    # Same properties as the scene elements that the datacanvas frontend sends for datacubes
+    generator = random.Random(seed)
+    colors = [[generator.random(), generator.random(), generator.random()] for _ in range(color_count)]
+    return [
+        {
+            'id': 4294967295 - index,
+            'type': 'csv',
+            'colorRGB': generator.choice(colors),
+            'translateXZ': {'0': generator.uniform(-5, 5), '1': generator.uniform(-5, 5)},
+            'translateY': 0.25,
+            'scaleY': generator.uniform(0.1, 2),
+            'extent': {'minX': -0.25, 'maxX': 0.25, 'minZ': -0.25, 'maxZ': 0.25} if generator.random() < 0.5 else None,
+            'idBufferOnly': False,
+            'points': None,
+        }
+        for index in range(count)
+    ]
+
+
+def data_block_counts():
+    return {
+        'objects': len(bpy.data.objects),
+        'meshes': len(bpy.data.meshes),
+        'materials': len(bpy.data.materials),
+        'node_groups': len(bpy.data.node_groups),
+    }
+
+
+def build(scene_elements, add_cuboid_function, snapshot):
+    headless_renderer_blender.add_cuboid = add_cuboid_function
+    scene = bpy.context.scene
+    t_start = perf_counter()
+    for scene_element in scene_elements:
+        headless_renderer_blender.add_scene_element(scene, scene_element)
+    seconds = perf_counter() - t_start
+    counts = data_block_counts()
+    headless_renderer_blender.reset_scene(snapshot)
+    return seconds, counts
+
+
+def benchmark(cuboid_count, color_count, snapshot):
+    scene_elements = random_cuboids(cuboid_count, color_count)
+
+    operators_seconds, operators_counts = build(scene_elements, headless_renderer_blender.add_cuboid_with_operators, snapshot)
+    data_api_seconds, data_api_counts = build(scene_elements, add_cuboid, snapshot)
+
+    return {
+        'cuboid_count': cuboid_count,
+        'color_count': color_count,
+        'operators_seconds': operators_seconds,
+        'operators_per_cuboid_seconds': operators_seconds / cuboid_count,
+        'operators_data_blocks': operators_counts,
+        'data_api_seconds': data_api_seconds,
+        'data_api_per_cuboid_seconds': data_api_seconds / cuboid_count,
+        'data_api_data_blocks': data_api_counts,
+        'speedup': operators_seconds / data_api_seconds,
+    }
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cuboid-counts', type=int, nargs='+', default=[100, 1_000, 10_000])
+    parser.add_argument('--colors', type=int, default=16)
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    # The factory startup scene has no Foreground collection, which scene elements are added to
+    if 'Foreground' not in bpy.data.collections:
+        bpy.context.scene.collection.children.link(bpy.data.collections.new('Foreground'))
+    snapshot = headless_renderer_blender.snapshot_data_blocks()
+
+    results = []
+    for cuboid_count in args.cuboid_counts:
+        result = benchmark(cuboid_count, args.colors, snapshot)
+        results.append(result)
+        print(f"{cuboid_count:>6} cuboids: operators {result['operators_seconds']:8.3f}s ({result['operators_data_blocks']['materials']} materials), data API {result['data_api_seconds']:8.3f}s ({result['data_api_data_blocks']['materials']} materials), {result['speedup']:6.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'blender_version': bpy.app.version_string, 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# Compares the startup of one-shot Blender processes with BLENDER_STARTUP_PROFILE=default and fast: the time until Blender runs the
+# script (blender_startup), sets up the Cycles devices (device_setup), and added the first scene element (time to first scene
+# element), and, unless --no-render, wrote a small image, which includes loading the Cycles kernels. The kernel caches in
+# BLENDER_CACHE_DIRECTORY are warmed up by a first run that is not measured or, with --cold-cache, emptied before every run.
+#
+# Run from the fastapi-server directory, with Blender on the PATH or BLENDER_PATH set:
+#   python3 benchmarks/benchmark_startup.py [--profiles default fast] [--runs 5] [--cold-cache] [--no-render] [--output report.json]
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from time import perf_counter
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIRECTORY = os.path.dirname(BENCHMARKS_DIRECTORY)
+sys.path.insert(0, SERVER_DIRECTORY)
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+
+from blender_worker_pool import BLENDER_FAST_START_SCENE_FILE, BLENDER_STARTUP_PROFILES, blender_args, blender_env, create_fast_start_scene_file
+from synthetic_scenes import CAMERA, synthetic_scene_elements
+
+EVENT_LINE_PREFIX = 'DATACANVAS-EVENT '
+STAGES = ['blender_startup', 'device_setup', 'first_scene_element', 'first_image', 'blender_process']
+
+
+def run_blender(directory, scene_elements_file, render):
+    # Returns the seconds from starting the process until each stage, as the script reports them or its events arrive
+    file_uuid = os.path.join(directory, f"{uuid.uuid4()}")
+    script_args = [
+        "--datacanvas-blend-file-filename", file_uuid,
+        "--datacanvas-width", "64",
+        "--datacanvas-height", "64",
+        "--datacanvas-camera-eye", json.dumps(CAMERA['camera_eye']),
+        "--datacanvas-camera-center", json.dumps(CAMERA['camera_center']),
+        "--datacanvas-scene-elements-file", scene_elements_file,
+    ]
+    if render:
+        script_args += ["--datacanvas-output-file", f"{file_uuid}.png"]
+
+    seconds = {}
+    started_at = time.time()
+    t_start = perf_counter()
+    process = subprocess.Popen(blender_args(script_args), env=blender_env(), cwd=SERVER_DIRECTORY, stdout=subprocess.PIPE)
+    timings = {}
+    for line in process.stdout:
+        line = line.decode('utf-8', errors='replace')
+        if not line.startswith(EVENT_LINE_PREFIX):
+            continue
+        event = json.loads(line[len(EVENT_LINE_PREFIX):])
+        if event.get('type') == 'progress' and event.get('stage') == 'scene' and 'first_scene_element' not in seconds:
+            seconds['first_scene_element'] = perf_counter() - t_start
+        elif event.get('type') == 'timings':
+            timings = event['timings']
+    if process.wait() != 0:
+        raise RuntimeError(f"Blender exited with {process.returncode}, see {file_uuid}.log")
+    seconds['blender_process'] = perf_counter() - t_start
+
+    if 'script_started_at' in timings:
+        seconds['blender_startup'] = timings['script_started_at'] - started_at
+    if 'device_setup' in timings:
+        seconds['device_setup'] = timings['device_setup']
+    if render and 'render_sampling' in timings:
+        # The image is written right before the timings, shortly before the process exits
+        seconds['first_image'] = seconds['blender_process']
+    return seconds
+
+
+def benchmark(profile, directory, scene_elements_file, runs, cold_cache, render):
+    os.environ['BLENDER_STARTUP_PROFILE'] = profile
+    cache_directory = os.path.join(directory, f"blender-cache-{profile}")
+    os.environ['BLENDER_CACHE_DIRECTORY'] = cache_directory
+    if not cold_cache:
+        run_blender(directory, scene_elements_file, render)
+
+    stage_seconds = {stage: [] for stage in STAGES}
+    for _ in range(runs):
+        if cold_cache:
+            shutil.rmtree(cache_directory, ignore_errors=True)
+        for stage, seconds in run_blender(directory, scene_elements_file, render).items():
+            stage_seconds[stage].append(seconds)
+
+    return {
+        'profile': profile,
+        'cold_cache': cold_cache,
+        'runs': runs,
+        'seconds': {
+            stage: {'min': min(values), 'median': statistics.median(values), 'mean': statistics.mean(values)}
+            for stage, values in stage_seconds.items()
+            if values
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', nargs='+', choices=BLENDER_STARTUP_PROFILES, default=BLENDER_STARTUP_PROFILES)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--cold-cache', action='store_true', help="Empty the kernel caches before every run")
+    parser.add_argument('--no-render', action='store_true', help="Only build the scene, without rendering an image")
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    os.chdir(SERVER_DIRECTORY)
+    if 'fast' in args.profiles and not os.path.isfile(BLENDER_FAST_START_SCENE_FILE):
+        create_fast_start_scene_file()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # A single cuboid, so that the time to the first scene element is startup and not scene construction
+        scene_elements_file = os.path.join(directory, 'scene_elements.json')
+        with open(scene_elements_file, 'w') as f:
+            json.dump(synthetic_scene_elements('cuboids', 1), f)
+
+        for profile in args.profiles:
+            result = benchmark(profile, directory, scene_elements_file, args.runs, args.cold_cache, not args.no_render)
+            results.append(result)
+            print(f"{profile:>8}: " + ", ".join(f"{stage} {seconds['median']:.2f}s" for stage, seconds in result['seconds'].items()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cold_cache': args.cold_cache, 'render': not args.no_render, 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
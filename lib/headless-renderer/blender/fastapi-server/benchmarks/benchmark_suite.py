@@ -0,0 +1,308 @@
+# Measures how the stages of a rendering scale with synthetic scenes (see synthetic_scenes.py) of cuboids, point primitives, line
+# primitives, and a mix of them, from 10 to 1M points:
+#
+#   json_serialize   the request body, as the frontend sends it
+#   json_parse       the request body with json.loads, for reference
+#   request_parse    the request body with the server's streaming parser into a binary scene payload
+#   payload_write    a binary scene payload from scene elements with lists of points
+#   payload_read     the binary scene payload, as Blender reads it
+#   scene_build      add_scene_element for all scene elements, once per point representation, against the recording stand-in for
+#                    bpy in fake_bpy.py -- this measures the script's own Python work, not Blender's; the results include the number
+#                    of API calls and data blocks, which do not depend on the machine
+#   geometry_nodes   the part of scene_build spent in add_point_rendering_geometry_nodes
+#   blender_*        with --blender, the stages of a one-shot Blender process, as Blender reports them, and blender_process overall
+#
+# Run from the fastapi-server directory, without Blender:
+#   python3 benchmarks/benchmark_suite.py [--scenes cuboids points lines mixed] [--sizes 10 1000 100000] [--repeat 5] [--output report.json]
+# with the full pipeline in Blender (on the PATH or BLENDER_PATH set):
+#   python3 benchmarks/benchmark_suite.py --blender [--samples 2] [--output report.json]
+# and compared against the report of another commit, exiting with 1 on regressions:
+#   python3 benchmarks/benchmark_suite.py --compare baseline.json [--max-regression 1.2] [--output report.json]
+
+import io
+import os
+import sys
+import json
+import uuid
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import importlib.util
+
+from datetime import datetime, timezone
+from time import perf_counter
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIRECTORY = os.path.dirname(BENCHMARKS_DIRECTORY)
+sys.path.insert(0, SERVER_DIRECTORY)
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+
+import numpy as np
+
+from fake_bpy import FakeBlender
+from scene_payload import read_scene_payload, write_scene_payload
+from streaming_scene_parser import parse_scene_stream
+from synthetic_scenes import SCENE_KINDS, log_sizes, scene_point_count, synthetic_configuration
+
+REPORT_VERSION = 1
+EVENT_LINE_PREFIX = 'DATACANVAS-EVENT '
+# Size of the chunks that the streaming parser reads, as uvicorn receives them
+REQUEST_CHUNK_BYTES = 65536
+# Stages of Blender's timings event that are reported, see render_job in headless-renderer-blender.py
+BLENDER_STAGES = ['scene_payload_read', 'scene_build', 'render_sync', 'render_sampling', 'image_write', 'blender_script']
+
+
+def load_blender_script(fake_blender):
+    # The script's file name is not a valid module name, so it is loaded from its path, after the stand-in replaced bpy
+    fake_blender.install()
+    spec = importlib.util.spec_from_file_location('headless_renderer_blender', os.path.join(SERVER_DIRECTORY, 'headless-renderer-blender.py'))
+    headless_renderer_blender = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(headless_renderer_blender)
+    return headless_renderer_blender
+
+
+def summarize(seconds):
+    return {'min': min(seconds), 'median': statistics.median(seconds), 'mean': statistics.mean(seconds), 'runs': len(seconds)}
+
+
+def measure(function, repeat):
+    # Returns the result of the last run and the statistics of all runs' seconds
+    seconds = []
+    for _ in range(repeat):
+        t_start = perf_counter()
+        result = function()
+        seconds.append(perf_counter() - t_start)
+    return result, summarize(seconds)
+
+
+def chunk_reader(data, size):
+    # next_chunk for parse_scene_stream, returns b'' at the end like the request stream
+    offsets = iter(range(0, len(data), size))
+
+    def next_chunk():
+        offset = next(offsets, None)
+        return data[offset:offset + size] if offset is not None else b''
+
+    return next_chunk
+
+
+def read_payload_points(payload_file):
+    _, scene_elements = read_scene_payload(payload_file)
+    return [np.array(values) for scene_element in scene_elements for values in (scene_element.get('points') or {}).values()]
+
+
+def benchmark_serialization(configuration, directory, repeat):
+    results = {}
+    body, results['json_serialize'] = measure(lambda: json.dumps(configuration).encode('utf-8'), repeat)
+    _, results['json_parse'] = measure(lambda: json.loads(body), repeat)
+    _, results['request_parse'] = measure(lambda: parse_scene_stream(chunk_reader(body, REQUEST_CHUNK_BYTES), io.BytesIO()), repeat)
+
+    scene_elements = configuration['scene_elements']
+    scene_configuration = {key: value for key, value in configuration.items() if key != 'scene_elements'}
+    _, results['payload_write'] = measure(lambda: write_scene_payload(io.BytesIO(), scene_configuration, scene_elements), repeat)
+
+    payload_file = os.path.join(directory, f"{uuid.uuid4()}.scene")
+    with open(payload_file, 'wb') as f:
+        write_scene_payload(f, scene_configuration, scene_elements)
+    # Reading maps the file, so the points are copied too, as building the scene touches all of them
+    _, results['payload_read'] = measure(lambda: read_payload_points(payload_file), repeat)
+
+    sizes = {'request_bytes': len(body), 'payload_bytes': os.path.getsize(payload_file)}
+    return results, sizes, payload_file
+
+
+def benchmark_scene_build(fake_blender, headless_renderer_blender, payload_file, representation, repeat):
+    add_point_rendering_geometry_nodes = headless_renderer_blender.add_point_rendering_geometry_nodes
+    geometry_nodes_seconds = []
+
+    def timed_add_point_rendering_geometry_nodes(*args, **kwargs):
+        t_start = perf_counter()
+        modifier = add_point_rendering_geometry_nodes(*args, **kwargs)
+        geometry_nodes_seconds[-1] += perf_counter() - t_start
+        return modifier
+
+    def build():
+        # Every run starts from an empty scene, as a new Blender process would
+        fake_blender.reset()
+        headless_renderer_blender.shared_data_block_names.clear()
+        geometry_nodes_seconds.append(0.0)
+        _, scene_elements = read_scene_payload(payload_file)
+        scene = fake_blender.bpy.context.scene
+        t_start = perf_counter()
+        for scene_element in scene_elements:
+            headless_renderer_blender.add_scene_element(scene, scene_element, point_representation={'point-primitive': representation, 'line-primitive': representation})
+        return perf_counter() - t_start
+
+    headless_renderer_blender.add_point_rendering_geometry_nodes = timed_add_point_rendering_geometry_nodes
+    try:
+        seconds = [build() for _ in range(repeat)]
+    finally:
+        headless_renderer_blender.add_point_rendering_geometry_nodes = add_point_rendering_geometry_nodes
+
+    return summarize(seconds), summarize(geometry_nodes_seconds), dict(fake_blender.calls), fake_blender.data_block_counts()
+
+
+def benchmark_blender(blender_args, blender_env, configuration, payload_file, directory, samples, repeat):
+    # One-shot Blender processes, like run_server.py starts them without a worker pool
+    stage_seconds = {stage: [] for stage in ['blender_process'] + BLENDER_STAGES}
+    for _ in range(repeat):
+        file_uuid = os.path.join(directory, f"{uuid.uuid4()}")
+        render_passes = [{'scale': 1.0, 'samples': samples, 'denoise': False, 'output_file': f"{file_uuid}.png"}]
+        args = blender_args([
+            "--datacanvas-blend-file-filename", file_uuid,
+            "--datacanvas-width", f"{configuration['width']}",
+            "--datacanvas-height", f"{configuration['height']}",
+            "--datacanvas-camera-eye", json.dumps(configuration['camera_eye']),
+            "--datacanvas-camera-center", json.dumps(configuration['camera_center']),
+            "--datacanvas-camera-fov-y-degrees", f"{configuration['camera_fov_y_degrees']}",
+            "--datacanvas-scene-elements-file", payload_file,
+            "--datacanvas-render-passes", json.dumps(render_passes),
+        ])
+        t_start = perf_counter()
+        process = subprocess.run(args, env=blender_env(), cwd=SERVER_DIRECTORY, stdout=subprocess.PIPE, check=True)
+        stage_seconds['blender_process'].append(perf_counter() - t_start)
+
+        timings = {}
+        for line in process.stdout.decode('utf-8', errors='replace').splitlines():
+            if line.startswith(EVENT_LINE_PREFIX):
+                event = json.loads(line[len(EVENT_LINE_PREFIX):])
+                if event.get('type') == 'timings':
+                    timings = event['timings']
+                elif event.get('type') == 'render_pass':
+                    # Render passes report their own synchronization and sampling
+                    for stage in ['render_sync', 'render_sampling', 'image_write']:
+                        timings[stage] = timings.get(stage, 0.0) + event['timings'].get(stage, 0.0)
+        for stage in BLENDER_STAGES:
+            if stage in timings:
+                stage_seconds[stage].append(timings[stage])
+
+    return {
+        (stage if stage == 'blender_process' else f"blender_{stage}"): summarize(values)
+        for stage, values in stage_seconds.items()
+        if values
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SERVER_DIRECTORY, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return (result['scene'], result['size'], result['stage'], result.get('representation'))
+
+
+def compare(results, baseline_report, max_regression):
+    # Compares medians, as they are the least affected by outliers; stages that take less than a millisecond are too noisy
+    baseline_results = {result_key(result): result for result in baseline_report['results']}
+    regressions = []
+    for result in results:
+        baseline = baseline_results.get(result_key(result))
+        if baseline is None or baseline['seconds']['median'] < 0.001:
+            continue
+        result['baseline_ratio'] = result['seconds']['median'] / baseline['seconds']['median']
+        if result['baseline_ratio'] > max_regression:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', nargs='+', choices=SCENE_KINDS, default=SCENE_KINDS)
+    parser.add_argument('--sizes', type=int, nargs='+', default=log_sizes(10, 100_000), help="Points per scene, up to 1000000")
+    parser.add_argument('--representations', nargs='+', default=None, help="Point representations of scene_build, by default all")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--blender', action='store_true', help="Also run one-shot Blender processes")
+    parser.add_argument('--samples', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help="Report of a previous run to compare against")
+    parser.add_argument('--max-regression', type=float, default=1.2, help="Ratio of medians above which a stage counts as regressed")
+    args = parser.parse_args()
+
+    # The script logs every scene element, which would dominate small scenes
+    logging.disable(logging.INFO)
+
+    fake_blender = FakeBlender()
+    headless_renderer_blender = load_blender_script(fake_blender)
+    representations = args.representations or headless_renderer_blender.POINT_REPRESENTATIONS
+
+    if args.blender:
+        from blender_worker_pool import blender_args, blender_env
+        blender_executable = os.environ.get('BLENDER_PATH', '') + 'blender'
+        if shutil.which(blender_executable) is None:
+            parser.error(f"--blender needs Blender, but {blender_executable} was not found")
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in args.scenes:
+            for size in args.sizes:
+                configuration = synthetic_configuration(kind, size, seed=args.seed)
+                scene_elements = configuration['scene_elements']
+                # size is the requested number of points, or of cuboids for cuboid scenes, which have no points
+                case = {'scene': kind, 'size': size, 'points': scene_point_count(scene_elements), 'scene_elements': len(scene_elements)}
+
+                stage_results, sizes, payload_file = benchmark_serialization(configuration, directory, args.repeat)
+                for stage, seconds in stage_results.items():
+                    results.append(dict(case, stage=stage, seconds=seconds, **sizes))
+
+                for representation in representations:
+                    seconds, geometry_nodes_seconds, calls, data_blocks = benchmark_scene_build(fake_blender, headless_renderer_blender, payload_file, representation, args.repeat)
+                    results.append(dict(case, stage='scene_build', representation=representation, seconds=seconds, calls=calls, data_blocks=data_blocks))
+                    results.append(dict(case, stage='geometry_nodes', representation=representation, seconds=geometry_nodes_seconds))
+                    if kind == 'cuboids':
+                        # Cuboids have no points, and so no representation
+                        break
+
+                if args.blender:
+                    for stage, seconds in benchmark_blender(blender_args, blender_env, configuration, payload_file, directory, args.samples, args.repeat).items():
+                        results.append(dict(case, stage=stage, seconds=seconds))
+
+                os.remove(payload_file)
+                print(f"{kind:>8} {size:>8}: " + ", ".join(
+                    f"{result['stage']}{'/' + result['representation'] if result.get('representation') else ''} {result['seconds']['median'] * 1000:.1f}ms"
+                    for result in results
+                    if result['scene'] == kind and result['size'] == size
+                ))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline_report = json.load(f)
+        regressions = compare(results, baseline_report, args.max_regression)
+        for result in regressions:
+            print(f"Regression: {result['stage']}{'/' + result['representation'] if result.get('representation') else ''} of {result['scene']} of size {result['size']} took {result['baseline_ratio']:.2f}x as long as in {baseline_report['metadata'].get('commit')}")
+
+    report = {
+        'version': REPORT_VERSION,
+        'metadata': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'bpy': 'blender' if args.blender else 'fake',
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'samples': args.samples if args.blender else None,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
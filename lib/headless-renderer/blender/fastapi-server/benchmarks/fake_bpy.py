@@ -0,0 +1,673 @@
+# Recording stand-in for the parts of bpy, bmesh, and mathutils that headless-renderer-blender.py uses to build scenes, so that its
+# Python-side logic can be benchmarked on machines without Blender. Data blocks behave like Blender's as far as the script relies
+# on it (unique names, lookups, removal, sockets, material slots), and every API call is counted in FakeBlender.calls, so that
+# reports show how many data blocks, nodes, and links a scene needs. Nothing is rendered, and bulk data is only counted, not kept.
+#
+#   fake_blender = FakeBlender()
+#   fake_blender.install()  # before loading the script, see load_blender_script in benchmark_suite.py
+
+import sys
+import math
+import types
+
+from collections import Counter
+
+BLENDER_VERSION = (3, 1, 0)
+
+
+class FakeBlender:
+    def __init__(self):
+        self.calls = Counter()
+        self.bpy = None
+
+    def record(self, name, count=1):
+        self.calls[name] += count
+
+    def install(self):
+        # Replaces the modules for everything imported afterwards; reset() starts with an empty scene again
+        sys.modules['bpy'] = self.bpy = _bpy_module(self)
+        sys.modules['bmesh'] = _bmesh_module(self)
+        sys.modules['mathutils'] = _mathutils_module()
+        return self
+
+    def reset(self):
+        self.calls.clear()
+        self.bpy.data.reset()
+        self.bpy.context.reset(self.bpy.data)
+
+    def data_block_counts(self):
+        return {name: len(collection) for name, collection in self.bpy.data.collections_by_name().items()}
+
+
+# mathutils
+
+
+class Vector:
+    def __init__(self, values=(0.0, 0.0, 0.0)):
+        self._values = [float(value) for value in values]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __setitem__(self, index, value):
+        self._values[index] = float(value)
+
+    def __add__(self, other):
+        return Vector(a + b for a, b in zip(self, other))
+
+    def __sub__(self, other):
+        return Vector(a - b for a, b in zip(self, other))
+
+    def __mul__(self, other):
+        if isinstance(other, (int, float)):
+            return Vector(a * other for a in self)
+        return Vector(a * b for a, b in zip(self, other))
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Vector(-a for a in self)
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return f"Vector({tuple(self._values)})"
+
+    @property
+    def x(self):
+        return self._values[0]
+
+    @property
+    def y(self):
+        return self._values[1]
+
+    @property
+    def z(self):
+        return self._values[2]
+
+    @property
+    def length(self):
+        return math.sqrt(sum(a * a for a in self))
+
+    def normalized(self):
+        length = self.length or 1.0
+        return Vector(a / length for a in self)
+
+    def dot(self, other):
+        return sum(a * b for a, b in zip(self, other))
+
+    def cross(self, other):
+        return Vector((self[1] * other[2] - self[2] * other[1], self[2] * other[0] - self[0] * other[2], self[0] * other[1] - self[1] * other[0]))
+
+    def copy(self):
+        return Vector(self._values)
+
+
+class Matrix:
+    def __init__(self, location=None, scale=None):
+        self.location = Vector(location) if location is not None else Vector()
+        self.scale = Vector(scale) if scale is not None else Vector((1, 1, 1))
+
+    @classmethod
+    def LocRotScale(cls, location, rotation, scale):
+        return cls(location, scale)
+
+
+def _mathutils_module():
+    module = types.ModuleType('mathutils')
+    module.Vector = Vector
+    module.Matrix = Matrix
+    return module
+
+
+# bpy.data
+
+
+class ID:
+    def __init__(self, fake_blender, name):
+        self._fake_blender = fake_blender
+        self.name = name
+        self.users = 0
+
+    def as_pointer(self):
+        return id(self)
+
+
+class IDCollection:
+    def __init__(self, fake_blender, name, factory):
+        self._fake_blender = fake_blender
+        self._name = name
+        self._factory = factory
+        self._blocks = {}
+
+    def new(self, name, *args, **kwargs):
+        self._fake_blender.record(f"bpy.data.{self._name}.new")
+        block = self._factory(self._fake_blender, self.unique_name(name), *args, **kwargs)
+        self.add(block)
+        return block
+
+    def unique_name(self, name):
+        # Blender appends .001, .002, ... to names that are taken
+        if name not in self._blocks:
+            return name
+        index = 1
+        while f"{name}.{index:03d}" in self._blocks:
+            index += 1
+        return f"{name}.{index:03d}"
+
+    def add(self, block):
+        block.name = self.unique_name(block.name)
+        self._blocks[block.name] = block
+        block._collection = self
+
+    def rename(self, block, name):
+        self._blocks.pop(block.name, None)
+        block.__dict__['name'] = self.unique_name(name)
+        self._blocks[block.name] = block
+
+    def remove(self, block, **kwargs):
+        self._fake_blender.record(f"bpy.data.{self._name}.remove")
+        self._blocks.pop(block.name, None)
+
+    def get(self, name, default=None):
+        return self._blocks.get(name, default)
+
+    def __getitem__(self, name):
+        return self._blocks[name]
+
+    def __contains__(self, name):
+        return name in self._blocks
+
+    def __iter__(self):
+        return iter(list(self._blocks.values()))
+
+    def __len__(self):
+        return len(self._blocks)
+
+
+class NamedID(ID):
+    # Renaming a data block keeps its collection's index up to date, like Blender's names do
+    def __setattr__(self, name, value):
+        if name == 'name' and getattr(self, '_collection', None) is not None:
+            self._collection.rename(self, value)
+        else:
+            super().__setattr__(name, value)
+
+
+class MeshElements:
+    def __init__(self, fake_blender, name):
+        self._fake_blender = fake_blender
+        self._name = name
+        self.count = 0
+
+    def add(self, count):
+        self._fake_blender.record(f"Mesh.{self._name}.add")
+        self.count += count
+
+    def foreach_set(self, attribute, values):
+        self._fake_blender.record(f"Mesh.{self._name}.foreach_set")
+        self._fake_blender.record(f"Mesh.{self._name}.foreach_set.values", len(values))
+
+    def __len__(self):
+        return self.count
+
+
+class AttributeData:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+
+    def foreach_set(self, attribute, values):
+        self._fake_blender.record('Attribute.data.foreach_set')
+        self._fake_blender.record('Attribute.data.foreach_set.values', len(values))
+
+
+class Attribute:
+    def __init__(self, fake_blender, name, type, domain):
+        self.name = name
+        self.data_type = type
+        self.domain = domain
+        self.data = AttributeData(fake_blender)
+
+
+class Attributes:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self._attributes = {}
+
+    def new(self, name, type, domain):
+        self._fake_blender.record('Mesh.attributes.new')
+        attribute = self._attributes[name] = Attribute(self._fake_blender, name, type, domain)
+        return attribute
+
+    def get(self, name, default=None):
+        return self._attributes.get(name, default)
+
+    def __getitem__(self, name):
+        return self._attributes[name]
+
+
+class Mesh(NamedID):
+    def __init__(self, fake_blender, name):
+        super().__init__(fake_blender, name)
+        self.vertices = MeshElements(fake_blender, 'vertices')
+        self.edges = MeshElements(fake_blender, 'edges')
+        self.polygons = MeshElements(fake_blender, 'polygons')
+        self.attributes = Attributes(fake_blender)
+        self.materials = []
+
+    def from_pydata(self, vertices, edges, faces):
+        self._fake_blender.record('Mesh.from_pydata')
+        self.vertices.count += len(vertices)
+        self.edges.count += len(edges)
+        self.polygons.count += len(faces)
+
+    def update(self):
+        self._fake_blender.record('Mesh.update')
+
+    def transform(self, matrix):
+        self._fake_blender.record('Mesh.transform')
+
+
+class Camera(NamedID):
+    def __init__(self, fake_blender, name):
+        super().__init__(fake_blender, name)
+        self.angle_y = 0.0
+        self.lens_unit = 'MILLIMETERS'
+        self.sensor_fit = 'AUTO'
+
+
+class NodeSocket:
+    def __init__(self, name, type='VALUE'):
+        self.name = name
+        self.type = type
+        self.default_value = None
+
+
+class NodeSockets:
+    # Sockets are created on first access, by name or index, as the stand-in does not know every node type's sockets
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self._sockets = {}
+
+    def new(self, type, name, identifier=None):
+        self._fake_blender.record('NodeSockets.new')
+        socket = self._sockets[name] = NodeSocket(name, type)
+        return socket
+
+    def __getitem__(self, key):
+        if key not in self._sockets:
+            self._sockets[key] = NodeSocket(key)
+        return self._sockets[key]
+
+    def __len__(self):
+        return len(self._sockets)
+
+
+class Node:
+    def __init__(self, fake_blender, type, name=None):
+        self.type = type
+        self.name = name or type
+        self.inputs = NodeSockets(fake_blender)
+        self.outputs = NodeSockets(fake_blender)
+
+
+class Nodes:
+    def __init__(self, fake_blender, default_node_types):
+        self._fake_blender = fake_blender
+        self._nodes = [Node(fake_blender, type, name) for type, name in default_node_types]
+
+    def new(self, type):
+        self._fake_blender.record('NodeTree.nodes.new')
+        self._fake_blender.record(f"NodeTree.nodes.new.{type}")
+        node = Node(self._fake_blender, type)
+        self._nodes.append(node)
+        return node
+
+    def remove(self, node):
+        self._fake_blender.record('NodeTree.nodes.remove')
+        self._nodes.remove(node)
+
+    def __getitem__(self, name):
+        for node in self._nodes:
+            if node.name == name:
+                return node
+        raise KeyError(name)
+
+    def __iter__(self):
+        return iter(list(self._nodes))
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+class Links:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self._links = []
+
+    def new(self, output, input):
+        self._fake_blender.record('NodeTree.links.new')
+        self._links.append((output, input))
+        return (output, input)
+
+    def __len__(self):
+        return len(self._links)
+
+
+class NodeTree(NamedID):
+    def __init__(self, fake_blender, name, type='GeometryNodeTree', default_node_types=()):
+        super().__init__(fake_blender, name)
+        self.type = type
+        self.nodes = Nodes(fake_blender, default_node_types)
+        self.links = Links(fake_blender)
+
+
+class Material(NamedID):
+    def __init__(self, fake_blender, name):
+        super().__init__(fake_blender, name)
+        self.use_nodes = False
+        self.node_tree = NodeTree(fake_blender, name, type='ShaderNodeTree', default_node_types=[('ShaderNodeBsdfPrincipled', 'Principled BSDF'), ('ShaderNodeOutputMaterial', 'Material Output')])
+
+
+class NodesModifier:
+    def __init__(self, fake_blender, name, node_group):
+        self.name = name
+        self.type = 'NODES'
+        self.node_group = node_group
+        self._properties = {}
+
+    def __setitem__(self, key, value):
+        self._properties[key] = value
+
+    def __getitem__(self, key):
+        return self._properties[key]
+
+
+class Modifiers:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self._modifiers = []
+
+    def new(self, name, type):
+        self._fake_blender.record('Object.modifiers.new')
+        # Blender creates a node group with a Group Input and a Group Output for every new geometry nodes modifier
+        node_group = self._fake_blender.bpy.data.node_groups.new('Geometry Nodes', type='GeometryNodeTree')
+        node_group.nodes = Nodes(self._fake_blender, [('NodeGroupInput', 'Group Input'), ('NodeGroupOutput', 'Group Output')])
+        modifier = NodesModifier(self._fake_blender, name, node_group)
+        self._modifiers.append(modifier)
+        return modifier
+
+    def __iter__(self):
+        return iter(list(self._modifiers))
+
+
+class MaterialSlot:
+    def __init__(self, data_materials, index):
+        self._data_materials = data_materials
+        self._index = index
+        self.link = 'DATA'
+        self._object_material = None
+
+    @property
+    def material(self):
+        return self._object_material if self.link == 'OBJECT' else self._data_materials[self._index]
+
+    @material.setter
+    def material(self, material):
+        if self.link == 'OBJECT':
+            self._object_material = material
+        else:
+            self._data_materials[self._index] = material
+
+
+class Constraints:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+
+    def new(self, type):
+        self._fake_blender.record('Object.constraints.new')
+        return types.SimpleNamespace(type=type, target=None)
+
+
+class Object(NamedID):
+    def __init__(self, fake_blender, name, data=None):
+        super().__init__(fake_blender, name)
+        self.data = data
+        self.location = Vector()
+        self.scale = Vector((1, 1, 1))
+        self.modifiers = Modifiers(fake_blender)
+        self.constraints = Constraints(fake_blender)
+        self._material_slots = None
+
+    @property
+    def material_slots(self):
+        # One slot per material of the object's data, created once so that object-linked materials stick
+        materials = getattr(self.data, 'materials', [])
+        if self._material_slots is None or len(self._material_slots) != len(materials):
+            self._material_slots = [MaterialSlot(materials, index) for index in range(len(materials))]
+        return self._material_slots
+
+    def select_set(self, selected):
+        pass
+
+
+class CollectionObjects:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self._objects = []
+
+    def link(self, obj):
+        self._fake_blender.record('Collection.objects.link')
+        self._objects.append(obj)
+
+    def __len__(self):
+        return len(self._objects)
+
+
+class Collection(NamedID):
+    def __init__(self, fake_blender, name):
+        super().__init__(fake_blender, name)
+        self.objects = CollectionObjects(fake_blender)
+
+
+class Image(NamedID):
+    def save_render(self, filepath, scene=None):
+        self._fake_blender.record('Image.save_render')
+
+
+class BlendData:
+    COLLECTION_NAMES = ['objects', 'meshes', 'materials', 'node_groups', 'cameras', 'curves', 'collections', 'images', 'scenes']
+
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self.reset()
+
+    def reset(self):
+        fake_blender = self._fake_blender
+        self.objects = IDCollection(fake_blender, 'objects', Object)
+        self.meshes = IDCollection(fake_blender, 'meshes', Mesh)
+        self.materials = IDCollection(fake_blender, 'materials', Material)
+        self.node_groups = IDCollection(fake_blender, 'node_groups', NodeTree)
+        self.cameras = IDCollection(fake_blender, 'cameras', Camera)
+        self.curves = IDCollection(fake_blender, 'curves', NamedID)
+        self.collections = IDCollection(fake_blender, 'collections', Collection)
+        self.images = IDCollection(fake_blender, 'images', Image)
+        self.scenes = IDCollection(fake_blender, 'scenes', Scene)
+        # Like the default scene that the server loads, see BLENDER_SCENE_FILE
+        self.scenes.add(Scene(fake_blender, 'Scene'))
+        self.collections.add(Collection(fake_blender, 'Foreground'))
+        self.images.add(Image(fake_blender, 'Render Result'))
+
+    def collections_by_name(self):
+        return {name: getattr(self, name) for name in self.COLLECTION_NAMES}
+
+
+# bpy.context and bpy.ops
+
+
+class Scene(NamedID):
+    def __init__(self, fake_blender, name):
+        super().__init__(fake_blender, name)
+        self.camera = None
+        self.collection = Collection(fake_blender, 'Scene Collection')
+        self.render = types.SimpleNamespace(
+            engine='CYCLES', resolution_x=1920, resolution_y=1080, resolution_percentage=100, threads_mode='AUTO', threads=1,
+            use_border=False, use_crop_to_border=False, border_min_x=0.0, border_max_x=1.0, border_min_y=0.0, border_max_y=1.0,
+            image_settings=types.SimpleNamespace(file_format='PNG', color_mode='RGBA'),
+        )
+        self.cycles = types.SimpleNamespace(device='CPU', samples=2, use_denoising=False)
+
+    def frame_set(self, frame):
+        pass
+
+
+class Context:
+    def __init__(self, fake_blender, data):
+        self._fake_blender = fake_blender
+        self.reset(data)
+
+    def reset(self, data):
+        self.scene = data.scenes['Scene']
+        self.collection = self.scene.collection
+        self.active_object = None
+        self.selected_objects = []
+        self.view_layer = types.SimpleNamespace(objects=types.SimpleNamespace(active=None))
+        cycles_preferences = types.SimpleNamespace(compute_device_type='NONE', devices=[], get_devices=lambda: None, get_devices_for_type=lambda device_type: [])
+        self.preferences = types.SimpleNamespace(addons={'cycles': types.SimpleNamespace(preferences=cycles_preferences)})
+
+    @property
+    def object(self):
+        return self.active_object
+
+    def evaluated_depsgraph_get(self):
+        self._fake_blender.record('bpy.context.evaluated_depsgraph_get')
+        return types.SimpleNamespace(update=lambda: self._fake_blender.record('Depsgraph.update'))
+
+
+class Operators:
+    # Operators that create objects add them to the context's collection and make them active, like Blender's do
+    def __init__(self, fake_blender, bpy):
+        self._fake_blender = fake_blender
+        self._bpy = bpy
+        self.mesh = types.SimpleNamespace(primitive_cube_add=self._primitive_cube_add, primitive_ico_sphere_add=self._primitive_ico_sphere_add)
+        self.object = types.SimpleNamespace(empty_add=self._empty_add, camera_add=self._camera_add)
+        self.collection = types.SimpleNamespace(objects_remove_all=self._record('bpy.ops.collection.objects_remove_all'))
+        self.render = types.SimpleNamespace(render=self._record('bpy.ops.render.render'))
+        self.wm = types.SimpleNamespace(save_as_mainfile=self._record('bpy.ops.wm.save_as_mainfile'))
+
+    def _record(self, name):
+        return lambda *args, **kwargs: self._fake_blender.record(name)
+
+    def _add_object(self, operator, name, data=None, location=None):
+        self._fake_blender.record(f"bpy.ops.{operator}")
+        obj = self._bpy.data.objects.new(name, data)
+        if location is not None:
+            obj.location = Vector(location)
+        self._bpy.context.collection.objects.link(obj)
+        self._bpy.context.active_object = obj
+        return obj
+
+    def _primitive_cube_add(self, size=2.0, scale=(1, 1, 1), location=None, **kwargs):
+        mesh = self._bpy.data.meshes.new('Cube')
+        mesh.from_pydata([(0, 0, 0)] * 8, [], [(0, 1, 2, 3)] * 6)
+        obj = self._add_object('mesh.primitive_cube_add', 'Cube', mesh, location)
+        obj.scale = Vector(scale)
+
+    def _primitive_ico_sphere_add(self, subdivisions=2, radius=1.0, location=None, **kwargs):
+        mesh = self._bpy.data.meshes.new('Icosphere')
+        mesh.from_pydata([(0, 0, 0)] * 42, [], [(0, 1, 2)] * 80)
+        self._add_object('mesh.primitive_ico_sphere_add', 'Icosphere', mesh, location)
+
+    def _empty_add(self, type='PLAIN_AXES', location=None, **kwargs):
+        self._add_object('object.empty_add', 'Empty', None, location)
+
+    def _camera_add(self, location=None, **kwargs):
+        self._add_object('object.camera_add', 'Camera', self._bpy.data.cameras.new('Camera'), location)
+
+
+class Types:
+    # bpy.types: the classes that the script checks with isinstance(), and placeholders for those it only uses in annotations
+    Mesh = Mesh
+    Camera = Camera
+    Object = Object
+    Material = Material
+
+    def __getattr__(self, name):
+        placeholder = type(name, (), {})
+        setattr(self, name, placeholder)
+        return placeholder
+
+
+def _bpy_module(fake_blender):
+    bpy = types.ModuleType('bpy')
+    fake_blender.bpy = bpy
+    bpy.app = types.SimpleNamespace(version=BLENDER_VERSION, version_string='.'.join(map(str, BLENDER_VERSION)) + ' (fake)', handlers=types.SimpleNamespace(render_stats=[]))
+    bpy.types = Types()
+    bpy.data = BlendData(fake_blender)
+    bpy.context = Context(fake_blender, bpy.data)
+    bpy.ops = Operators(fake_blender, bpy)
+    return bpy
+
+
+# bmesh
+
+
+class BMLayers:
+    def __init__(self):
+        self._layers = {}
+
+    def new(self, name):
+        self._layers[name] = name
+        return name
+
+    def __getitem__(self, name):
+        return self._layers[name]
+
+
+class BMVert(dict):
+    pass
+
+
+class BMVerts:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self._verts = []
+        self.layers = types.SimpleNamespace(float=BMLayers())
+
+    def ensure_lookup_table(self):
+        pass
+
+    def __getitem__(self, index):
+        return self._verts[index]
+
+    def __len__(self):
+        return len(self._verts)
+
+
+class BMesh:
+    def __init__(self, fake_blender):
+        self._fake_blender = fake_blender
+        self.verts = BMVerts(fake_blender)
+
+    def from_mesh(self, mesh):
+        self._fake_blender.record('BMesh.from_mesh')
+        self.verts._verts = [BMVert() for _ in range(len(mesh.vertices))]
+
+    def to_mesh(self, mesh):
+        self._fake_blender.record('BMesh.to_mesh')
+
+
+def _bmesh_module(fake_blender):
+    module = types.ModuleType('bmesh')
+    module.new = lambda: BMesh(fake_blender)
+    return module
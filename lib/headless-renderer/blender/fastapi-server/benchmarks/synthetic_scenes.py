@@ -0,0 +1,155 @@
+# Synthetic scene_elements in the shape that App.tsx sends: datacubes as cuboids, and point and line primitives, whose points
+# are an idBufferOnly cuboid's points (see getHighQualityRendering in App.tsx and PointData in DatacanvasApplication.ts).
+
+import math
+import random
+
+# Default camera and canvas of the Blender script, see render_job in headless-renderer-blender.py
+CAMERA = {
+    'camera_eye': [2.2737033367156982, 2.015049934387207, 3.845113515853882],
+    'camera_center': [0, 0.5, 0],
+    'camera_fov_y_degrees': 45,
+    'width': 2560,
+    'height': 379,
+}
+
+# Datacubes are laid out on a grid of this spacing, as in the editor's canvas
+GRID_SPACING = 0.75
+
+
+def grid_position(index):
+    columns = 8
+    return {'0': (index % columns) * GRID_SPACING, '1': (index // columns) * GRID_SPACING}
+
+
+def cuboid(index, generator, type='dataset'):
+    height = generator.uniform(0.1, 1)
+    return {
+        'id': 4294967295 - index,
+        'type': type,
+        'colorRGB': [generator.random(), generator.random(), generator.random()],
+        'translateXZ': grid_position(index),
+        'translateY': height * 0.5,
+        'scaleY': height,
+        'extent': None,
+        'idBufferOnly': False,
+        'points': None,
+    }
+
+
+def random_points(count, generator):
+    return [
+        {
+            'x': generator.uniform(0.01, 1),
+            'y': generator.uniform(0.01, 1),
+            'z': generator.uniform(0.01, 1),
+            'r': generator.random(),
+            'g': generator.random(),
+            'b': generator.random(),
+            'size': generator.uniform(0.5, 2),
+            'index': index,
+        }
+        for index in range(count)
+    ]
+
+
+def value_points(count, generator):
+    # Points with a scalar value for a colormap instead of a color, see scene_colormaps.py
+    return [
+        {
+            'x': generator.uniform(0.01, 1),
+            'y': generator.uniform(0.01, 1),
+            'z': generator.uniform(0.01, 1),
+            'value': generator.random(),
+            'size': generator.uniform(0.5, 2),
+            'index': index,
+        }
+        for index in range(count)
+    ]
+
+
+def line_points(count, generator):
+    # A random walk, like a time series drawn as line
+    points = []
+    x, y, z = 0.5, 0.5, 0.5
+    for index in range(count):
+        x = min(1.0, max(0.01, x + generator.gauss(0, 0.01)))
+        y = min(1.0, max(0.01, y + generator.gauss(0, 0.01)))
+        z = min(1.0, max(0.01, z + generator.gauss(0, 0.01)))
+        points.append({'x': x, 'y': y, 'z': z, 'r': x, 'g': y, 'b': z, 'size': 1.0, 'index': index})
+    return points
+
+
+def primitive(index, type, points, generator):
+    # Point and line primitives render their points only, in the extent of the datacube they belong to
+    scene_element = cuboid(index, generator, type=type)
+    scene_element.update({
+        'colorRGB': None,
+        'translateY': 0.5,
+        'scaleY': 1.0,
+        'extent': {'minX': -0.5, 'maxX': 0.5, 'minZ': -0.5, 'maxZ': 0.5},
+        'idBufferOnly': True,
+        'points': points,
+    })
+    return scene_element
+
+
+def cuboid_scene(point_count, generator):
+    # Cuboids have no points, the size is their number instead -- capped, as the editor never shows more datacubes
+    return [cuboid(index, generator) for index in range(max(1, min(point_count, 10_000)))]
+
+
+def point_scene(point_count, generator):
+    return [primitive(0, 'point-primitive', random_points(point_count, generator), generator)]
+
+
+def colormapped_point_scene(point_count, generator):
+    scene_element = primitive(0, 'point-primitive', value_points(point_count, generator), generator)
+    scene_element['colormap'] = {'preset': 'smithwalt', 'identifier': 'viridis'}
+    return [scene_element]
+
+
+def line_scene(point_count, generator):
+    return [primitive(0, 'line-primitive', line_points(point_count, generator), generator)]
+
+
+def mixed_scene(point_count, generator):
+    # A few datasets, and the points split between point primitives and line primitives, as an editor session might have them
+    scene_elements = [cuboid(index, generator) for index in range(8)]
+    primitive_count = max(1, min(8, point_count // 10))
+    for primitive_index in range(primitive_count):
+        count = point_count // primitive_count + (1 if primitive_index < point_count % primitive_count else 0)
+        if primitive_index % 2 == 0:
+            scene_elements.append(primitive(8 + primitive_index, 'point-primitive', random_points(count, generator), generator))
+        else:
+            scene_elements.append(primitive(8 + primitive_index, 'line-primitive', line_points(count, generator), generator))
+    return scene_elements
+
+
+# Scenes by kind, each a function of the number of points and a random generator
+SCENE_GENERATORS = {
+    'cuboids': cuboid_scene,
+    'points': point_scene,
+    'colormapped-points': colormapped_point_scene,
+    'lines': line_scene,
+    'mixed': mixed_scene,
+}
+SCENE_KINDS = list(SCENE_GENERATORS)
+
+
+def synthetic_scene_elements(kind, point_count, seed=0):
+    return SCENE_GENERATORS[kind](point_count, random.Random(seed))
+
+
+def synthetic_configuration(kind, point_count, seed=0):
+    # Body of a POST /renderings/ request
+    return dict(CAMERA, scene_elements=synthetic_scene_elements(kind, point_count, seed=seed))
+
+
+def scene_point_count(scene_elements):
+    return sum(len(scene_element['points']) for scene_element in scene_elements if scene_element.get('points'))
+
+
+def log_sizes(minimum=10, maximum=1_000_000):
+    # 10, 100, ..., maximum
+    return [10 ** exponent for exponent in range(int(math.log10(minimum)), int(math.log10(maximum)) + 1)]
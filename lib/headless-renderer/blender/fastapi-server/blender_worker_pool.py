@@ -0,0 +1,353 @@
+import os
+import json
+import socket
+import subprocess
+import threading
+import queue
+import logging
+
+from multiprocessing.connection import Connection
+from time import perf_counter, monotonic
+
+from render_backend import CpuCoresUnavailable, render_backend
+
+
+BLENDER_SCENE_FILE = "blender_3.0.1_default-scene.blend"
+BLENDER_SCRIPT_FILE = "headless-renderer-blender.py"
+
+# 'default' starts Blender with the user's preferences and add-ons and BLENDER_SCENE_FILE, 'fast' with factory settings, Cycles as
+# only add-on besides Blender's built-in ones, and the minimal template scene that create-fast-start-scene.py derives from it
+BLENDER_STARTUP_PROFILES = ['default', 'fast']
+BLENDER_FAST_START_SCENE_FILE = "blender_fast-start-scene.blend"
+BLENDER_FAST_START_SCRIPT_FILE = "create-fast-start-scene.py"
+
+
+def blender_startup_profile():
+    profile = os.environ.get('BLENDER_STARTUP_PROFILE', 'default').lower()
+    if profile not in BLENDER_STARTUP_PROFILES:
+        raise ValueError(f"Unknown Blender startup profile {profile}, expected one of {BLENDER_STARTUP_PROFILES}")
+    return profile
+
+
+def blender_executable():
+    return os.environ.get('BLENDER_PATH', '') + "blender"
+
+
+def blender_args(script_args, threads=None):
+    fast_start = blender_startup_profile() == 'fast'
+    return [
+        blender_executable(),
+        "--background",
+        *(["--factory-startup"] if fast_start else []),
+        # Rendering threads on the CPU backend, by default as many as there are cores
+        *(["--threads", f"{threads}"] if threads else []),
+        "--addons", "cycles",
+        # "--python-use-system-env",
+        "--python-exit-code", "1",
+        "--log-level", "1",
+        # "--debug-python",
+        BLENDER_FAST_START_SCENE_FILE if fast_start else BLENDER_SCENE_FILE,
+        "--python", BLENDER_SCRIPT_FILE,
+        "--",
+        "--cycles-device", render_backend(),
+        *script_args,
+    ]
+
+
+def blender_env():
+    env = os.environ.copy()
+    blender_python_path = os.environ.get('BLENDER_PYTHON_PATH', '')
+    if blender_python_path:
+        env['PYTHONPATH'] = blender_python_path
+    # Cycles' compiled kernels (in XDG_CACHE_HOME/cycles), the CUDA driver's JIT cache, and OptiX' module cache, kept in one
+    # directory that outlives the Blender processes and, as volume, the container, so that only the first rendering compiles them
+    cache_directory = os.environ.get('BLENDER_CACHE_DIRECTORY', './blender-cache')
+    if cache_directory:
+        cache_directory = os.path.abspath(cache_directory)
+        env['XDG_CACHE_HOME'] = cache_directory
+        env['CUDA_CACHE_PATH'] = os.path.join(cache_directory, 'nvidia', 'ComputeCache')
+        env.setdefault('CUDA_CACHE_MAXSIZE', f"{4 * 2 ** 30}")
+        env['OPTIX_CACHE_PATH'] = os.path.join(cache_directory, 'optix')
+    return env
+
+
+def create_fast_start_scene_file(timeout=300):
+    # Blocks until Blender wrote BLENDER_FAST_START_SCENE_FILE, once per deployment (see the Dockerfile) or on the server's startup
+    t_start = perf_counter()
+    subprocess.run(
+        [
+            blender_executable(), "--background", "--factory-startup", BLENDER_SCENE_FILE,
+            "--python-exit-code", "1",
+            "--python", BLENDER_FAST_START_SCRIPT_FILE,
+            "--", "--output", BLENDER_FAST_START_SCENE_FILE,
+        ],
+        env=blender_env(),
+        stdout=subprocess.DEVNULL,
+        timeout=timeout,
+        check=True,
+    )
+    logging.info(f"Creating {BLENDER_FAST_START_SCENE_FILE} from {BLENDER_SCENE_FILE} took {perf_counter() - t_start:.2f}s")
+
+
+class BlenderWorkerError(Exception):
+    pass
+
+
+class BlenderWorkerCancelled(BlenderWorkerError):
+    pass
+
+
+class BlenderWorkerUnavailable(BlenderWorkerError):
+    pass
+
+
+class BlenderWorker:
+    def __init__(self, index, cpu_scheduler=None):
+        self.index = index
+        # Rendering on the CPU, the worker holds a slot of the scheduler's cores while it runs
+        self.cpu_scheduler = cpu_scheduler
+        self.cores = None
+        self.process = None
+        self.connection = None
+        self.jobs_done = 0
+        self.started_at = None
+        self.startup_seconds = None
+        # The pool's shutdown kills workers that other threads render on or restart
+        self._kill_lock = threading.Lock()
+
+    def start(self, startup_timeout):
+        if self.cpu_scheduler is not None and self.cores is None:
+            try:
+                self.cores = self.cpu_scheduler.acquire(startup_timeout)
+            except CpuCoresUnavailable as error:
+                raise BlenderWorkerError(f"Worker {self.index} cannot start: {error}")
+
+        server_socket, worker_socket = socket.socketpair()
+        try:
+            self.process = subprocess.Popen(
+                (self.cpu_scheduler.command_prefix(self.cores) if self.cpu_scheduler is not None else [])
+                + blender_args(["--datacanvas-worker-fd", f"{worker_socket.fileno()}"], threads=len(self.cores) if self.cores else None),
+                env=blender_env(),
+                pass_fds=(worker_socket.fileno(),),
+                stdout=subprocess.DEVNULL,
+            )
+        finally:
+            worker_socket.close()
+        self.connection = Connection(server_socket.detach())
+        self.jobs_done = 0
+        self.started_at = monotonic()
+
+        message = self._receive(startup_timeout)
+        if message['type'] != 'ready':
+            raise BlenderWorkerError(f"Worker {self.index} sent {message['type']} instead of ready")
+
+        self.startup_seconds = monotonic() - self.started_at
+        logging.info(f"Blender worker {self.index} (pid {self.process.pid}) is ready after {self.startup_seconds:.2f}s")
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def ping(self, timeout):
+        try:
+            self._send({'type': 'ping'})
+            return self._receive(timeout)['type'] == 'pong'
+        except (BlenderWorkerError, OSError, EOFError):
+            return False
+
+    def render(self, job, timeout, on_event=None, cancel_event=None, poll_interval=0.25):
+        self._send({'type': 'render', 'job': job})
+        deadline = monotonic() + timeout
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise BlenderWorkerCancelled(f"Rendering job {job['file_uuid']} on worker {self.index} was cancelled")
+            message = self._receive(min(poll_interval, max(deadline - monotonic(), 0)), raise_on_timeout=monotonic() >= deadline)
+            if message is None:
+                continue
+            if message['type'] != 'event':
+                break
+            if on_event:
+                on_event(message['event'])
+        self.jobs_done += 1
+        if message['type'] != 'result':
+            raise BlenderWorkerError(f"Worker {self.index} sent {message['type']} instead of a result")
+        if message['status'] != 'ok':
+            raise BlenderWorkerError(f"Worker {self.index} failed to render: {message.get('error')}")
+        return message
+
+    def stop(self, timeout=10):
+        if self.is_alive():
+            try:
+                self._send({'type': 'shutdown'})
+                self.process.wait(timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+    def kill(self):
+        with self._kill_lock:
+            if self.process is not None and self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+            if self.cores is not None:
+                self.cpu_scheduler.release(self.cores)
+                self.cores = None
+
+    def _send(self, message):
+        if self.connection is None:
+            raise BlenderWorkerError(f"Worker {self.index} is not running")
+        self.connection.send_bytes(json.dumps(message).encode('utf-8'))
+
+    def _receive(self, timeout, raise_on_timeout=True):
+        if self.connection is None:
+            raise BlenderWorkerError(f"Worker {self.index} is not running")
+        if not self.connection.poll(timeout):
+            if raise_on_timeout:
+                raise BlenderWorkerError(f"Worker {self.index} did not answer in time")
+            return None
+        return json.loads(self.connection.recv_bytes().decode('utf-8'))
+
+
+class BlenderWorkerPool:
+    def __init__(self, size, max_jobs_per_worker=100, startup_timeout=120, render_timeout=600, acquire_timeout=600, health_check_interval=30, health_check_timeout=10, on_worker_started=None, cpu_scheduler=None):
+        self.size = size
+        self.cpu_scheduler = cpu_scheduler
+        # Called with each worker that (re)started, from the thread that started it
+        self.on_worker_started = on_worker_started
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.startup_timeout = startup_timeout
+        self.render_timeout = render_timeout
+        # Jobs wait this long for an idle worker, e.g., while all workers restart
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+
+        self._idle_workers = queue.Queue()
+        # All workers of the pool, whether idle, busy, or restarting, and the threads that restart them, which shutdown stops
+        self._workers = []
+        self._restart_threads = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._health_check_thread = None
+
+    def start(self):
+        self._workers = [BlenderWorker(index, cpu_scheduler=self.cpu_scheduler) for index in range(self.size)]
+        for worker in self._workers:
+            self._replace_worker(worker, in_background=True)
+        self._health_check_thread = threading.Thread(target=self._health_check_loop, daemon=True)
+        self._health_check_thread.start()
+
+    def shutdown(self, timeout=10):
+        self._stopped.set()
+        deadline = monotonic() + timeout
+        # Idle workers shut down, busy and starting ones are killed, which fails their jobs
+        while True:
+            try:
+                self._idle_workers.get_nowait().stop(max(deadline - monotonic(), 0))
+            except queue.Empty:
+                break
+        for worker in self._workers:
+            worker.kill()
+        with self._lock:
+            restart_threads = list(self._restart_threads)
+        for thread in restart_threads:
+            thread.join(max(deadline - monotonic(), 0))
+        # Workers that a restart started in the meantime; restarts that are still starting one kill it once it is ready
+        for worker in self._workers:
+            worker.kill()
+
+    def acquire(self, job, timeout, cancel_event=None, poll_interval=0.25):
+        deadline = monotonic() + timeout
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise BlenderWorkerCancelled(f"Rendering job {job['file_uuid']} was cancelled while waiting for a worker")
+            try:
+                return self._idle_workers.get(timeout=min(poll_interval, max(deadline - monotonic(), 0)))
+            except queue.Empty:
+                if monotonic() >= deadline:
+                    raise BlenderWorkerUnavailable(f"No Blender worker became available within {timeout}s")
+
+    def render(self, job, acquire_timeout=None, on_event=None, cancel_event=None):
+        worker = self.acquire(job, acquire_timeout if acquire_timeout is not None else self.acquire_timeout, cancel_event=cancel_event)
+
+        try:
+            t_render_start = perf_counter()
+            result = worker.render(job, self.render_timeout, on_event=on_event, cancel_event=cancel_event)
+            logging.info(f"Blender worker {worker.index} rendered job {job['file_uuid']} in {perf_counter() - t_render_start:.2f}s")
+        except BlenderWorkerCancelled:
+            # Killing the worker is the only way to stop Cycles and free the GPU right away
+            logging.info(f"Killing Blender worker {worker.index} to cancel job {job['file_uuid']}")
+            worker.kill()
+            self._replace_worker(worker, in_background=True)
+            raise
+        except BlenderWorkerError:
+            # A failed render leaves the worker's scene in an unknown state -- recycle it, unless it is healthy
+            if not worker.ping(self.health_check_timeout):
+                self._replace_worker(worker, in_background=True)
+                raise
+            self._release_worker(worker)
+            raise
+        except (OSError, EOFError) as error:
+            exit_code = worker.process.poll()
+            logging.warning(f"Blender worker {worker.index} crashed while rendering job {job['file_uuid']} (exit code {exit_code}): {error!r}")
+            self._replace_worker(worker, in_background=True)
+            raise BlenderWorkerError(f"Worker {worker.index} crashed with exit code {exit_code}")
+
+        self._release_worker(worker)
+        return result
+
+    def _release_worker(self, worker):
+        if worker.jobs_done >= self.max_jobs_per_worker:
+            logging.info(f"Recycling Blender worker {worker.index} after {worker.jobs_done} jobs")
+            self._replace_worker(worker, in_background=True)
+        else:
+            self._idle_workers.put(worker)
+
+    def _replace_worker(self, worker, in_background=False):
+        def restart():
+            try:
+                worker.stop()
+                while not self._stopped.is_set():
+                    try:
+                        worker.start(self.startup_timeout)
+                    except (BlenderWorkerError, OSError, EOFError) as error:
+                        logging.error(f"Starting Blender worker {worker.index} failed: {error}")
+                        worker.kill()
+                        self._stopped.wait(self.health_check_interval)
+                        continue
+                    if self._stopped.is_set():
+                        worker.kill()
+                        return
+                    if self.on_worker_started:
+                        self.on_worker_started(worker)
+                    self._idle_workers.put(worker)
+                    return
+            finally:
+                with self._lock:
+                    self._restart_threads.discard(threading.current_thread())
+
+        if in_background:
+            thread = threading.Thread(target=restart, daemon=True)
+            with self._lock:
+                self._restart_threads.add(thread)
+            thread.start()
+        else:
+            with self._lock:
+                self._restart_threads.add(threading.current_thread())
+            restart()
+
+    def _health_check_loop(self):
+        while not self._stopped.wait(self.health_check_interval):
+            # Only idle workers are checked, busy ones are supervised by their render timeout
+            for _ in range(self._idle_workers.qsize()):
+                try:
+                    worker = self._idle_workers.get_nowait()
+                except queue.Empty:
+                    break
+                if worker.is_alive() and worker.ping(self.health_check_timeout):
+                    self._idle_workers.put(worker)
+                else:
+                    logging.warning(f"Blender worker {worker.index} failed its health check, restarting it")
+                    self._replace_worker(worker, in_background=True)
@@ -0,0 +1,63 @@
+# Derives the template scene of BLENDER_STARTUP_PROFILE=fast from the default scene: its first scene with the render settings and
+# world, the lights, and the Foreground collection that headless-renderer-blender.py links scene elements to. Other objects,
+# collections, and scenes are removed, and with them the meshes, materials, and images that only they used, and the file is saved
+# uncompressed, so that Blender loads less and does not decompress it on every start.
+#
+# Run from the fastapi-server directory (the server runs it on startup if the file is missing):
+#   blender --background --factory-startup blender_3.0.1_default-scene.blend --python create-fast-start-scene.py -- [--output blender_fast-start-scene.blend]
+
+import os
+import sys
+import argparse
+
+import bpy
+
+# See add_scene_element in headless-renderer-blender.py
+FOREGROUND_COLLECTION_NAME = 'Foreground'
+
+
+def data_block_counts():
+    return {name: len(getattr(bpy.data, name)) for name in ['scenes', 'objects', 'collections', 'meshes', 'materials', 'images', 'node_groups', 'lights', 'worlds']}
+
+
+def strip_scene():
+    scene = bpy.context.scene
+    for other_scene in list(bpy.data.scenes):
+        if other_scene != scene:
+            bpy.data.scenes.remove(other_scene)
+
+    # The script adds its own camera
+    for obj in list(bpy.data.objects):
+        if obj.type != 'LIGHT':
+            bpy.data.objects.remove(obj)
+
+    foreground_collection = bpy.data.collections.get(FOREGROUND_COLLECTION_NAME)
+    if foreground_collection is None:
+        foreground_collection = bpy.data.collections.new(FOREGROUND_COLLECTION_NAME)
+        scene.collection.children.link(foreground_collection)
+    for collection in list(bpy.data.collections):
+        if collection != foreground_collection and not collection.all_objects:
+            bpy.data.collections.remove(collection)
+
+    # Data blocks that only the removed objects used
+    bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog='create-fast-start-scene.py')
+    parser.add_argument('--output', default='blender_fast-start-scene.blend')
+    args = parser.parse_args(argv)
+
+    counts_before = data_block_counts()
+    strip_scene()
+    counts_after = data_block_counts()
+    for name in counts_before:
+        print(f"{name}: {counts_before[name]} -> {counts_after[name]}")
+
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(args.output), compress=False)
+    print(f"Saved the fast-start scene as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
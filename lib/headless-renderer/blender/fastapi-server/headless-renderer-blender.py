@@ -6,12 +6,26 @@ import bpy
 import bmesh
 from datetime import datetime
 
-from time import perf_counter
+from time import perf_counter, time
 import logging
+import cProfile
 
 import mathutils
 import json
 import math
+import hashlib
+import re
+import threading
+
+# Makes the modules next to this script importable from within Blender
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from scene_arrays import POINT_FIELDS, point_fields, points_to_columns, valid_point_mask, webgl_to_blender_positions, srgb_to_linear, line_edges
+from scene_colormaps import apply_colormap
+from scene_payload import is_scene_payload, read_scene_payload
+from scene_decimation import CameraProjection, apply_level_of_detail, take_columns
+
+import numpy as np
 
 def install_dependency(package_name): 
     # see: https://blender.stackexchange.com/a/219920
@@ -30,6 +44,41 @@ def install_dependency(package_name):
     if package_name:
         subprocess.call([python_bin, "-m", "pip", "install", package_name])
 
+# Prefix of stdout lines that carry progress events of one-shot renders to the server
+EVENT_LINE_PREFIX = 'DATACANVAS-EVENT '
+
+event_lock = threading.Lock()
+
+
+def print_event(event):
+    print(f"{EVENT_LINE_PREFIX}{json.dumps(event)}", flush=True)
+
+
+# Replaced by the worker loop, which sends events over its connection instead
+event_sink = print_event
+
+
+def emit_event(event):
+    with event_lock:
+        event_sink(event)
+
+
+# Wall-clock time at which Blender started running this script, the server derives Blender's startup time from it
+SCRIPT_STARTED_AT = time()
+
+# Set by on_render_stats once Cycles starts sampling, i.e., once it synchronized the scene and built the BVH
+render_stats_state = {'first_sample_at': None}
+
+
+def on_render_stats(stats):
+    # Cycles reports e.g. "Fra:1 Mem:12.34M (Peak 15.67M) | Time:00:00.12 | Mem:0.50M, Peak:0.50M | Scene, ViewLayer | Sample 1/2"
+    match = re.search(r'Sample (\d+)/(\d+)', stats)
+    if match:
+        if render_stats_state['first_sample_at'] is None:
+            render_stats_state['first_sample_at'] = perf_counter()
+        emit_event({'type': 'progress', 'stage': 'render', 'progress': int(match.group(1)) / max(int(match.group(2)), 1)})
+
+
 def vec3_transform_webgl_to_blender(vec3: mathutils.Vector):
     x = vec3[0]
     y = -vec3[2]
@@ -55,14 +104,140 @@ def add_camera(scene, eye, center, fovy_degrees):
     constraint.target = center_empty
 
     scene.camera = camera_object
-    return
+    return [center_empty.name, camera_object.name]
+
+
+# Names of the data blocks that scene elements share, by what they are shared for. They are looked up by name, as workers and
+# sessions remove data blocks once no scene element uses them anymore, after which they are created again.
+shared_data_block_names = {}
+
+
+def find_shared_data_block(data_collection, key):
+    name = shared_data_block_names.get(key)
+    return data_collection.get(name) if name is not None else None
+
+
+def get_shared_data_block(data_collection, key, create):
+    data_block = find_shared_data_block(data_collection, key)
+    if data_block is None:
+        data_block = create()
+        shared_data_block_names[key] = data_block.name
+    return data_block
+
 
+def create_point_material(name, representation):
+    # Colors are point attributes, so all point and line primitives of a representation share one material
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+
+    attrib_node_color_r: bpy.types.ShaderNodeAttribute = mat.node_tree.nodes.new(type='ShaderNodeAttribute')
+    attrib_node_color_r.attribute_type = 'GEOMETRY'
+    attrib_node_color_r.attribute_name = 'color-r'
+    attrib_node_color_g: bpy.types.ShaderNodeAttribute = mat.node_tree.nodes.new(type='ShaderNodeAttribute')
+    attrib_node_color_g.attribute_type = 'GEOMETRY'
+    attrib_node_color_g.attribute_name = 'color-g'
+    attrib_node_color_b: bpy.types.ShaderNodeAttribute = mat.node_tree.nodes.new(type='ShaderNodeAttribute')
+    attrib_node_color_b.attribute_type = 'GEOMETRY'
+    attrib_node_color_b.attribute_name = 'color-b'
+
+    combine_rgb_node: bpy.types.ShaderNodeCombineRGB = mat.node_tree.nodes.new(type='ShaderNodeCombineRGB')
+
+    principled_bsdf_node = mat.node_tree.nodes['Principled BSDF']
+
+    mat.node_tree.links.new(attrib_node_color_r.outputs['Fac'], combine_rgb_node.inputs['R'])
+    mat.node_tree.links.new(attrib_node_color_g.outputs['Fac'], combine_rgb_node.inputs['G'])
+    mat.node_tree.links.new(attrib_node_color_b.outputs['Fac'], combine_rgb_node.inputs['B'])
+
+    if representation == 'instanced':
+        # Instances carry the colors as instance attributes, which only the instancer lookup finds, while line tubes are
+        # real geometry -- both lookups are added up, as a missing attribute reads as 0
+        for attrib_node, channel in [(attrib_node_color_r, 'R'), (attrib_node_color_g, 'G'), (attrib_node_color_b, 'B')]:
+            instancer_attrib_node: bpy.types.ShaderNodeAttribute = mat.node_tree.nodes.new(type='ShaderNodeAttribute')
+            instancer_attrib_node.attribute_type = 'INSTANCER'
+            instancer_attrib_node.attribute_name = attrib_node.attribute_name
+            add_node: bpy.types.ShaderNodeMath = mat.node_tree.nodes.new(type='ShaderNodeMath')
+            add_node.operation = 'ADD'
+            mat.node_tree.links.new(attrib_node.outputs['Fac'], add_node.inputs[0])
+            mat.node_tree.links.new(instancer_attrib_node.outputs['Fac'], add_node.inputs[1])
+            mat.node_tree.links.new(add_node.outputs['Value'], combine_rgb_node.inputs[channel])
+
+    mat.node_tree.links.new(combine_rgb_node.outputs['Image'], principled_bsdf_node.inputs['Base Color'])
 
-def add_scene_element(scene, scene_element):
-    # Deselect all scene elements
+    # TODO: Auto-arrange nodes based on Blender's Node Arrange plug-in
+    # TODO: see https://docs.blender.org/manual/en/latest/addons/node/node_arrange.html
+    return mat
+
+
+def create_cuboid_material(name, color_rgb):
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+    principled_bsdf_node = mat.node_tree.nodes['Principled BSDF']
+    if color_rgb:
+        # Convert to Gamma-corrected sRGB
+        color_rgb = [
+            pow(color_rgb[0], 2.2),
+            pow(color_rgb[1], 2.2),
+            pow(color_rgb[2], 2.2)
+        ]
+        principled_bsdf_node.inputs['Base Color'].default_value = (color_rgb[0], color_rgb[1], color_rgb[2], 1)
+    return mat
+
+
+def create_cuboid_mesh(name):
+    # Same cube as bpy.ops.mesh.primitive_cube_add(size=0.5), with one material slot that each cuboid object links its own material to
+    mesh = bpy.data.meshes.new(name)
+    vertices = [(x, y, z) for x in (-0.25, 0.25) for y in (-0.25, 0.25) for z in (-0.25, 0.25)]
+    faces = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    mesh.from_pydata(vertices, [], faces)
+    mesh.update()
+    mesh.materials.append(None)
+    return mesh
+
+
+def add_cuboid(scene, id, color_rgb, scale_blender, extent_scale_blender, translate_blender):
+    # All cuboids are objects of a single cube mesh, which Cycles instances, scaled by the object instead of the mesh; they are
+    # created through the data API, as operators go through the context and undo system, whose overhead grows with the scene
+    cube_mesh = get_shared_data_block(bpy.data.meshes, ('cuboid-mesh',), lambda: create_cuboid_mesh("Cuboid"))
+    obj = bpy.data.objects.new(f"Cuboid_{id}", cube_mesh)
+    obj.scale = scale_blender if extent_scale_blender is None else mathutils.Vector([a * b for a, b in zip(scale_blender, extent_scale_blender)])
+    obj.location = translate_blender
+
+    color_key = tuple(round(channel, 4) for channel in color_rgb) if color_rgb else None
+    mat = get_shared_data_block(bpy.data.materials, ('cuboid-material', color_key), lambda: create_cuboid_material(f"Material_cuboid_{color_key}", color_rgb))
+    obj.material_slots[0].link = 'OBJECT'
+    obj.material_slots[0].material = mat
+
+    bpy.data.collections['Foreground'].objects.link(obj)
+    return obj
+
+
+def add_cuboid_with_operators(scene, id, color_rgb, scale_blender, extent_scale_blender, translate_blender):
+    # Operator-based construction with a material per cuboid, kept as baseline for benchmarks/benchmark_scene_construction.py
     for obj in bpy.context.selected_objects:
         obj.select_set(False)
 
+    bpy.ops.mesh.primitive_cube_add(size=0.5, scale=(scale_blender))
+    obj = bpy.context.object
+
+    if extent_scale_blender is not None:
+        extent_transform = mathutils.Matrix.LocRotScale(None, None, extent_scale_blender)
+        obj.data.transform(extent_transform)
+
+    obj.location = translate_blender
+
+    obj.name = f"Cuboid_{id}"
+
+    mat = create_cuboid_material(f"Material_{id}", color_rgb)
+    obj.data.materials.append(mat)
+
+    # Remove object from all collections not used in a scene
+    bpy.ops.collection.objects_remove_all()
+    # add it to our specific collection
+    bpy.data.collections['Foreground'].objects.link(obj)
+    return obj
+
+
+def add_scene_element(scene, scene_element, projection=None, level_of_detail=None, point_representation=None):
     t_start = perf_counter()
     id = scene_element['id']
     color_rgb = scene_element['colorRGB']
@@ -77,6 +252,8 @@ def add_scene_element(scene, scene_element):
     scale_blender = mathutils.Vector((1, 1, scale_z_blender))
 
     extent_webgl = scene_element['extent']
+    extent_scale_blender = None
+    extent_compensation_translate_blender = None
     if extent_webgl:
         CUBOID_SIZE_X = 0.5;
         CUBOID_SIZE_Z = 0.5;
@@ -93,9 +270,38 @@ def add_scene_element(scene, scene_element):
     hide = scene_element["idBufferOnly"] == True
     type = scene_element["type"]
     if hide:
+        # Points are columns if read from a binary scene payload, or a list of point objects if read from JSON
         points = scene_element["points"]
-        logging.info(f"Adding {len(points)} points to scene element {id}")
-        if (len(points) > 0):
+        point_columns = points if isinstance(points, dict) else points_to_columns(points, point_fields(points[0]) if points else POINT_FIELDS)
+        point_count = len(point_columns['x'])
+
+        if projection and level_of_detail is not None and point_count > 0:
+            t_level_of_detail_start = perf_counter()
+            point_columns = take_columns(point_columns, np.flatnonzero(valid_point_mask(point_columns)))
+            # Same transform as below: mesh co-ordinates, scaled by the extent, then by the object scale, then translated
+            element_scale = np.array((1, -1, scale_z_blender))
+            element_location = np.array(translate_blender)
+            if extent_webgl:
+                element_scale *= np.array(extent_scale_blender)
+                element_location = np.array(extent_compensation_translate_blender)
+            world_positions = webgl_to_blender_positions(point_columns['x'], point_columns['y'], point_columns['z']) * element_scale + element_location
+            point_columns = apply_level_of_detail(point_columns, world_positions, projection, level_of_detail, type=type)
+            reduced_point_count = len(point_columns['x'])
+            t_level_of_detail_end = perf_counter()
+            logging.info(f"Level of detail reduced scene element {id} from {point_count} to {reduced_point_count} points ({1 - reduced_point_count / point_count:.1%} fewer) in {t_level_of_detail_end - t_level_of_detail_start:.2f}s")
+            point_count = reduced_point_count
+
+        # Representation per primitive type, e.g., {"point-primitive": "point-cloud", "line-primitive": "instanced"}
+        representation = (point_representation or {}).get(type, 'realized')
+        if representation not in POINT_REPRESENTATIONS:
+            logging.warning(f"Unknown point representation {representation} for scene element {id}, using realized geometry instead")
+            representation = 'realized'
+        if representation == 'point-cloud' and bpy.app.version < (3, 1, 0):
+            logging.warning(f"Cycles renders point clouds since Blender 3.1, using instances for scene element {id} instead")
+            representation = 'instanced'
+
+        logging.info(f"Adding {point_count} points to scene element {id} as {representation} geometry")
+        if (point_count > 0):
             # bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=2, radius=0.001)
             # obj = bpy.context.object
 
@@ -106,118 +312,15 @@ def add_scene_element(scene, scene_element):
             # col.objects.link(obj)
             # bpy.context.view_layer.objects.active = obj
 
-            mat = bpy.data.materials.new(f"Material_{id}")
-            mat.use_nodes = True
-            
-            attrib_node_color_r: bpy.types.ShaderNodeAttribute = mat.node_tree.nodes.new(type='ShaderNodeAttribute')
-            attrib_node_color_r.attribute_type = 'GEOMETRY'
-            attrib_node_color_r.attribute_name = 'color-r'
-            attrib_node_color_g: bpy.types.ShaderNodeAttribute = mat.node_tree.nodes.new(type='ShaderNodeAttribute')
-            attrib_node_color_g.attribute_type = 'GEOMETRY'
-            attrib_node_color_g.attribute_name = 'color-g'
-            attrib_node_color_b: bpy.types.ShaderNodeAttribute = mat.node_tree.nodes.new(type='ShaderNodeAttribute')
-            attrib_node_color_b.attribute_type = 'GEOMETRY'
-            attrib_node_color_b.attribute_name = 'color-b'
-
-            combine_rgb_node: bpy.types.ShaderNodeCombineRGB = mat.node_tree.nodes.new(type='ShaderNodeCombineRGB')
-
-            principled_bsdf_node = mat.node_tree.nodes['Principled BSDF']
-
-            mat.node_tree.links.new(attrib_node_color_r.outputs['Fac'], combine_rgb_node.inputs['R'])
-            mat.node_tree.links.new(attrib_node_color_g.outputs['Fac'], combine_rgb_node.inputs['G'])
-            mat.node_tree.links.new(attrib_node_color_b.outputs['Fac'], combine_rgb_node.inputs['B'])
-
-            mat.node_tree.links.new(combine_rgb_node.outputs['Image'], principled_bsdf_node.inputs['Base Color'])
+            mat = get_shared_data_block(bpy.data.materials, ('point-material', representation), lambda: create_point_material(f"Material_points_{representation}", representation))
             
-            # TODO: Auto-arrange nodes based on Blender's Node Arrange plug-in
-            # TODO: see https://docs.blender.org/manual/en/latest/addons/node/node_arrange.html
-
             obj.data.materials.append(mat)
 
-            # Remove object from all collections not used in a scene
-            bpy.ops.collection.objects_remove_all()
-            # add it to our specific collection
             bpy.data.collections['Foreground'].objects.link(obj)
 
-            # Operation-free object duplication (much more efficient than using Blender ops)
-            # see: https://blender.stackexchange.com/a/7360
-            # objects = []
-
-            verts = []
-            edges = []
-            faces = []
+            build_point_mesh(mesh, point_columns, type=type, colormap=scene_element.get('colormap'))
 
-            valid_points = [point for point in points if point["x"] and point["y"] and point["z"]]
-            
-            for point_index, point in enumerate(valid_points):
-                x = point["x"]
-                y = point["y"]
-                z = point["z"]
-
-                point_location_webgl = mathutils.Vector((x, y, z))
-                point_location_blender = vec3_transform_webgl_to_blender(point_location_webgl)
-
-                verts.append((point_location_blender))
-                
-                # copy = obj.copy()
-                # copy.location = (point_location_blender * scale_blender + translate_blender)
-                # if size:
-                #     copy.scale = mathutils.Vector((size, size, size))
-                # # Create linked duplicates instead of duplicated meshes
-                # # copy.data = copy.data.copy() # also duplicate mesh, remove for linked duplicate
-                # objects.append(copy)
-            
-            # for object in objects:
-            #     # Blender < 2.8
-            #     # scene.objects.link(object)
-            #     bpy.context.collection.objects.link(object)
-
-            if type == 'line-primitive':
-                for point_index, point in enumerate(verts[:-1]):
-                    edges.append([point_index, point_index + 1])
-            
-            mesh.from_pydata(verts, edges, faces)
-
-            # Add and fill custom attribute(s)
-
-            bm = bmesh.new()
-            bm.from_mesh(obj.data)
-
-            bm.verts.ensure_lookup_table()
-
-            # Create custom data layers
-            size_attribute = bm.verts.layers.float.new('size')
-
-            color_r_attribute = bm.verts.layers.float.new('color-r')
-            color_g_attribute = bm.verts.layers.float.new('color-g')
-            color_b_attribute = bm.verts.layers.float.new('color-b')
-
-            # Get the custom data layer by its name
-            size_attribute = bm.verts.layers.float['size']
-            color_r_attribute = bm.verts.layers.float['color-r']
-            color_g_attribute = bm.verts.layers.float['color-g']
-            color_b_attribute = bm.verts.layers.float['color-b']
-
-            for point_index, point in enumerate(valid_points):
-                size = point["size"]
-                r = point["r"]
-                g = point["g"]
-                b = point["b"]
-                # Convert to Gamma-corrected sRGB
-                r = pow(r, 2.2)
-                g = pow(g, 2.2)
-                b = pow(b, 2.2)
-                bm.verts[point_index][size_attribute] = size
-                bm.verts[point_index][color_r_attribute] = r
-                bm.verts[point_index][color_g_attribute] = g
-                bm.verts[point_index][color_b_attribute] = b
-
-            bm.to_mesh(obj.data)
-
-            dependency_graph = bpy.context.evaluated_depsgraph_get()
-            dependency_graph.update()
-            
-            add_point_rendering_geometry_nodes(obj, mat, type=type)
+            add_point_rendering_geometry_nodes(obj, mat, type=type, representation=representation)
 
             if (extent_scale_blender != None and extent_compensation_translate_blender != None):
                 extent_transform = mathutils.Matrix.LocRotScale(None, None, extent_scale_blender)
@@ -229,49 +332,159 @@ def add_scene_element(scene, scene_element):
 
         t_end = perf_counter()
         logging.info(f"Adding scene element {id} took {t_end - t_start:.2f}s")
-        return
+        return obj if point_count > 0 else None
     
     scale_blender = mathutils.Vector((1, 1, scale_z_blender * 2.0))
-    bpy.ops.mesh.primitive_cube_add(size=0.5, scale=(scale_blender))
-    obj = bpy.context.object
-
-    if (extent_scale_blender != None and extent_compensation_translate_blender != None):
-        extent_transform = mathutils.Matrix.LocRotScale(None, None, extent_scale_blender)
+    if extent_scale_blender is not None and extent_compensation_translate_blender is not None:
         translate_blender = extent_compensation_translate_blender
-        obj.data.transform(extent_transform)
+    else:
+        extent_scale_blender = None
+    obj = add_cuboid(scene, id, color_rgb, scale_blender, extent_scale_blender, translate_blender)
+
+    t_end = perf_counter()
+    logging.info(f"Adding scene element {id} took {t_end - t_start:.2f}s")
+    return obj
+
+
+def build_point_mesh_per_vertex(obj, mesh, points, type=None):
+    # Per-vertex construction through mathutils and BMesh, kept as baseline for benchmarks/benchmark_mesh_construction.py
+
+    # Operation-free object duplication (much more efficient than using Blender ops)
+    # see: https://blender.stackexchange.com/a/7360
+    # objects = []
+
+    verts = []
+    edges = []
+    faces = []
+
+    valid_points = [point for point in points if point["x"] and point["y"] and point["z"]]
     
-    obj.location = translate_blender
+    for point_index, point in enumerate(valid_points):
+        x = point["x"]
+        y = point["y"]
+        z = point["z"]
 
-    obj.name = f"Cuboid_{id}"
+        point_location_webgl = mathutils.Vector((x, y, z))
+        point_location_blender = vec3_transform_webgl_to_blender(point_location_webgl)
 
-    mat = bpy.data.materials.new(f"Material_{id}")
-    mat.use_nodes = True
-    principled_bsdf_node = mat.node_tree.nodes['Principled BSDF']
-    if color_rgb:
+        verts.append((point_location_blender))
+        
+        # copy = obj.copy()
+        # copy.location = (point_location_blender * scale_blender + translate_blender)
+        # if size:
+        #     copy.scale = mathutils.Vector((size, size, size))
+        # # Create linked duplicates instead of duplicated meshes
+        # # copy.data = copy.data.copy() # also duplicate mesh, remove for linked duplicate
+        # objects.append(copy)
+    
+    # for object in objects:
+    #     # Blender < 2.8
+    #     # scene.objects.link(object)
+    #     bpy.context.collection.objects.link(object)
+
+    if type == 'line-primitive':
+        for point_index, point in enumerate(verts[:-1]):
+            edges.append([point_index, point_index + 1])
+    
+    mesh.from_pydata(verts, edges, faces)
+
+    # Add and fill custom attribute(s)
+
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+
+    bm.verts.ensure_lookup_table()
+
+    # Create custom data layers
+    size_attribute = bm.verts.layers.float.new('size')
+
+    color_r_attribute = bm.verts.layers.float.new('color-r')
+    color_g_attribute = bm.verts.layers.float.new('color-g')
+    color_b_attribute = bm.verts.layers.float.new('color-b')
+
+    # Get the custom data layer by its name
+    size_attribute = bm.verts.layers.float['size']
+    color_r_attribute = bm.verts.layers.float['color-r']
+    color_g_attribute = bm.verts.layers.float['color-g']
+    color_b_attribute = bm.verts.layers.float['color-b']
+
+    for point_index, point in enumerate(valid_points):
+        size = point["size"]
+        r = point["r"]
+        g = point["g"]
+        b = point["b"]
         # Convert to Gamma-corrected sRGB
-        color_rgb = [
-            pow(color_rgb[0], 2.2),
-            pow(color_rgb[1], 2.2),
-            pow(color_rgb[2], 2.2)
-        ]
-        principled_bsdf_node.inputs['Base Color'].default_value = (color_rgb[0], color_rgb[1], color_rgb[2], 1)
+        r = pow(r, 2.2)
+        g = pow(g, 2.2)
+        b = pow(b, 2.2)
+        bm.verts[point_index][size_attribute] = size
+        bm.verts[point_index][color_r_attribute] = r
+        bm.verts[point_index][color_g_attribute] = g
+        bm.verts[point_index][color_b_attribute] = b
 
-    obj.data.materials.append(mat)
+    bm.to_mesh(obj.data)
 
-    # Remove object from all collections not used in a scene
-    bpy.ops.collection.objects_remove_all()
-    # add it to our specific collection
-    bpy.data.collections['Foreground'].objects.link(obj)
+    dependency_graph = bpy.context.evaluated_depsgraph_get()
+    dependency_graph.update()
 
-    t_end = perf_counter()
-    logging.info(f"Adding scene element {id} took {t_end - t_start:.2f}s")
 
+def build_point_mesh(mesh, columns, type=None, colormap=None):
+    # Bulk construction: all per-point work happens on numpy arrays, which are copied into the mesh at once
+    mask = valid_point_mask(columns)
+    positions = webgl_to_blender_positions(columns['x'][mask], columns['y'][mask], columns['z'][mask])
+    vertex_count = len(positions)
+
+    mesh.vertices.add(vertex_count)
+    mesh.vertices.foreach_set('co', positions.ravel())
+
+    if type == 'line-primitive':
+        edges = line_edges(vertex_count)
+        mesh.edges.add(len(edges))
+        mesh.edges.foreach_set('vertices', edges.ravel())
+
+    mesh.update()
 
-def add_point_rendering_geometry_nodes(object: bpy.types.Object, material: bpy.types.Material, size_attr_name = 'size', type = None):
-    # Setup a geometry node tree for spheres instanced at vertex positions
+    if colormap is not None and 'value' in columns:
+        # Colormap and gamma correction in one lookup, see scene_colormaps.py
+        color_r, color_g, color_b = apply_colormap(columns['value'][mask], colormap)
+    else:
+        # Convert to Gamma-corrected sRGB
+        color_r, color_g, color_b = (srgb_to_linear(columns[channel][mask]) for channel in ['r', 'g', 'b'])
+    attributes = [
+        ('size', columns['size'][mask]),
+        ('color-r', color_r),
+        ('color-g', color_g),
+        ('color-b', color_b),
+    ]
+    for attribute_name, values in attributes:
+        attribute = mesh.attributes.new(attribute_name, 'FLOAT', 'POINT')
+        attribute.data.foreach_set('value', values)
+
+
+# How the spheres of point and line primitives reach Cycles: as real geometry ('realized'), as instances of a single sphere
+# ('instanced'), or as point cloud primitives rendered by Cycles directly ('point-cloud')
+POINT_REPRESENTATIONS = ['realized', 'instanced', 'point-cloud']
+
+
+def add_point_rendering_geometry_nodes(object: bpy.types.Object, material: bpy.types.Material, size_attr_name = 'size', type = None, representation = 'realized'):
+    # Setup a geometry node tree for spheres instanced at vertex positions, shared by all objects of the same type, representation,
+    # and material
     modifier: bpy.types.NodesModifier = object.modifiers.new('Geometry Nodes Modifier', type='NODES')
+    node_group_key = ('point-geometry-nodes', type, representation, material.name)
+    shared_node_group = find_shared_data_block(bpy.data.node_groups, node_group_key)
+    if shared_node_group is not None:
+        # Replaces the node group that the modifier created
+        default_node_group = modifier.node_group
+        modifier.node_group = shared_node_group
+        if default_node_group is not None and default_node_group.users == 0:
+            bpy.data.node_groups.remove(default_node_group)
+        modifier["Input_2_use_attribute"] = 1
+        modifier["Input_2_attribute_name"] = size_attr_name
+        return modifier
+
     geometry_node_tree: bpy.types.GeometryNodeTree = modifier.node_group
-    geometry_node_tree.name = "Geometry Nodes"
+    geometry_node_tree.name = f"Geometry Nodes {type} {representation}"
+    shared_data_block_names[node_group_key] = geometry_node_tree.name
 
     # Clean up existing node set-up
     for node in geometry_node_tree.nodes:
@@ -280,27 +493,50 @@ def add_point_rendering_geometry_nodes(object: bpy.types.Object, material: bpy.t
     # Available types: https://docs.blender.org/api/3.1/bpy.types.html
     input_node: bpy.types.NodeGroupInput = geometry_node_tree.nodes.new(type='NodeGroupInput')
     
-    ico_sphere_node: bpy.types.GeometryNodeMeshIcoSphere = geometry_node_tree.nodes.new(type='GeometryNodeMeshIcoSphere')
-    ico_sphere_node.inputs['Radius'].default_value = 0.002
-    ico_sphere_node.inputs['Subdivisions'].default_value = 1
-    
-    instance_on_points_node: bpy.types.GeometryNodeInstanceOnPoints = geometry_node_tree.nodes.new(type='GeometryNodeInstanceOnPoints')
-
-    realize_instances_node: bpy.types.GeometryNodeRealizeInstances = geometry_node_tree.nodes.new(type='GeometryNodeRealizeInstances')
-
     set_material_node: bpy.types.GeometryNodeSetMaterial = geometry_node_tree.nodes.new(type='GeometryNodeSetMaterial')
     set_material_node.inputs['Material'].default_value = material
     
     output_node: bpy.types.NodeGroupOutput = geometry_node_tree.nodes.new(type='NodeGroupOutput')
 
-    geometry_node_tree.links.new(ico_sphere_node.outputs['Mesh'], instance_on_points_node.inputs['Instance'])
-    geometry_node_tree.links.new(input_node.outputs['Geometry'], instance_on_points_node.inputs['Points'])
-    geometry_node_tree.links.new(instance_on_points_node.outputs['Instances'], realize_instances_node.inputs['Geometry'])
-    geometry_node_tree.links.new(realize_instances_node.outputs['Geometry'], set_material_node.inputs['Geometry'])
-
     # https://docs.blender.org/api/3.1/bpy.types.NodeSocket.html#bpy.types.NodeSocket.type
     input_node.outputs.new("VECTOR", "Scale", identifier="Scale")
-    geometry_node_tree.links.new(input_node.outputs["Scale"], instance_on_points_node.inputs['Scale'])
+
+    if representation == 'point-cloud':
+        # Same radius as the ico spheres below, the (size, size, size) scale vector is implicitly converted to size
+        radius_node: bpy.types.ShaderNodeMath = geometry_node_tree.nodes.new(type='ShaderNodeMath')
+        radius_node.operation = 'MULTIPLY'
+        radius_node.inputs[1].default_value = 0.002
+
+        mesh_to_points_node: bpy.types.GeometryNodeMeshToPoints = geometry_node_tree.nodes.new(type='GeometryNodeMeshToPoints')
+
+        geometry_node_tree.links.new(input_node.outputs['Scale'], radius_node.inputs[0])
+        geometry_node_tree.links.new(radius_node.outputs['Value'], mesh_to_points_node.inputs['Radius'])
+        geometry_node_tree.links.new(input_node.outputs['Geometry'], mesh_to_points_node.inputs['Mesh'])
+        geometry_node_tree.links.new(mesh_to_points_node.outputs['Points'], set_material_node.inputs['Geometry'])
+        points_geometry_output = set_material_node.outputs['Geometry']
+    else:
+        ico_sphere_node: bpy.types.GeometryNodeMeshIcoSphere = geometry_node_tree.nodes.new(type='GeometryNodeMeshIcoSphere')
+        ico_sphere_node.inputs['Radius'].default_value = 0.002
+        ico_sphere_node.inputs['Subdivisions'].default_value = 1
+
+        instance_on_points_node: bpy.types.GeometryNodeInstanceOnPoints = geometry_node_tree.nodes.new(type='GeometryNodeInstanceOnPoints')
+
+        geometry_node_tree.links.new(input_node.outputs['Geometry'], instance_on_points_node.inputs['Points'])
+        geometry_node_tree.links.new(input_node.outputs['Scale'], instance_on_points_node.inputs['Scale'])
+
+        if representation == 'instanced':
+            # The material is set on the single sphere, so that all instances share its geometry
+            geometry_node_tree.links.new(ico_sphere_node.outputs['Mesh'], set_material_node.inputs['Geometry'])
+            geometry_node_tree.links.new(set_material_node.outputs['Geometry'], instance_on_points_node.inputs['Instance'])
+            points_geometry_output = instance_on_points_node.outputs['Instances']
+        else:
+            realize_instances_node: bpy.types.GeometryNodeRealizeInstances = geometry_node_tree.nodes.new(type='GeometryNodeRealizeInstances')
+
+            geometry_node_tree.links.new(ico_sphere_node.outputs['Mesh'], instance_on_points_node.inputs['Instance'])
+            geometry_node_tree.links.new(instance_on_points_node.outputs['Instances'], realize_instances_node.inputs['Geometry'])
+            geometry_node_tree.links.new(realize_instances_node.outputs['Geometry'], set_material_node.inputs['Geometry'])
+            points_geometry_output = set_material_node.outputs['Geometry']
+
     modifier["Input_2_use_attribute"] = 1
     modifier["Input_2_attribute_name"] = size_attr_name
 
@@ -327,12 +563,12 @@ def add_point_rendering_geometry_nodes(object: bpy.types.Object, material: bpy.t
         geometry_node_tree.links.new(curve_to_mesh_node.outputs['Mesh'], realize_instances_line_node.inputs['Geometry'])
         geometry_node_tree.links.new(realize_instances_line_node.outputs['Geometry'], set_material_line_node.inputs['Geometry'])
 
-        geometry_node_tree.links.new(set_material_node.outputs['Geometry'], join_geometry_node.inputs['Geometry'])
+        geometry_node_tree.links.new(points_geometry_output, join_geometry_node.inputs['Geometry'])
         geometry_node_tree.links.new(set_material_line_node.outputs['Geometry'], join_geometry_node.inputs['Geometry'])
 
         geometry_node_tree.links.new(join_geometry_node.outputs['Geometry'], output_node.inputs['Geometry'])
     else:
-        geometry_node_tree.links.new(set_material_node.outputs['Geometry'], output_node.inputs['Geometry'])
+        geometry_node_tree.links.new(points_geometry_output, output_node.inputs['Geometry'])
 
 
     # TODO: Auto-arrange nodes based on Blender's Node Arrange plug-in
@@ -341,87 +577,344 @@ def add_point_rendering_geometry_nodes(object: bpy.types.Object, material: bpy.t
     return modifier
 
 
-def main():
-    t_start = perf_counter()
-
-    argv = sys.argv
-    argv = argv[argv.index("--") + 1:]  # get all args after "--"
+def parse_render_job(argv):
+    job = {}
 
-    file_uuid = ''
     try:
         argv_blend_file_index = argv.index('--datacanvas-blend-file-filename') 
         argv_blend_file_name = argv[argv_blend_file_index + 1]
-        file_uuid = f"{argv_blend_file_name}"
+        job['file_uuid'] = f"{argv_blend_file_name}"
     except ValueError:
         now = datetime.now()
         date_time = now.strftime("%Y-%m-%d_%H-%M-%S")
-        file_uuid = f"{date_time}"
-    
-    logging.basicConfig(filename=f"{file_uuid}.log", encoding='utf-8', level=logging.INFO)
+        job['file_uuid'] = f"{date_time}"
 
-    # Assume colormath is installed
-    # see: https://stackoverflow.com/a/60029513
-    # for package in ['colormath']:
-    #     try:
-    #         lib = import_module(package)
-    #     except:
-    #         logging.info(f"Did not find lib {package} -- installing it now")
-    #         install_dependency(package)
-    #     else:
-    #         logging.info(f"Successfully found lib {package}")
-
-    sample_canvas_size = [2560, 379]
+    try:
+        argv_output_file_index = argv.index('--datacanvas-output-file')
+        job['output_file'] = argv[argv_output_file_index + 1]
+    except ValueError:
+        pass
 
     try:
         argv_width_index = argv.index('--datacanvas-width') 
         argv_width = argv[argv_width_index + 1]
-        sample_canvas_size[0] = int(argv_width)
+        job['width'] = int(argv_width)
     except:
         pass
 
     try:
         argv_height_index = argv.index('--datacanvas-height') 
         argv_height = argv[argv_height_index + 1]
-        sample_canvas_size[1] = int(argv_height)
+        job['height'] = int(argv_height)
     except:
         pass
 
-    sample_eye =  mathutils.Vector((2.2737033367156982, 2.015049934387207, 3.845113515853882))
-    sample_center = [0, 0.5, 0]
-    sample_fovy = 45
-
     try:
         argv_camera_eye_index = argv.index('--datacanvas-camera-eye') 
         argv_camera_eye = argv[argv_camera_eye_index + 1]
-        sample_eye =  mathutils.Vector(json.loads(argv_camera_eye))
+        job['camera_eye'] = json.loads(argv_camera_eye)
     except:
         pass
 
     try:
         argv_camera_center_index = argv.index('--datacanvas-camera-center') 
         argv_camera_center = argv[argv_camera_center_index + 1]
-        sample_center =  mathutils.Vector(json.loads(argv_camera_center))
+        job['camera_center'] = json.loads(argv_camera_center)
     except:
         pass
 
+    # The server passes --datacanvas-camera-fov-y-degrees, older callers used --datacanvas-fov-y-degrees
+    for fov_y_degrees_flag in ['--datacanvas-camera-fov-y-degrees', '--datacanvas-fov-y-degrees']:
+        try:
+            argv_fov_y_degrees_index = argv.index(fov_y_degrees_flag) 
+            argv_fov_y_degrees = argv[argv_fov_y_degrees_index + 1]
+            job['camera_fov_y_degrees'] = float(argv_fov_y_degrees)
+        except:
+            pass
+
     try:
-        argv_fov_y_degrees_index = argv.index('--datacanvas-fov-y-degrees') 
-        argv_fov_y_degrees = argv[argv_fov_y_degrees_index + 1]
-        sample_fovy = float(argv_fov_y_degrees)
+        argv_scene_elements_file_index = argv.index('--datacanvas-scene-elements-file') 
+        job['scene_elements_file'] = argv[argv_scene_elements_file_index + 1]
     except:
         pass
 
+    try:
+        argv_level_of_detail_index = argv.index('--datacanvas-level-of-detail')
+        job['level_of_detail'] = json.loads(argv[argv_level_of_detail_index + 1])
+    except ValueError:
+        pass
 
-    scene_elements = None
+    job['save_blend_file'] = '--datacanvas-save-blend-file' in argv
 
     try:
-        argv_scene_elements_file_index = argv.index('--datacanvas-scene-elements-file') 
-        argv_scene_elements_file = argv[argv_scene_elements_file_index + 1]
-        with open(argv_scene_elements_file, 'r') as scene_elements_file:
-            scene_elements = json.load(scene_elements_file)
-    except:
+        argv_profile_file_index = argv.index('--datacanvas-profile-file')
+        job['profile_file'] = argv[argv_profile_file_index + 1]
+    except ValueError:
+        pass
+
+    try:
+        argv_render_passes_index = argv.index('--datacanvas-render-passes')
+        job['render_passes'] = json.loads(argv[argv_render_passes_index + 1])
+    except ValueError:
+        pass
+
+    try:
+        argv_render_views_index = argv.index('--datacanvas-render-views')
+        job['render_views'] = json.loads(argv[argv_render_views_index + 1])
+    except ValueError:
+        pass
+
+    try:
+        argv_time_budget_seconds_index = argv.index('--datacanvas-time-budget-seconds')
+        job['time_budget_seconds'] = float(argv[argv_time_budget_seconds_index + 1])
+    except ValueError:
+        pass
+
+    try:
+        argv_point_representation_index = argv.index('--datacanvas-point-representation')
+        job['point_representation'] = json.loads(argv[argv_point_representation_index + 1])
+    except ValueError:
+        pass
+
+    try:
+        argv_render_region_index = argv.index('--datacanvas-render-region')
+        job['render_region'] = json.loads(argv[argv_render_region_index + 1])
+    except ValueError:
+        pass
+
+    try:
+        argv_output_format_index = argv.index('--datacanvas-output-format')
+        job['output_format'] = argv[argv_output_format_index + 1]
+    except ValueError:
         pass
 
+    return job
+
+
+def load_scene_elements(path):
+    with open(path, 'rb') as scene_elements_file:
+        prefix = scene_elements_file.read(4)
+    if is_scene_payload(prefix):
+        _, scene_elements = read_scene_payload(path)
+        return scene_elements
+    with open(path, 'r') as scene_elements_file:
+        return json.load(scene_elements_file)
+
+
+# Cycles device as passed by the server with --cycles-device, see blender_args in blender_worker_pool.py
+CYCLES_DEVICES = ['CUDA', 'OPTIX', 'CPU']
+cycles_device = 'CUDA'
+
+
+def configure_cycles_device(scene):
+    scene.render.engine = 'CYCLES'
+    device = cycles_device
+
+    cpref = bpy.context.preferences.addons['cycles'].preferences
+    if device != 'CPU':
+        cpref.compute_device_type = device
+        # Use GPU devices of the given type only; get_devices() would initialize every GPU backend (CUDA, OptiX, HIP) instead
+        cpref.get_devices_for_type(device)
+        gpu_device_count = 0
+        for device_entry in cpref.devices:
+            device_entry.use = device_entry.type == device
+            gpu_device_count += device_entry.use
+        if gpu_device_count == 0:
+            logging.warning(f"Found no {device} devices, rendering on the CPU instead")
+            device = 'CPU'
+
+    if device == 'CPU':
+        cpref.compute_device_type = 'NONE'
+        scene.cycles.device = 'CPU'
+        # Uses as many threads as Blender's --threads argument allows, which the server sets to the job's share of the cores
+        scene.render.threads_mode = 'AUTO'
+        logging.info(f"Enable CYCLES on the CPU with {scene.render.threads} threads")
+    else:
+        scene.cycles.device = 'GPU'
+        logging.info(f"Enable CYCLES on {device}")
+
+
+def render_image(scene, output_file, file_format='PNG'):
+    # Renders the scene with its current settings and writes it as PNG (or TARGA_RAW for tiles), returns the timings of the rendering
+    t_render_start = perf_counter()
+    scene.frame_set(1)
+    render_stats_state['first_sample_at'] = None
+    bpy.ops.render.render()
+    t_render_end = perf_counter()
+
+    # Written separately from rendering, so that writing the image is timed on its own
+    scene.render.image_settings.file_format = file_format
+    bpy.data.images['Render Result'].save_render(filepath=output_file, scene=scene)
+    t_image_write_end = perf_counter()
+
+    first_sample_at = render_stats_state['first_sample_at'] or t_render_end
+    return {
+        'render_sync': first_sample_at - t_render_start,
+        'render_sampling': t_render_end - first_sample_at,
+        'image_write': t_image_write_end - t_render_end,
+    }
+
+
+def estimate_render_pass_seconds(render_pass, previous_render_pass, previous_timings):
+    # Cycles synchronizes the scene for every rendering, sampling time grows with the number of pixels times samples
+    previous_pixel_samples = previous_render_pass['scale'] ** 2 * previous_render_pass['samples']
+    pixel_samples = render_pass['scale'] ** 2 * render_pass['samples']
+    return (
+        previous_timings['render_sync']
+        + previous_timings['render_sampling'] * pixel_samples / previous_pixel_samples
+        + previous_timings['image_write'] * render_pass['scale'] ** 2 / previous_render_pass['scale'] ** 2
+    )
+
+
+def render_progressive_passes(scene, render_passes, time_budget_seconds=None):
+    # Renders the passes in order, each into its own output file, and stops before a pass that would exceed the time budget;
+    # the first pass is always rendered
+    deadline = perf_counter() + time_budget_seconds if time_budget_seconds is not None else None
+    pass_timings = []
+    for render_pass_index, render_pass in enumerate(render_passes):
+        if deadline is not None and pass_timings:
+            estimated_seconds = estimate_render_pass_seconds(render_pass, render_passes[render_pass_index - 1], pass_timings[-1])
+            if perf_counter() + estimated_seconds > deadline:
+                logging.info(f"Skipping render passes {render_pass_index} and later, pass {render_pass_index} would take about {estimated_seconds:.2f}s")
+                break
+
+        scene.render.resolution_percentage = max(1, round(render_pass['scale'] * 100))
+        scene.cycles.samples = render_pass['samples']
+        scene.cycles.use_denoising = render_pass.get('denoise', False)
+
+        timings = render_image(scene, render_pass['output_file'])
+        pass_timings.append(timings)
+        logging.info(f"Render pass {render_pass_index} ({render_pass['scale']:.2f}x, {render_pass['samples']} samples) took {sum(timings.values()):.2f}s")
+        emit_event({'type': 'render_pass', 'index': render_pass_index, 'count': len(render_passes), 'output_file': render_pass['output_file'], 'timings': timings})
+    return pass_timings
+
+
+def render_views(scene, views):
+    # Renders the already built scene from each view's camera, each into its own output file
+    view_timings = []
+    for view_index, view in enumerate(views):
+        eye = vec3_transform_webgl_to_blender(mathutils.Vector(view['camera_eye']))
+        center = vec3_transform_webgl_to_blender(mathutils.Vector(view['camera_center']))
+        add_camera(scene, eye, center, view['camera_fov_y_degrees'])
+        scene.render.resolution_x = view['width']
+        scene.render.resolution_y = view['height']
+
+        timings = render_image(scene, view['output_file'])
+        view_timings.append(timings)
+        logging.info(f"View {view_index} ({view['width']}x{view['height']}) took {sum(timings.values()):.2f}s")
+        emit_event({'type': 'render_view', 'index': view_index, 'count': len(views), 'output_file': view['output_file'], 'timings': timings})
+        emit_event({'type': 'progress', 'stage': 'render', 'progress': (view_index + 1) / len(views)})
+    return view_timings
+
+
+# Scene elements that the jobs of a rendering session built, by scene element id, and the session's current camera -- a worker
+# that serves a session serves no other jobs
+session_scene_elements = {}
+session_camera_object_names = []
+
+
+def scene_element_fingerprint(scene_element, point_representation=None):
+    # The job's representation of the element's type is part of the element, as changing it rebuilds the element's geometry
+    properties = {key: value for key, value in scene_element.items() if key != 'points'}
+    properties['point_representation'] = (point_representation or {}).get(scene_element.get('type'))
+    digest = hashlib.sha256(json.dumps(properties, sort_keys=True).encode('utf-8'))
+    points = scene_element.get('points')
+    if isinstance(points, dict):
+        for field in sorted(points):
+            digest.update(field.encode('utf-8'))
+            digest.update(np.ascontiguousarray(points[field]).tobytes())
+    elif points is not None:
+        digest.update(json.dumps(points, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def remove_objects(object_names):
+    # Removes the objects with their data, materials, and geometry node groups, unless other objects still use them
+    for object_name in object_names:
+        obj = bpy.data.objects.get(object_name)
+        if obj is None:
+            continue
+        data = obj.data
+        # Slots cover both the data's materials and the object-linked materials of cuboids
+        materials = [slot.material for slot in obj.material_slots if slot.material]
+        node_groups = [modifier.node_group for modifier in obj.modifiers if modifier.type == 'NODES' and modifier.node_group]
+        bpy.data.objects.remove(obj)
+        if isinstance(data, bpy.types.Mesh) and data.users == 0:
+            bpy.data.meshes.remove(data)
+        elif isinstance(data, bpy.types.Camera) and data.users == 0:
+            bpy.data.cameras.remove(data)
+        # Node groups first, as their Set Material nodes use the materials
+        for node_group in node_groups:
+            if node_group.users == 0:
+                bpy.data.node_groups.remove(node_group)
+        for material in materials:
+            if material.users == 0:
+                bpy.data.materials.remove(material)
+
+
+def update_session_scene(scene_elements, session, build_scene_element, point_representation=None):
+    # Removes the session's scene elements that the job removes, and (re)builds the ones it adds or changes; scene elements that
+    # are sent again unchanged are kept. Returns the number of kept scene elements.
+    removed_ids = set(f"{id}" for id in session.get('removed_scene_element_ids') or [])
+    if session.get('replace_scene_elements'):
+        removed_ids |= set(session_scene_elements) - set(f"{scene_element.get('id')}" for scene_element in scene_elements)
+    for id in removed_ids:
+        if id in session_scene_elements:
+            remove_objects(session_scene_elements.pop(id)['object_names'])
+
+    reused_count = 0
+    for scene_element_index, scene_element in enumerate(scene_elements):
+        id = f"{scene_element.get('id')}"
+        fingerprint = scene_element_fingerprint(scene_element, point_representation)
+        previous = session_scene_elements.get(id)
+        if previous is not None and previous['fingerprint'] == fingerprint:
+            reused_count += 1
+            continue
+        if previous is not None:
+            remove_objects(previous['object_names'])
+        obj = build_scene_element(scene_element)
+        session_scene_elements[id] = {'fingerprint': fingerprint, 'object_names': [obj.name] if obj is not None else []}
+        emit_event({'type': 'progress', 'stage': 'scene', 'progress': (scene_element_index + 1) / len(scene_elements)})
+
+    logging.info(f"Session scene has {len(session_scene_elements)} scene elements: removed {len(removed_ids)}, kept {reused_count}, built {len(scene_elements) - reused_count}")
+    return reused_count
+
+
+def render_job(job, configure_devices=True):
+    t_start = perf_counter()
+
+    file_uuid = job['file_uuid']
+
+    # Assume colormath is installed
+    # see: https://stackoverflow.com/a/60029513
+    # for package in ['colormath']:
+    #     try:
+    #         lib = import_module(package)
+    #     except:
+    #         logging.info(f"Did not find lib {package} -- installing it now")
+    #         install_dependency(package)
+    #     else:
+    #         logging.info(f"Successfully found lib {package}")
+
+    sample_canvas_size = [2560, 379]
+    sample_canvas_size[0] = job.get('width', sample_canvas_size[0])
+    sample_canvas_size[1] = job.get('height', sample_canvas_size[1])
+
+    sample_eye =  mathutils.Vector(job.get('camera_eye', (2.2737033367156982, 2.015049934387207, 3.845113515853882)))
+    sample_center = mathutils.Vector(job.get('camera_center', (0, 0.5, 0)))
+    sample_fovy = job.get('camera_fov_y_degrees', 45)
+
+    scene_elements = None
+
+    t_scene_payload_read_start = perf_counter()
+    if job.get('scene_elements_file'):
+        try:
+            scene_elements = load_scene_elements(job['scene_elements_file'])
+        except Exception as error:
+            # Fail the job, rendering an empty scene instead would cache its image as the scene's
+            raise RuntimeError(f"Could not read scene elements from {job['scene_elements_file']}: {error}") from error
+    t_scene_payload_read_end = perf_counter()
+
     sample_scaling_factor = 1.0
     sample_cycles_sample_count = 2
     sample_cycles_use_denoising = False
@@ -431,47 +924,238 @@ def main():
     sample_center = vec3_transform_webgl_to_blender(sample_center)
     
     t_scene_creation_start = perf_counter()
+    # Build times per scene element type, as scenes may have thousands of scene elements
+    scene_element_timings = {}
+    # Jobs of a rendering session update the scene that the session's previous job left behind
+    session = job.get('session')
+    reused_scene_element_count = 0
 
     logging.info(f"Setting scene content of {len(bpy.data.scenes)} scenes")
 
+    device_setup_seconds = 0.0
     for scene_index, scene in enumerate(bpy.data.scenes):
-        scene.render.engine = 'CYCLES'
-        scene.cycles.device = 'GPU'
-
-        logging.info(f"Enable CYCLES and GPU")
-
-        cpref = bpy.context.preferences.addons['cycles'].preferences
-        cpref.compute_device_type = 'CUDA'
-
-        logging.info(f"Enable CUDA")
-
-        # Use GPU devices only
-        cpref.get_devices()
-        for device in cpref.devices:
-            device.use = True if device.type == 'CUDA' else False
+        if configure_devices:
+            t_device_setup_start = perf_counter()
+            configure_cycles_device(scene)
+            device_setup_seconds += perf_counter() - t_device_setup_start
 
         scene.render.resolution_x = round(sample_canvas_size[0] * sample_scaling_factor)
         scene.render.resolution_y = round(sample_canvas_size[1] * sample_scaling_factor)
+        # Progressive passes lower it, and workers keep the scene settings of their previous job
+        scene.render.resolution_percentage = 100
+        # A tile of a tiled rendering renders its region of the image only, cropped to it, see render_tiles.py
+        render_region = job.get('render_region')
+        scene.render.use_border = render_region is not None
+        scene.render.use_crop_to_border = render_region is not None
+        if render_region is not None:
+            scene.render.border_min_x = render_region['min_x']
+            scene.render.border_max_x = render_region['max_x']
+            scene.render.border_min_y = render_region['min_y']
+            scene.render.border_max_y = render_region['max_y']
         scene.cycles.samples = sample_cycles_sample_count
         scene.cycles.use_denoising = sample_cycles_use_denoising
 
-        add_camera(scene, sample_eye, sample_center, sample_fovy)
-
-        if scene_elements:
+        camera_object_names = add_camera(scene, sample_eye, sample_center, sample_fovy)
+        if session is not None:
+            # The session's previous camera goes, its scene elements stay
+            remove_objects(session_camera_object_names)
+            session_camera_object_names[:] = camera_object_names
+
+        # Level of detail reduces points and lines in screen space of this camera, if the request asks for it
+        level_of_detail = job.get('level_of_detail')
+        projection = CameraProjection(sample_eye, sample_center, sample_fovy, scene.render.resolution_x, scene.render.resolution_y) if level_of_detail is not None else None
+
+        def build_scene_element(scene_element):
+            t_scene_element_start = perf_counter()
+            obj = add_scene_element(scene, scene_element, projection=projection, level_of_detail=level_of_detail, point_representation=job.get('point_representation'))
+            seconds = perf_counter() - t_scene_element_start
+            type_timings = scene_element_timings.setdefault(scene_element.get('type'), {'type': scene_element.get('type'), 'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            type_timings['count'] += 1
+            type_timings['seconds'] += seconds
+            type_timings['max_seconds'] = max(type_timings['max_seconds'], seconds)
+            return obj
+
+        if session is not None:
+            reused_scene_element_count = update_session_scene(scene_elements or [], session, build_scene_element, point_representation=job.get('point_representation'))
+        elif scene_elements:
             logging.info(f"Adding {len(scene_elements)} scene elements to scene {scene_index}")
-            for scene_element in scene_elements:
-                add_scene_element(scene, scene_element)
+            for scene_element_index, scene_element in enumerate(scene_elements):
+                build_scene_element(scene_element)
+                emit_event({'type': 'progress', 'stage': 'scene', 'progress': (scene_element_index + 1) / len(scene_elements)})
     
     t_scene_creation_end = perf_counter()
-    logging.info(f"Python-side scene creation took {t_scene_creation_end - t_scene_creation_start:.2f}s")
+    logging.info(f"Python-side scene creation took {t_scene_creation_end - t_scene_creation_start:.2f}s, setting up devices {device_setup_seconds:.2f}s of it")
     
-    blend_file_name = os.path.join(os.getcwd(), f"{file_uuid}.blend")
-    bpy.ops.wm.save_as_mainfile(filepath=blend_file_name)
+    timings = {
+        'script_started_at': SCRIPT_STARTED_AT,
+        'scene_payload_read': t_scene_payload_read_end - t_scene_payload_read_start,
+        'device_setup': device_setup_seconds,
+        'scene_build': t_scene_creation_end - t_scene_creation_start - device_setup_seconds,
+        'scene_elements': list(scene_element_timings.values()),
+    }
+    if session is not None:
+        timings['scene_elements_reused'] = reused_scene_element_count
+
+    # Only for debugging, as writing the .blend file of large scenes takes seconds
+    if job.get('save_blend_file'):
+        t_save_start = perf_counter()
+        blend_file_name = os.path.join(os.getcwd(), f"{file_uuid}.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=blend_file_name, copy=True)
+        timings['blend_file_write'] = perf_counter() - t_save_start
+        logging.info(f"Saving {blend_file_name} took {timings['blend_file_write']:.2f}s")
+
+    output_file = job.get('output_file')
+    if job.get('render_views'):
+        emit_event({'type': 'progress', 'stage': 'render', 'progress': 0.0})
+        timings['render_views'] = render_views(bpy.context.scene, job['render_views'])
+        # Separate requests would read and build the scene for every view
+        timings['shared_scene_build_saved'] = (len(job['render_views']) - 1) * (timings['scene_payload_read'] + timings['scene_build'])
+    elif job.get('render_passes'):
+        emit_event({'type': 'progress', 'stage': 'render', 'progress': 0.0})
+        timings['render_passes'] = render_progressive_passes(bpy.context.scene, job['render_passes'], job.get('time_budget_seconds'))
+    elif output_file:
+        emit_event({'type': 'progress', 'stage': 'render', 'progress': 0.0})
+
+        timings.update(render_image(bpy.context.scene, output_file, file_format=job.get('output_format', 'PNG')))
+        logging.info(f"Rendering scene in blender took {timings['render_sync'] + timings['render_sampling']:.2f}s (synchronization {timings['render_sync']:.2f}s, sampling {timings['render_sampling']:.2f}s), writing the image {timings['image_write']:.2f}s")
 
     t_end = perf_counter()
+    timings['blender_script'] = t_end - t_start
     logging.info(f"Python script inside Blender took {t_end - t_start:.2f}s overall")
 
+    emit_event({'type': 'timings', 'timings': timings})
+    return timings
+
+
+def run_render_job(job, configure_devices=True):
+    # With a profile file, the job runs under cProfile, whose statistics the server offers for download
+    if not job.get('profile_file'):
+        return render_job(job, configure_devices=configure_devices)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return render_job(job, configure_devices=configure_devices)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(job['profile_file'])
+
+
+# Data-block collections that add_camera and add_scene_element create new entries in
+RESETTABLE_DATA_COLLECTIONS = ['objects', 'meshes', 'materials', 'node_groups', 'cameras', 'curves']
+
+
+def snapshot_data_blocks():
+    return {
+        collection_name: set(data_block.as_pointer() for data_block in getattr(bpy.data, collection_name))
+        for collection_name in RESETTABLE_DATA_COLLECTIONS
+    }
+
+
+def reset_scene(snapshot):
+    # Objects have to go first, as they keep users on the meshes, materials and node groups below
+    for collection_name in RESETTABLE_DATA_COLLECTIONS:
+        data_collection = getattr(bpy.data, collection_name)
+        for data_block in list(data_collection):
+            if data_block.as_pointer() not in snapshot[collection_name]:
+                data_collection.remove(data_block)
+
+    for scene in bpy.data.scenes:
+        scene.camera = None
+
+
+def run_worker(worker_fd):
+    from multiprocessing.connection import Connection
+    import traceback
+
+    global event_sink
+
+    connection = Connection(worker_fd)
+
+    def send(message):
+        with event_lock:
+            connection.send_bytes(json.dumps(message).encode('utf-8'))
+
+    def send_event(event):
+        connection.send_bytes(json.dumps({'type': 'event', 'event': event}).encode('utf-8'))
+
+    event_sink = send_event
+
+    for scene in bpy.data.scenes:
+        configure_cycles_device(scene)
+
+    snapshot = snapshot_data_blocks()
+    send({'type': 'ready', 'pid': os.getpid()})
+
+    while True:
+        try:
+            message = json.loads(connection.recv_bytes().decode('utf-8'))
+        except EOFError:
+            logging.info(f"Server closed the connection, stopping worker")
+            return
+
+        if message['type'] == 'ping':
+            send({'type': 'pong'})
+        elif message['type'] == 'shutdown':
+            logging.info(f"Shutting down worker")
+            return
+        elif message['type'] == 'render':
+            job = message['job']
+
+            # Log into the job's log file, like one-shot renders do
+            job_log_handler = logging.FileHandler(f"{job['file_uuid']}.log", encoding='utf-8')
+            logging.getLogger().addHandler(job_log_handler)
+            try:
+                timings = run_render_job(job, configure_devices=False)
+                session = {'scene_element_ids': list(session_scene_elements)} if job.get('session') is not None else None
+                send({'type': 'result', 'status': 'ok', 'timings': timings, 'session': session})
+            except Exception as error:
+                logging.exception(f"Rendering job {job['file_uuid']} failed")
+                send({'type': 'result', 'status': 'error', 'error': f"{error}", 'traceback': traceback.format_exc()})
+            finally:
+                # Sessions keep their scene for the next job, the server discards sessions whose job failed
+                if job.get('session') is None:
+                    t_reset_start = perf_counter()
+                    reset_scene(snapshot)
+                    logging.info(f"Resetting scene took {perf_counter() - t_reset_start:.2f}s")
+                logging.getLogger().removeHandler(job_log_handler)
+                job_log_handler.close()
+        else:
+            logging.warning(f"Ignoring unknown message of type {message['type']}")
+
+
+def main():
+    global cycles_device
+
+    if on_render_stats not in bpy.app.handlers.render_stats:
+        bpy.app.handlers.render_stats.append(on_render_stats)
+
+    argv = sys.argv
+    argv = argv[argv.index("--") + 1:]  # get all args after "--"
+
+    if '--cycles-device' in argv:
+        cycles_device = argv[argv.index('--cycles-device') + 1].upper()
+        if cycles_device not in CYCLES_DEVICES:
+            logging.warning(f"Unknown Cycles device {cycles_device}, expected one of {CYCLES_DEVICES}, using CUDA instead")
+            cycles_device = 'CUDA'
+
+    try:
+        argv_worker_fd_index = argv.index('--datacanvas-worker-fd')
+        worker_fd = int(argv[argv_worker_fd_index + 1])
+    except ValueError:
+        worker_fd = None
+
+    if worker_fd is not None:
+        logging.basicConfig(filename=f"./blender-temp-data/worker_{os.getpid()}.log", encoding='utf-8', level=logging.INFO)
+        run_worker(worker_fd)
+        return
+
+    job = parse_render_job(argv)
+
+    logging.basicConfig(filename=f"{job['file_uuid']}.log", encoding='utf-8', level=logging.INFO)
+
+    run_render_job(job)
+
 
 if __name__ == "__main__":
     main()
-
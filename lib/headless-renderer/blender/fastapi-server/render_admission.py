@@ -0,0 +1,187 @@
+# Admits renderings to a limited number of slots. Waiting renderings are queued per client and, whenever a slot frees up, the one
+# with the lowest cost plus its client's recent cost starts, so that small interactive renderings pass large ones and a client
+# with many or large renderings does not hold up the others. Renderings that were passed over for starvation_seconds start
+# before all others, oldest first.
+
+import asyncio
+import logging
+
+from contextlib import asynccontextmanager
+from time import monotonic
+
+from fastapi import HTTPException
+
+# Clients without an id of their own share one queue
+ANONYMOUS_CLIENT = 'anonymous'
+# Points that a scene element costs on top of its points, e.g., for its objects, materials, and modifiers
+SCENE_ELEMENT_COST_POINTS = 1000
+
+
+def render_cost(point_count, width, height, scene_element_count=0):
+    # Relative cost of a rendering, grows with its geometry and its resolution; scenes without points (only cuboids) still cost
+    # their resolution
+    return max(point_count + scene_element_count * SCENE_ELEMENT_COST_POINTS, 1) * max(width * height, 1)
+
+
+class QueuedRendering:
+    def __init__(self, client, cost, future):
+        self.client = client
+        self.cost = cost
+        self.future = future
+        self.queued_at = monotonic()
+        self.started = False
+
+
+class RenderClient:
+    def __init__(self, name):
+        self.name = name
+        self.queued = []
+        self.in_flight = 0
+        self.started = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.last_active_at = monotonic()
+        # Cost of the renderings the client started, halved every fairness_half_life_seconds
+        self._recent_cost = 0.0
+        self._recent_cost_at = monotonic()
+
+    def recent_cost(self, now, half_life_seconds):
+        return self._recent_cost * 0.5 ** ((now - self._recent_cost_at) / half_life_seconds)
+
+    def add_cost(self, cost, now, half_life_seconds):
+        self._recent_cost = self.recent_cost(now, half_life_seconds) + cost
+        self._recent_cost_at = now
+
+    def is_idle(self):
+        return not self.queued and not self.in_flight
+
+    def to_dict(self, now, half_life_seconds):
+        return {
+            'client': self.name,
+            'queued': len(self.queued),
+            'queued_cost': sum(queued.cost for queued in self.queued),
+            'oldest_queued_seconds': max((now - queued.queued_at for queued in self.queued), default=0.0),
+            'in_flight': self.in_flight,
+            'started': self.started,
+            'rejected': self.rejected,
+            'recent_cost': self.recent_cost(now, half_life_seconds),
+            'mean_wait_seconds': self.wait_seconds_total / self.started if self.started else 0.0,
+            'max_wait_seconds': self.wait_seconds_max,
+        }
+
+
+class RenderAdmissionController:
+    def __init__(self, max_concurrent, max_queue_depth, max_queue_wait_seconds, max_client_queue_depth=None, starvation_seconds=20.0, fairness_half_life_seconds=60.0, client_idle_seconds=600.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_wait_seconds = max_queue_wait_seconds
+        self.max_client_queue_depth = max_client_queue_depth or max_queue_depth
+        self.starvation_seconds = starvation_seconds
+        self.fairness_half_life_seconds = fairness_half_life_seconds
+        # Statistics of clients without renderings are dropped after this long
+        self.client_idle_seconds = client_idle_seconds
+
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.clients = {}
+
+    def client(self, name):
+        now = monotonic()
+        client = self.clients.get(name)
+        if client is None:
+            for idle_client in [client for client in self.clients.values() if client.is_idle() and now - client.last_active_at > self.client_idle_seconds]:
+                del self.clients[idle_client.name]
+            client = self.clients[name] = RenderClient(name)
+        client.last_active_at = now
+        return client
+
+    def ensure_queue_capacity(self, client_name=None):
+        # Counters are updated synchronously, unlike the queue which is only entered once admit() runs
+        queued_behind_limit = self.in_flight + self.queue_depth - self.max_concurrent
+        if queued_behind_limit >= self.max_queue_depth:
+            logging.warning(f"Rejecting rendering, {queued_behind_limit} renderings are already queued")
+            raise HTTPException(status_code=429, detail="Too many renderings queued, try again later")
+        client = self.clients.get(client_name or ANONYMOUS_CLIENT)
+        if client is not None and len(client.queued) >= self.max_client_queue_depth:
+            client.rejected += 1
+            logging.warning(f"Rejecting rendering of client {client.name}, {len(client.queued)} of its renderings are already queued")
+            raise HTTPException(status_code=429, detail="Too many of your renderings queued, try again later")
+
+    def next_queued(self, now):
+        # Renderings whose wait was cancelled or timed out leave the queue once their admit() resumes
+        queued = [queued for client in self.clients.values() for queued in client.queued if not queued.future.done()]
+        if not queued:
+            return None
+        starving = [rendering for rendering in queued if now - rendering.queued_at >= self.starvation_seconds]
+        if starving:
+            return min(starving, key=lambda rendering: rendering.queued_at)
+        return min(queued, key=lambda rendering: (rendering.client.recent_cost(now, self.fairness_half_life_seconds) + rendering.cost, rendering.queued_at))
+
+    def start_queued(self):
+        while self.in_flight < self.max_concurrent:
+            now = monotonic()
+            rendering = self.next_queued(now)
+            if rendering is None:
+                return
+            client = rendering.client
+            client.queued.remove(rendering)
+            self.queue_depth -= 1
+
+            rendering.started = True
+            self.in_flight += 1
+            client.in_flight += 1
+            client.started += 1
+            client.add_cost(rendering.cost, now, self.fairness_half_life_seconds)
+            wait_seconds = now - rendering.queued_at
+            client.wait_seconds_total += wait_seconds
+            client.wait_seconds_max = max(client.wait_seconds_max, wait_seconds)
+            rendering.future.set_result(None)
+
+    def finish(self, rendering):
+        self.in_flight -= 1
+        rendering.client.in_flight -= 1
+        rendering.client.last_active_at = monotonic()
+        self.start_queued()
+
+    @asynccontextmanager
+    async def admit(self, client_name=None, cost=1):
+        self.ensure_queue_capacity(client_name)
+
+        client = self.client(client_name or ANONYMOUS_CLIENT)
+        rendering = QueuedRendering(client, cost, asyncio.get_running_loop().create_future())
+        client.queued.append(rendering)
+        self.queue_depth += 1
+        try:
+            self.start_queued()
+            await asyncio.wait_for(rendering.future, timeout=self.max_queue_wait_seconds)
+        except BaseException as error:
+            if rendering.started:
+                # The slot was granted just before the wait was cancelled
+                self.finish(rendering)
+            else:
+                client.queued.remove(rendering)
+                self.queue_depth -= 1
+            if isinstance(error, asyncio.TimeoutError):
+                client.rejected += 1
+                logging.warning(f"Rejecting rendering of client {client.name} after waiting {self.max_queue_wait_seconds}s in the queue")
+                raise HTTPException(status_code=503, detail="Rendering did not start in time, try again later")
+            raise
+
+        logging.info(f"Rendering of client {client.name} with cost {cost} waited {monotonic() - rendering.queued_at:.2f}s in the queue")
+
+        try:
+            yield
+        finally:
+            self.finish(rendering)
+
+    def to_dict(self):
+        now = monotonic()
+        return {
+            'max_concurrent': self.max_concurrent,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'starvation_seconds': self.starvation_seconds,
+            'fairness_half_life_seconds': self.fairness_half_life_seconds,
+            'clients': [client.to_dict(now, self.fairness_half_life_seconds) for client in self.clients.values()],
+        }
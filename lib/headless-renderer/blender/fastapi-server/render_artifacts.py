@@ -0,0 +1,111 @@
+import os
+import re
+import asyncio
+import logging
+import threading
+
+from time import time
+
+# Renderings' files are named after a UUID, e.g. <uuid>.png, <uuid>.log, <uuid>.blend, or <uuid>_scene_elements.bin
+ARTIFACT_FILE_NAME_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+# Blender workers log to worker_<pid>.log, see headless-renderer-blender.py
+WORKER_LOG_FILE_NAME_PATTERN = re.compile(r'^worker_(\d+)\.log$')
+
+# 'none' removes a rendering's files once it finished, 'on-failure' keeps the files of failed renderings, 'keep' keeps all files;
+# kept files are removed by the janitor after the retention period or once the directory exceeds its size limit
+ARTIFACT_RETENTION_MODES = ['none', 'on-failure', 'keep']
+
+
+def is_process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RenderArtifactJanitor:
+    def __init__(self, directory, retention='on-failure', retention_seconds=60 * 60, max_bytes=2 ** 30):
+        if retention not in ARTIFACT_RETENTION_MODES:
+            raise ValueError(f"Unknown artifact retention {retention}, expected one of {ARTIFACT_RETENTION_MODES}")
+        self.directory = directory
+        self.retention = retention
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def register(self, *paths):
+        # Files of renderings in progress are never removed by the janitor
+        with self._lock:
+            self._active.update(os.path.abspath(path) for path in paths if path)
+
+    def release(self, *paths, succeeded=True):
+        paths = [path for path in paths if path]
+        with self._lock:
+            self._active.difference_update(os.path.abspath(path) for path in paths)
+
+        if self.retention == 'keep' or (self.retention == 'on-failure' and not succeeded):
+            logging.info(f"Keeping rendering artifacts {paths}")
+            return
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def keep(self, *paths):
+        # Files that outlive their rendering regardless of the retention mode, e.g., profiles offered for download
+        with self._lock:
+            self._active.difference_update(os.path.abspath(path) for path in paths if path)
+
+    def sweep(self):
+        now = time()
+        artifacts = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                worker_log_match = WORKER_LOG_FILE_NAME_PATTERN.match(entry.name)
+                if worker_log_match is not None:
+                    # Logs of workers that are still running are written to
+                    if is_process_running(int(worker_log_match.group(1))):
+                        continue
+                elif not ARTIFACT_FILE_NAME_PATTERN.match(entry.name):
+                    continue
+                with self._lock:
+                    if os.path.abspath(entry.path) in self._active:
+                        continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                artifacts.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = 0
+        removed_count = 0
+        removed_bytes = 0
+        # Newest first, everything beyond the byte limit or the retention period goes
+        for mtime, size, path in sorted(artifacts, reverse=True):
+            total_bytes += size
+            if total_bytes > self.max_bytes or now - mtime > self.retention_seconds:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed_count += 1
+                removed_bytes += size
+
+        if removed_count:
+            logging.info(f"Removed {removed_count} rendering artifacts ({removed_bytes} bytes)")
+
+    async def sweep_periodically(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sweep)
+            except OSError:
+                logging.exception(f"Sweeping rendering artifacts in {self.directory} failed")
+            await asyncio.sleep(interval)
@@ -0,0 +1,74 @@
+import os
+import shutil
+import logging
+import threading
+
+# Cycles devices that Blender renders on, see configure_cycles_device in headless-renderer-blender.py
+RENDER_BACKENDS = ['CUDA', 'OPTIX', 'CPU']
+
+
+class CpuCoresUnavailable(Exception):
+    pass
+
+
+def render_backend():
+    backend = os.environ.get('RENDER_BACKEND', 'CUDA').upper()
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"Unknown render backend {backend}, expected one of {RENDER_BACKENDS}")
+    return backend
+
+
+def available_cpu_cores():
+    # Cores this process may run on, which respects the container's cpuset
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_core_topology_key(core):
+    # Orders cores by socket and physical core, so that hyperthreads of a physical core end up in the same slot
+    topology_directory = f"/sys/devices/system/cpu/cpu{core}/topology"
+    try:
+        with open(f"{topology_directory}/physical_package_id") as f:
+            package_id = int(f.read())
+        with open(f"{topology_directory}/core_id") as f:
+            core_id = int(f.read())
+    except (OSError, ValueError):
+        return (0, core, core)
+    return (package_id, core_id, core)
+
+
+class CpuCoreScheduler:
+    # Splits the cores into disjoint slots of threads_per_job cores each; every Blender process rendering on the CPU holds one slot,
+    # so that concurrent renderings do not oversubscribe the cores and, with pinning, do not migrate between each other's cores
+    def __init__(self, cores, threads_per_job, pin=True):
+        cores = sorted(cores, key=cpu_core_topology_key)
+        self.threads_per_job = max(1, min(threads_per_job, len(cores)))
+        self.slots = [cores[index:index + self.threads_per_job] for index in range(0, len(cores) - self.threads_per_job + 1, self.threads_per_job)]
+        self.pin = pin and shutil.which('taskset') is not None
+        if pin and not self.pin:
+            logging.warning(f"Not pinning Blender processes to their CPU cores, taskset (util-linux) is not installed")
+        self._free_slots = list(self.slots)
+        self._condition = threading.Condition()
+        logging.info(f"Splitting {len(cores)} CPU cores into {len(self.slots)} slots of {self.threads_per_job} threads" + (", pinned" if self.pin else ""))
+
+    @property
+    def free_slots(self):
+        return len(self._free_slots)
+
+    def acquire(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._free_slots, timeout):
+                raise CpuCoresUnavailable(f"No CPU cores became available within {timeout}s")
+            return self._free_slots.pop(0)
+
+    def release(self, cores):
+        with self._condition:
+            if cores in self.slots and cores not in self._free_slots:
+                self._free_slots.append(cores)
+                self._condition.notify()
+
+    def command_prefix(self, cores):
+        # Pins the Blender process before it starts, so that all its threads inherit the affinity; taskset execs Blender, as
+        # setting the affinity in a preexec_fn between fork and exec can deadlock the threaded server
+        return ['taskset', '-c', ','.join(f"{core}" for core in cores)] if self.pin and cores else []
@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import asyncio
+import logging
+import threading
+
+from collections import OrderedDict
+from time import time
+
+
+def renderer_version(files, settings=None):
+    # Any change to the Blender script, the modules and data it uses, or the settings Blender starts with may change the rendered
+    # images, so it invalidates all cached renderings
+    digest = hashlib.sha256(json.dumps(settings or {}, sort_keys=True).encode('utf-8'))
+    for path in files:
+        digest.update(f"\n{os.path.basename(path)}\n".encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def render_cache_key(configuration, version):
+    canonical_configuration = json.dumps(configuration, sort_keys=True, separators=(',', ':'), ensure_ascii=True)
+    return hashlib.sha256(f"{version}\n{canonical_configuration}".encode('utf-8')).hexdigest()
+
+
+class _InFlightRendering:
+    def __init__(self):
+        self.task = None
+        self.cancelled = False
+        self.waiters = 0
+        self.start_listeners = []
+        self.event_listeners = []
+
+    def on_start(self):
+        for listener in self.start_listeners:
+            listener()
+
+    def on_event(self, event):
+        for listener in self.event_listeners:
+            listener(event)
+
+
+class RenderCache:
+    def __init__(self, directory, memory_max_bytes, disk_max_bytes, disk_max_age_seconds):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_age_seconds = disk_max_age_seconds
+
+        # get() and put() run on executor threads
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._in_flight = {}
+
+        if self.disk_max_bytes > 0:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                return png
+
+        if self.disk_max_bytes <= 0:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time() - os.path.getmtime(path) > self.disk_max_age_seconds:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                png = f.read()
+            # Entries expire and are evicted by the time they were last used
+            os.utime(path)
+        except OSError:
+            return None
+        self._put_memory(key, png)
+        return png
+
+    def put(self, key, png):
+        self._put_memory(key, png)
+
+        if self.disk_max_bytes <= 0:
+            return
+        path = self._disk_path(key)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(png)
+        os.replace(f"{path}.tmp", path)
+        self.prune_disk()
+
+    def prune_disk(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        now = time()
+        total_bytes = 0
+        # Newest first, everything beyond the byte limit or the age limit goes
+        for mtime, size, path in sorted(entries, reverse=True):
+            total_bytes += size
+            if total_bytes > self.disk_max_bytes or now - mtime > self.disk_max_age_seconds:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    async def get_or_render(self, key, render, on_start=None, on_event=None, use_cached=True):
+        # render(on_start, on_event) renders the image and returns the PNG; without use_cached, the image is rendered even if it is
+        # cached or in flight, e.g., to profile its rendering, and stored for others
+        loop = asyncio.get_running_loop()
+
+        if use_cached:
+            png = await loop.run_in_executor(None, self.get, key)
+            if png is not None:
+                logging.info(f"Serving rendering {key} from the cache")
+                return png
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is None or in_flight.cancelled or not use_cached:
+            in_flight = _InFlightRendering()
+            in_flight.task = asyncio.ensure_future(self._render_and_store(key, render, in_flight))
+            self._in_flight[key] = in_flight
+        else:
+            logging.info(f"Joining the identical rendering {key} that is already in flight")
+
+        if on_start:
+            in_flight.start_listeners.append(on_start)
+        if on_event:
+            in_flight.event_listeners.append(on_event)
+        in_flight.waiters += 1
+        try:
+            return await asyncio.shield(in_flight.task)
+        finally:
+            in_flight.waiters -= 1
+            if on_start:
+                in_flight.start_listeners.remove(on_start)
+            if on_event:
+                in_flight.event_listeners.remove(on_event)
+            # The rendering is only abandoned once nobody waits for it anymore
+            if in_flight.waiters == 0 and not in_flight.task.done():
+                in_flight.cancelled = True
+                in_flight.task.cancel()
+
+    async def _render_and_store(self, key, render, in_flight):
+        loop = asyncio.get_running_loop()
+        try:
+            png = await render(in_flight.on_start, in_flight.on_event)
+            await loop.run_in_executor(None, self.put, key, png)
+            return png
+        finally:
+            if self._in_flight.get(key) is in_flight:
+                del self._in_flight[key]
+
+    def _put_memory(self, key, png):
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key))
+            if len(png) > self.memory_max_bytes:
+                return
+            self._memory[key] = png
+            self._memory_bytes += len(png)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted_png = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted_png)
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
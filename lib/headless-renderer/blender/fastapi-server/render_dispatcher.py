@@ -0,0 +1,249 @@
+# Dispatcher mode: instead of rendering with its own Blender, the server forwards renderings to a set of render backends (other
+# instances of this server, e.g., one per GPU) as binary scene payloads, to the backend that would finish them first. A rendering's
+# cost is estimated from its points, scene elements, and resolution (see render_cost in render_admission.py), and each backend's
+# throughput (cost per second) is learned from its renderings.
+
+import os
+import json
+import socket
+import asyncio
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection, HTTPException as HTTPClientException
+from time import perf_counter, monotonic
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException
+
+# Responses after which a rendering is retried on another backend: the backend is busy, or is restarting or unreachable behind a
+# proxy. A 500 is not, as it is usually Blender failing on the scene, which it would on every backend.
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+def parse_server_timing(header):
+    # Inverse of server_timing_header in run_server.py, durations in seconds
+    timings = {}
+    for metric in (header or '').split(','):
+        name, _, parameters = metric.strip().partition(';')
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.strip().partition('=')
+            if key == 'dur':
+                try:
+                    timings[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return timings
+
+
+class RenderBackendError(Exception):
+    def __init__(self, message, status_code=None, detail=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class BackendConnection:
+    # A connection to a backend that another thread can abort, so that the backend sees its client disconnect and cancels the
+    # rendering, instead of rendering an image that nobody waits for
+    def __init__(self, backend, connect_timeout):
+        self.connection = backend.connection_class(backend.host, timeout=connect_timeout, blocksize=2 ** 16)
+        self.sock = None
+        self.aborted = False
+        self._lock = threading.Lock()
+
+    def connect(self, timeout):
+        self.connection.connect()
+        # From here on, the timeout is for the upload and the rendering
+        self.connection.sock.settimeout(timeout)
+        with self._lock:
+            self.sock = self.connection.sock
+            if self.aborted:
+                raise ConnectionAbortedError("The dispatch was cancelled")
+
+    def abort(self):
+        # Called from the event loop, so it must not wait for the connection
+        with self._lock:
+            self.aborted = True
+            sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        self.connection.close()
+
+
+class DispatchBackend:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        parts = urlsplit(self.url)
+        self.connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        self.host = parts.netloc
+        self.path = parts.path
+
+        self.in_flight = 0
+        self.in_flight_cost = 0
+        self.rendered = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.unavailable_until = 0.0
+        # Exponentially weighted moving average of the cost rendered per second, None until a rendering succeeded
+        self.cost_per_second = None
+
+    def is_available(self, now):
+        return now >= self.unavailable_until
+
+    def to_dict(self, now):
+        return {
+            'url': self.url,
+            'available': self.is_available(now),
+            'in_flight': self.in_flight,
+            'in_flight_cost': self.in_flight_cost,
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'cost_per_second': self.cost_per_second,
+        }
+
+
+class RenderDispatcher:
+    def __init__(self, backend_urls, max_attempts=3, connect_timeout=5.0, render_timeout=600.0, failure_cooldown_seconds=10.0, throughput_smoothing=0.2):
+        self.backends = [DispatchBackend(url) for url in backend_urls]
+        self.max_attempts = max_attempts
+        self.connect_timeout = connect_timeout
+        self.render_timeout = render_timeout
+        # A failed backend gets no renderings for this long, doubled with each further failure in a row
+        self.failure_cooldown_seconds = failure_cooldown_seconds
+        self.throughput_smoothing = throughput_smoothing
+        # Requests to backends block until their image is rendered, so they run on threads, and are aborted from the event loop
+        self._executor = ThreadPoolExecutor(max_workers=max(8 * len(self.backends), 8), thread_name_prefix='render-dispatcher')
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        return sum(backend.in_flight for backend in self.backends)
+
+    def estimated_seconds(self, backend, cost, default_cost_per_second):
+        # Until the rendering would finish on this backend, i.e., its renderings in flight and this one at its throughput
+        return (backend.in_flight_cost + cost) / (backend.cost_per_second or default_cost_per_second)
+
+    def choose_backend(self, cost, excluded):
+        # Backends that did not render yet are assumed to be as fast as the median of the others, or all the same if none did
+        with self._lock:
+            now = monotonic()
+            candidates = [backend for backend in self.backends if backend not in excluded]
+            available = [backend for backend in candidates if backend.is_available(now)]
+            # If all are cooling down after failures, trying one of them beats failing right away
+            candidates = available or candidates
+            if not candidates:
+                return None
+            throughputs = sorted(backend.cost_per_second for backend in self.backends if backend.cost_per_second)
+            default_cost_per_second = throughputs[len(throughputs) // 2] if throughputs else 1.0
+            backend = min(candidates, key=lambda backend: (self.estimated_seconds(backend, cost, default_cost_per_second), backend.in_flight))
+            backend.in_flight += 1
+            backend.in_flight_cost += cost
+            return backend
+
+    def finish(self, backend, cost, failed=False, seconds=None):
+        # seconds that the backend spent rendering update its throughput
+        with self._lock:
+            backend.in_flight -= 1
+            backend.in_flight_cost -= cost
+            if failed:
+                backend.failed += 1
+                backend.consecutive_failures += 1
+                cooldown_seconds = self.failure_cooldown_seconds * 2 ** min(backend.consecutive_failures - 1, 6)
+                backend.unavailable_until = monotonic() + cooldown_seconds
+                return
+            backend.consecutive_failures = 0
+            backend.unavailable_until = 0.0
+            if seconds is None:
+                return
+            backend.rendered += 1
+            cost_per_second = cost / max(seconds, 1e-3)
+            if backend.cost_per_second is None:
+                backend.cost_per_second = cost_per_second
+            else:
+                backend.cost_per_second += self.throughput_smoothing * (cost_per_second - backend.cost_per_second)
+
+    def post_scene_payload(self, backend, cost, scene_payload_file, headers, connection):
+        # Runs on the executor, streams the scene payload from its file and blocks until the backend responded with the image or
+        # the connection was aborted
+        t_start = perf_counter()
+        failed = False
+        throughput_seconds = None
+        try:
+            with open(scene_payload_file, 'rb') as f:
+                try:
+                    connection.connect(self.render_timeout)
+                    connection.connection.request('POST', f"{backend.path}/renderings/", body=f, headers={
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Length': str(os.fstat(f.fileno()).st_size),
+                        **headers,
+                    })
+                    response = connection.connection.getresponse()
+                    content = response.read()
+                except (OSError, HTTPClientException) as error:
+                    # A cancelled dispatch says nothing about the backend
+                    failed = not connection.aborted
+                    raise RenderBackendError(f"Render backend {backend.url} failed: {error!r}")
+                finally:
+                    connection.close()
+            seconds = perf_counter() - t_start
+
+            if response.status != 200:
+                # Other errors (e.g., 400, 413, 422, 500) are the request's, which would fail on every backend
+                failed = response.status in RETRYABLE_STATUS_CODES
+                try:
+                    detail = json.loads(content).get('detail')
+                except (ValueError, AttributeError):
+                    detail = content.decode('utf-8', errors='replace')
+                raise RenderBackendError(f"Render backend {backend.url} responded with {response.status}: {detail}", status_code=response.status, detail=detail)
+
+            timings = parse_server_timing(response.getheader('server-timing'))
+            # Images from the backend's cache say nothing about its throughput
+            if 'blender' in timings:
+                throughput_seconds = seconds
+            return content, timings, seconds
+        finally:
+            self.finish(backend, cost, failed=failed, seconds=throughput_seconds)
+
+    async def dispatch(self, scene_payload_file, cost, headers=None):
+        # Returns the PNG, the backend's timings, and the dispatch stage (the attempts until one succeeded)
+        loop = asyncio.get_running_loop()
+
+        t_dispatch_start = perf_counter()
+        tried = []
+        while len(tried) < self.max_attempts:
+            backend = self.choose_backend(cost, tried)
+            if backend is None:
+                break
+            tried.append(backend)
+            logging.info(f"Dispatching rendering of cost {cost} to {backend.url} ({backend.in_flight} in flight), attempt {len(tried)}")
+            connection = BackendConnection(backend, self.connect_timeout)
+            try:
+                png, timings, seconds = await loop.run_in_executor(self._executor, self.post_scene_payload, backend, cost, scene_payload_file, headers or {}, connection)
+            except asyncio.CancelledError:
+                # Closing the connection makes the backend cancel the rendering, and releases the backend once its thread returns
+                logging.info(f"Dispatch to {backend.url} cancelled, closing the connection")
+                connection.abort()
+                raise
+            except RenderBackendError as error:
+                if error.status_code is not None and error.status_code not in RETRYABLE_STATUS_CODES:
+                    raise HTTPException(status_code=error.status_code, detail=error.detail)
+                logging.warning(f"{error}, {'retrying on another backend' if len(tried) < self.max_attempts else 'giving up'}")
+                continue
+            logging.info(f"Render backend {backend.url} rendered in {seconds:.2f}s, after {len(tried)} attempts")
+            # All attempts, including the backend's own stages, which its Server-Timing header reported
+            timings['dispatch'] = perf_counter() - t_dispatch_start
+            return png, timings
+
+        raise HTTPException(status_code=503, detail=f"No render backend rendered the scene after {len(tried)} attempts, try again later")
+
+    def to_dict(self):
+        now = monotonic()
+        with self._lock:
+            return {'backends': [backend.to_dict(now) for backend in self.backends]}
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import uuid
+
+from time import time, monotonic
+
+from fastapi import HTTPException
+
+
+class RenderJob:
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.result = None
+        self.etag = None
+        self.status = 'queued'
+        self.stage = None
+        self.progress = 0.0
+        self.error = None
+        self.created_at = time()
+        self.started_at = None
+        self.finished_at = None
+        self.last_polled_at = monotonic()
+        # Requests waiting for the result, the job is not abandoned while there are any
+        self.waiters = 0
+        self.task = None
+        # Stage timings and the cProfile statistics of the rendering, reported by its 'timings' event
+        self.timings = {}
+        self.profile_id = None
+
+    @property
+    def is_finished(self):
+        return self.status in ['succeeded', 'failed', 'cancelled']
+
+    def mark_running(self):
+        self.status = 'running'
+        self.started_at = time()
+
+    def on_event(self, event):
+        if event.get('type') == 'progress':
+            self.stage = event['stage']
+            self.progress = event['progress']
+        elif event.get('type') == 'timings':
+            self.timings.update(event['timings'])
+            self.profile_id = event.get('profile_id')
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'timings': self.timings,
+            'profile_url': f"/profiles/{self.profile_id}" if self.profile_id else None,
+        }
+
+
+class RenderJobRegistry:
+    def __init__(self, abandon_after_seconds=60, keep_finished_seconds=600):
+        self.abandon_after_seconds = abandon_after_seconds
+        self.keep_finished_seconds = keep_finished_seconds
+        self._jobs = {}
+
+    def submit(self, run):
+        # run(render_job) is awaited in a background task, it sets render_job.result and reports progress through render_job.on_event
+        render_job = RenderJob()
+        render_job.task = asyncio.ensure_future(self._run(render_job, run))
+        self._jobs[render_job.id] = render_job
+        return render_job
+
+    def get(self, job_id):
+        render_job = self._jobs.get(job_id)
+        if render_job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown rendering job {job_id}")
+        render_job.last_polled_at = monotonic()
+        return render_job
+
+    def cancel(self, job_id):
+        render_job = self.get(job_id)
+        if not render_job.is_finished:
+            render_job.task.cancel()
+        return render_job
+
+    async def wait(self, render_job):
+        render_job.waiters += 1
+        try:
+            await asyncio.wait({render_job.task})
+        finally:
+            render_job.waiters -= 1
+            render_job.last_polled_at = monotonic()
+
+    def expire(self):
+        now = monotonic()
+        for render_job in list(self._jobs.values()):
+            idle_seconds = now - render_job.last_polled_at
+            if not render_job.is_finished and not render_job.waiters and idle_seconds > self.abandon_after_seconds:
+                logging.info(f"Cancelling rendering job {render_job.id}, it was not polled for {idle_seconds:.0f}s")
+                render_job.task.cancel()
+            elif render_job.is_finished and idle_seconds > self.keep_finished_seconds:
+                del self._jobs[render_job.id]
+
+    async def expire_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.expire()
+
+    async def _run(self, render_job, run):
+        try:
+            await run(render_job)
+            render_job.status = 'succeeded'
+            render_job.progress = 1.0
+        except asyncio.CancelledError:
+            render_job.status = 'cancelled'
+            logging.info(f"Rendering job {render_job.id} was cancelled")
+        except HTTPException as error:
+            render_job.status = 'failed'
+            render_job.error = error.detail
+        except Exception as error:
+            logging.exception(f"Rendering job {render_job.id} failed")
+            render_job.status = 'failed'
+            render_job.error = f"{error}"
+        finally:
+            render_job.finished_at = time()
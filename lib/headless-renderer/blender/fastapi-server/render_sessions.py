@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import threading
+import uuid
+
+from functools import partial
+
+from time import time, monotonic
+
+from fastapi import HTTPException
+
+from blender_worker_pool import BlenderWorker, BlenderWorkerError, BlenderWorkerCancelled
+
+
+class RenderSessionClosed(BlenderWorkerError):
+    pass
+
+
+def process_memory_bytes(pid):
+    # Resident set size of a process, or None where /proc is not available
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RenderSession:
+    def __init__(self, worker):
+        self.id = str(uuid.uuid4())
+        # Keeps the session's scene between renderings, so it is never shared with other sessions or the worker pool
+        self.worker = worker
+        self.created_at = time()
+        self.last_used_at = monotonic()
+        self.renderings = 0
+        self.scene_element_ids = []
+        self.memory_bytes = None
+        self.closed = False
+        # Renderings of a session run one after another, as each one builds on the scene of the previous one
+        self.lock = asyncio.Lock()
+
+    def to_dict(self, idle_seconds):
+        return {
+            'session_id': self.id,
+            'created_at': self.created_at,
+            'renderings': self.renderings,
+            'scene_element_ids': self.scene_element_ids,
+            'memory_bytes': self.memory_bytes,
+            'expires_in_seconds': max(0.0, idle_seconds - (monotonic() - self.last_used_at)),
+        }
+
+
+class RenderSessionRegistry:
+    def __init__(self, max_sessions=2, idle_seconds=300, max_memory_bytes=8 * 2 ** 30, startup_timeout=120, render_timeout=600, cpu_scheduler=None):
+        self.max_sessions = max_sessions
+        # Session workers rendering on the CPU take a slot of cores like pool workers, see render_backend.py
+        self.cpu_scheduler = cpu_scheduler
+        self.idle_seconds = idle_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self.startup_timeout = startup_timeout
+        self.render_timeout = render_timeout
+        self._sessions = {}
+        # Counts sessions whose worker is still starting, so that concurrent requests cannot exceed max_sessions
+        self._starting = 0
+
+    async def create(self):
+        if len(self._sessions) + self._starting >= self.max_sessions:
+            raise HTTPException(status_code=503, detail=f"All {self.max_sessions} rendering sessions are in use, try again later")
+        if self.cpu_scheduler is not None and self.cpu_scheduler.free_slots == 0:
+            raise HTTPException(status_code=503, detail="All CPU cores are in use by other Blender processes, try again later")
+
+        worker = BlenderWorker(f"session-{len(self._sessions) + self._starting}", cpu_scheduler=self.cpu_scheduler)
+        self._starting += 1
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, worker.start, self.startup_timeout)
+        except (BlenderWorkerError, OSError, EOFError) as error:
+            worker.kill()
+            raise HTTPException(status_code=500, detail=f"Starting the session's Blender worker failed: {error}")
+        finally:
+            self._starting -= 1
+
+        session = RenderSession(worker)
+        worker.index = f"session-{session.id}"
+        self._sessions[session.id] = session
+        logging.info(f"Started rendering session {session.id} (Blender pid {worker.process.pid})")
+        return session
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired rendering session {session_id}")
+        session.last_used_at = monotonic()
+        return session
+
+    def render(self, session, job, on_event=None, cancel_event=None):
+        # Called from an executor thread while the caller holds session.lock
+        if session.closed:
+            raise RenderSessionClosed(f"Rendering session {session.id} was closed")
+        try:
+            result = session.worker.render(job, self.render_timeout, on_event=on_event, cancel_event=cancel_event)
+        except (BlenderWorkerError, OSError, EOFError) as error:
+            if session.closed:
+                # Closed (and its worker killed) while rendering, e.g., by DELETE or for its memory
+                raise RenderSessionClosed(f"Rendering session {session.id} was closed while rendering")
+            # Cancelled, crashed, or failed renderings leave the session's scene in an unknown state
+            if isinstance(error, BlenderWorkerCancelled):
+                logging.info(f"Closing rendering session {session.id} to cancel its rendering")
+            else:
+                logging.warning(f"Closing rendering session {session.id} after its rendering failed: {error!r}")
+            # Killing the worker is the only way to stop Cycles right away
+            self._close(session, kill=True)
+            if isinstance(error, BlenderWorkerError):
+                raise
+            raise BlenderWorkerError(f"Worker of rendering session {session.id} crashed")
+
+        session.renderings += 1
+        session.last_used_at = monotonic()
+        session.scene_element_ids = (result.get('session') or {}).get('scene_element_ids', [])
+        session.memory_bytes = process_memory_bytes(session.worker.process.pid)
+        if session.memory_bytes is not None and session.memory_bytes > self.max_memory_bytes:
+            logging.warning(f"Closing rendering session {session.id}, its Blender worker uses {session.memory_bytes} bytes")
+            self._close(session)
+        return result
+
+    async def close(self, session_id):
+        session = self.get(session_id)
+        # A rendering in progress is aborted, as it would only update a scene that is discarded
+        await asyncio.get_running_loop().run_in_executor(None, partial(self._close, session, kill=session.lock.locked()))
+        return session
+
+    def close_all(self):
+        for session in list(self._sessions.values()):
+            self._close(session)
+
+    def expire(self):
+        now = monotonic()
+        for session in list(self._sessions.values()):
+            idle_seconds = now - session.last_used_at
+            if idle_seconds > self.idle_seconds and not session.lock.locked():
+                logging.info(f"Closing rendering session {session.id}, it was not used for {idle_seconds:.0f}s")
+                # Stopping the worker may take a moment, it must not block the event loop
+                session.closed = True
+                self._sessions.pop(session.id, None)
+                threading.Thread(target=session.worker.stop, daemon=True).start()
+
+    async def expire_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.expire()
+
+    def _close(self, session, kill=False):
+        session.closed = True
+        self._sessions.pop(session.id, None)
+        if kill:
+            session.worker.kill()
+        else:
+            session.worker.stop()
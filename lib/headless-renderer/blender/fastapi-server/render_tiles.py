@@ -0,0 +1,115 @@
+# Tiled renderings split the image into a grid of regions, which Blender processes render in parallel with Cycles' border
+# rendering (cropped to the border) into uncompressed TGA files; the server stitches them and encodes the PNG itself.
+
+import math
+import zlib
+import struct
+
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Color types of 8-bit PNGs by number of channels
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+class TileImageError(ValueError):
+    pass
+
+
+def auto_tile_count(width, height, available_workers, min_tile_pixels, max_tiles):
+    # As many tiles as there are idle workers, but none smaller than min_tile_pixels, for which building the scene once more
+    # would cost more than rendering the tile saves
+    return max(1, min(available_workers, max_tiles, (width * height) // min_tile_pixels))
+
+
+def tile_grid(width, height, count):
+    # Splits the image into columns x rows == count tiles that are as square as possible; pixel co-ordinates, origin at the top left
+    count = max(1, min(count, width * height))
+    columns, rows = min(
+        ((columns, count // columns) for columns in range(1, count + 1) if count % columns == 0 and columns <= width and count // columns <= height),
+        key=lambda grid: abs(math.log((width / grid[0]) / (height / grid[1]))),
+        default=(1, 1),
+    )
+    x_edges = [round(column * width / columns) for column in range(columns + 1)]
+    y_edges = [round(row * height / rows) for row in range(rows + 1)]
+    return [
+        {'x': x_edges[column], 'y': y_edges[row], 'width': x_edges[column + 1] - x_edges[column], 'height': y_edges[row + 1] - y_edges[row]}
+        for row in range(rows)
+        for column in range(columns)
+    ]
+
+
+def blender_render_region(tile, width, height):
+    # Blender's border is relative to the image size with its origin at the bottom left, and Blender converts border * size to
+    # whole pixels -- a quarter pixel more keeps float errors from moving an edge by one pixel, whether it truncates or rounds
+    return {
+        'min_x': min(1.0, (tile['x'] + 0.25) / width),
+        'max_x': min(1.0, (tile['x'] + tile['width'] + 0.25) / width),
+        'min_y': min(1.0, (height - tile['y'] - tile['height'] + 0.25) / height),
+        'max_y': min(1.0, (height - tile['y'] + 0.25) / height),
+    }
+
+
+def read_targa(data):
+    # Uncompressed true-color or grayscale TGA, as Blender writes with TARGA_RAW, into a (height, width, channels) array of RGB(A)
+    # rows from top to bottom
+    if len(data) < 18:
+        raise TileImageError("TGA file is truncated")
+    id_length, color_map_type, image_type = data[0], data[1], data[2]
+    width, height, bits_per_pixel, descriptor = struct.unpack_from('<HHBB', data, 12)
+    if color_map_type != 0 or image_type not in (2, 3):
+        raise TileImageError(f"Only uncompressed true-color and grayscale TGA files are supported, not image type {image_type}")
+    channels = bits_per_pixel // 8
+    if channels not in (1, 3, 4) or bits_per_pixel % 8 != 0:
+        raise TileImageError(f"Unsupported TGA pixel depth of {bits_per_pixel} bits")
+
+    offset = 18 + id_length
+    size = width * height * channels
+    if len(data) < offset + size:
+        raise TileImageError("TGA file is truncated")
+    pixels = np.frombuffer(data, dtype=np.uint8, count=size, offset=offset).reshape(height, width, channels)
+
+    if channels >= 3:
+        # BGR(A) to RGB(A)
+        pixels = pixels[:, :, [2, 1, 0, 3][:channels]]
+    if not descriptor & 0x20:
+        pixels = pixels[::-1]
+    if descriptor & 0x10:
+        pixels = pixels[:, ::-1]
+    return pixels
+
+
+def stitch_tiles(tiles, images, width, height):
+    # All tiles are written with the same image settings, and so have the same channels
+    channels = images[0].shape[2]
+    pixels = np.empty((height, width, channels), dtype=np.uint8)
+    for tile, image in zip(tiles, images):
+        if image.shape != (tile['height'], tile['width'], channels):
+            raise TileImageError(f"Tile at {tile['x']},{tile['y']} has shape {image.shape} instead of {(tile['height'], tile['width'], channels)}")
+        pixels[tile['y']:tile['y'] + tile['height'], tile['x']:tile['x'] + tile['width']] = image
+    return pixels
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+
+def encode_png(pixels, compression_level=3):
+    # 8-bit PNG with the Up filter on all rows, which numpy computes at once; lower compression levels trade size for latency
+    height, width, channels = pixels.shape
+    rows = pixels.reshape(height, width * channels)
+    filtered = np.empty((height, width * channels + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    filtered[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+    header = struct.pack('>IIBBBBB', width, height, 8, PNG_COLOR_TYPES[channels], 0, 0, 0)
+    return PNG_SIGNATURE + _png_chunk(b'IHDR', header) + _png_chunk(b'IDAT', zlib.compress(filtered.tobytes(), compression_level)) + _png_chunk(b'IEND', b'')
+
+
+def stitch_tile_files(tiles, paths, width, height):
+    # Returns the PNG of the whole image
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(read_targa(f.read()))
+    return encode_png(stitch_tiles(tiles, images, width, height))
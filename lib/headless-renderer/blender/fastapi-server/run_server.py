@@ -1,25 +1,63 @@
 import os
-from typing import Optional, List
-
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from typing import Optional, List, Dict, Literal, Union
 
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, FileResponse, StreamingResponse
 from starlette.background import BackgroundTask
 
-from time import perf_counter
+from time import perf_counter, time, monotonic
 import logging
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError, confloat, conint
 
+import glob
 import json
+import hashlib
 
 import uuid
 
-import subprocess
+import asyncio
 import threading
+import queue
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from blender_worker_pool import BlenderWorkerPool, BlenderWorkerError, BlenderWorkerUnavailable, BLENDER_SCRIPT_FILE, BLENDER_FAST_START_SCENE_FILE, BLENDER_FAST_START_SCRIPT_FILE, blender_args, blender_env, blender_startup_profile, create_fast_start_scene_file
+from render_admission import RenderAdmissionController, render_cost
+from render_backend import CpuCoreScheduler, CpuCoresUnavailable, available_cpu_cores, render_backend
+from render_jobs import RenderJobRegistry
+from render_sessions import RenderSessionClosed, RenderSessionRegistry
+from render_cache import RenderCache, render_cache_key, renderer_version
+from render_artifacts import RenderArtifactJanitor
+from render_dispatcher import RenderDispatcher
+from render_tiles import auto_tile_count, tile_grid, blender_render_region, stitch_tile_files
+from render_metrics import MetricsRegistry, POINT_COUNT_BUCKETS, PROMETHEUS_CONTENT_TYPE
+from scene_colormaps import COLORMAP_PRESETS_DIRECTORY, ColormapError, validate_scene_colormaps
+from scene_payload import ScenePayloadError, read_scene_payload_index
+from streaming_scene_parser import SceneStreamError, parse_scene_stream
 
 Vector = List[float]
 
+# See scene_decimation.py, points and lines are only reduced if a request sets level_of_detail
+class LevelOfDetailConfiguration(BaseModel):
+    point_cell_size_pixels: Optional[confloat(gt=0)] = 1.0
+    point_reduction: Optional[Literal['nearest', 'merge']] = 'nearest'
+    line_tolerance_pixels: Optional[confloat(ge=0)] = 0.5
+
+# One camera of a batch rendering, unset properties are taken from the request
+class RenderViewConfiguration(BaseModel):
+    camera_eye: Optional[Vector] = None
+    camera_center: Optional[Vector] = None
+    camera_fov_y_degrees: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+# One pass of a progressive rendering, at a fraction of the requested resolution
+class RenderPassConfiguration(BaseModel):
+    scale: confloat(gt=0, le=1) = 1.0
+    samples: conint(ge=1)
+    denoise: Optional[bool] = False
+
 class SceneRenderConfiguration(BaseModel):
     camera_eye: Vector
     camera_center: Vector
@@ -27,69 +65,1061 @@ class SceneRenderConfiguration(BaseModel):
     scene_elements: Optional[List[object]]
     width: Optional[int] = 300
     height: Optional[int] = 200
+    level_of_detail: Optional[LevelOfDetailConfiguration] = None
+    # Per primitive type (e.g., "point-primitive"), see POINT_REPRESENTATIONS in headless-renderer-blender.py
+    point_representation: Optional[Dict[str, Literal['realized', 'instanced', 'point-cloud']]] = None
+    # Runs the Blender script under cProfile and offers its statistics for download
+    profile: Optional[bool] = False
+    # Only used by progressive renderings, see PROGRESSIVE_RENDER_PASSES
+    render_passes: Optional[List[RenderPassConfiguration]] = None
+    time_budget_seconds: Optional[float] = None
+    # Only used by batch renderings
+    views: Optional[List[RenderViewConfiguration]] = None
+    # Only used by session renderings: scene elements to remove from the session's scene, or whether scene_elements replace it
+    removed_scene_element_ids: Optional[List[Union[str, int]]] = None
+    replace_scene_elements: Optional[bool] = False
+    # Renders the image in this many tiles in parallel, or as many as idle workers and the resolution allow with 'auto'
+    tiles: Optional[Union[Literal['auto'], conint(ge=1)]] = None
+
+# The Blender script and what it renders with, see renderer_version in render_cache.py; the colormap presets are added to them
+RENDERER_FILES = [BLENDER_SCRIPT_FILE, BLENDER_FAST_START_SCRIPT_FILE, 'scene_arrays.py', 'scene_colormaps.py', 'scene_decimation.py', 'scene_payload.py']
+
+# Properties that only apply to progressive, batch, and session renderings, or do not change the image, which are not cached
+UNCACHED_CONFIGURATION_PROPERTIES = {'render_passes', 'time_budget_seconds', 'views', 'removed_scene_element_ids', 'replace_scene_elements', 'tiles', 'profile'}
+
+# Configured once for the whole server, either into RENDER_LOG_FILE or to stderr
+logging.basicConfig(filename=os.environ.get('RENDER_LOG_FILE') or None, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
 app = FastAPI()
 
+# Keeps long-lived Blender processes with the default scene loaded, 0 starts a new Blender process per rendering
+blender_worker_pool_size = int(os.environ.get('BLENDER_WORKER_POOL_SIZE', '0'))
+blender_worker_pool = None
+# 'default' or 'fast', see blender_startup_profile in blender_worker_pool.py
+blender_startup_profile_name = blender_startup_profile()
 
-@app.post("/renderings/")
-async def create_rendering(config: SceneRenderConfiguration):
+render_admission = RenderAdmissionController(
+    max_concurrent=int(os.environ.get('RENDER_MAX_CONCURRENT', f"{max(blender_worker_pool_size, 1)}")),
+    max_queue_depth=int(os.environ.get('RENDER_MAX_QUEUE_DEPTH', '16')),
+    max_queue_wait_seconds=float(os.environ.get('RENDER_MAX_QUEUE_WAIT_SECONDS', '60')),
+    max_client_queue_depth=int(os.environ.get('RENDER_MAX_CLIENT_QUEUE_DEPTH', '0')) or None,
+    starvation_seconds=float(os.environ.get('RENDER_SCHEDULER_STARVATION_SECONDS', '20')),
+    fairness_half_life_seconds=float(os.environ.get('RENDER_SCHEDULER_FAIRNESS_HALF_LIFE_SECONDS', '60')),
+)
+# Worker pool renders block on their socket, so they run on threads bounded by the admission limit
+render_executor = ThreadPoolExecutor(max_workers=render_admission.max_concurrent)
+
+render_max_sessions = int(os.environ.get('RENDER_MAX_SESSIONS', '2'))
+
+# CUDA, OPTIX, or CPU; on the CPU, concurrent Blender processes split the cores between them instead of each using all of them
+render_backend_name = render_backend()
+render_cpu_scheduler = None
+if render_backend_name == 'CPU':
+    render_cpu_cores = available_cpu_cores()
+    # Pool workers hold their slot for as long as they run, so sessions, whose workers hold one each, get slots of their own
+    render_cpu_slots = render_admission.max_concurrent + render_max_sessions
+    render_cpu_scheduler = CpuCoreScheduler(
+        render_cpu_cores,
+        threads_per_job=int(os.environ.get('RENDER_CPU_THREADS_PER_JOB', f"{max(len(render_cpu_cores) // render_cpu_slots, 1)}")),
+        pin=os.environ.get('RENDER_CPU_AFFINITY', '1') == '1',
+    )
+
+render_jobs = RenderJobRegistry(
+    abandon_after_seconds=float(os.environ.get('RENDER_JOB_ABANDON_SECONDS', '60')),
+    keep_finished_seconds=float(os.environ.get('RENDER_JOB_KEEP_FINISHED_SECONDS', '600')),
+)
+
+# Each session keeps a Blender worker of its own with the session's scene, see render_sessions.py
+render_sessions = RenderSessionRegistry(
+    max_sessions=render_max_sessions,
+    idle_seconds=float(os.environ.get('RENDER_SESSION_IDLE_SECONDS', '300')),
+    max_memory_bytes=int(os.environ.get('RENDER_SESSION_MAX_MEMORY_BYTES', f"{8 * 2 ** 30}")),
+    startup_timeout=float(os.environ.get('BLENDER_WORKER_STARTUP_TIMEOUT', '120')),
+    render_timeout=float(os.environ.get('BLENDER_WORKER_RENDER_TIMEOUT', '600')),
+    cpu_scheduler=render_cpu_scheduler,
+)
+
+render_cache = RenderCache(
+    directory="./blender-temp-data/render-cache",
+    memory_max_bytes=int(os.environ.get('RENDER_CACHE_MEMORY_MAX_BYTES', f"{256 * 2 ** 20}")),
+    disk_max_bytes=int(os.environ.get('RENDER_CACHE_DISK_MAX_BYTES', f"{2 * 2 ** 30}")),
+    disk_max_age_seconds=float(os.environ.get('RENDER_CACHE_DISK_MAX_AGE_SECONDS', f"{24 * 60 * 60}")),
+)
+blender_renderer_version = renderer_version(
+    RENDERER_FILES + sorted(glob.glob(os.path.join(COLORMAP_PRESETS_DIRECTORY, '*.json'))),
+    {'blender_startup_profile': blender_startup_profile_name},
+)
+
+render_artifacts = RenderArtifactJanitor(
+    directory="./blender-temp-data",
+    retention=os.environ.get('RENDER_ARTIFACT_RETENTION', 'on-failure'),
+    retention_seconds=float(os.environ.get('RENDER_ARTIFACT_RETENTION_MINUTES', '60')) * 60,
+    max_bytes=int(os.environ.get('RENDER_ARTIFACT_MAX_BYTES', f"{2 ** 30}")),
+)
+# Saving each scene as .blend file costs seconds for large scenes, so it is only done for debugging
+render_save_blend_file = os.environ.get('RENDER_SAVE_BLEND_FILE', '0') == '1'
+
+# Larger request bodies are rejected with 413, before or while they are received
+render_max_payload_bytes = int(os.environ.get('RENDER_MAX_PAYLOAD_BYTES', f"{1 * 2 ** 30}"))
+# Points of JSON requests are spilled to disk in chunks of this many points while they are parsed
+render_stream_chunk_points = int(os.environ.get('RENDER_STREAM_CHUNK_POINTS', '65536'))
+
+# Views of a single batch rendering, which occupies one rendering slot for all of them
+render_max_batch_views = int(os.environ.get('RENDER_MAX_BATCH_VIEWS', '64'))
+
+# Tiles of a tiled rendering, each of which occupies a rendering slot and builds the whole scene
+render_max_tiles = int(os.environ.get('RENDER_MAX_TILES', '16'))
+render_tile_min_pixels = int(os.environ.get('RENDER_TILE_MIN_PIXELS', f"{512 * 512}"))
+
+# Dispatcher mode: renderings are forwarded to the least-loaded of these render servers (comma-separated base URLs) instead of
+# rendered with this server's Blender, see render_dispatcher.py
+render_dispatcher_backends = [url.strip() for url in os.environ.get('RENDER_DISPATCHER_BACKENDS', '').split(',') if url.strip()]
+render_dispatcher = None
+if render_dispatcher_backends:
+    render_dispatcher = RenderDispatcher(
+        render_dispatcher_backends,
+        max_attempts=int(os.environ.get('RENDER_DISPATCHER_MAX_ATTEMPTS', f"{min(len(render_dispatcher_backends), 3)}")),
+        render_timeout=float(os.environ.get('RENDER_DISPATCHER_TIMEOUT_SECONDS', '600')),
+        failure_cooldown_seconds=float(os.environ.get('RENDER_DISPATCHER_FAILURE_COOLDOWN_SECONDS', '10')),
+    )
+
+# Prefix of the Blender script's stdout lines that carry progress events, see headless-renderer-blender.py
+BLENDER_EVENT_LINE_PREFIX = b'DATACANVAS-EVENT '
+
+metrics = MetricsRegistry()
+render_stage_seconds = metrics.histogram('datacanvas_render_stage_seconds', "Duration of the stages of rendering requests", ['stage'])
+scene_element_build_seconds = metrics.histogram('datacanvas_scene_element_build_seconds', "Duration of adding the scene elements of a type to the Blender scene", ['type'])
+blender_worker_startup_seconds = metrics.histogram('datacanvas_blender_worker_startup_seconds', "Duration of starting a Blender worker until it is ready")
+renderings_total = metrics.counter('datacanvas_renderings_total', "Rendering requests by outcome", ['outcome'])
+request_points_total = metrics.counter('datacanvas_request_points_total', "Points received in rendering requests")
+request_points = metrics.histogram('datacanvas_request_points', "Points per rendering request", buckets=POINT_COUNT_BUCKETS)
+metrics.gauge('datacanvas_render_queue_depth', "Renderings waiting for a free slot", function=lambda: render_admission.queue_depth)
+metrics.gauge('datacanvas_render_in_flight', "Renderings in progress", function=lambda: render_admission.in_flight)
+metrics.gauge('datacanvas_render_queued_clients', "Clients with renderings waiting for a free slot", function=lambda: sum(1 for client in render_admission.clients.values() if client.queued))
+if render_dispatcher is not None:
+    metrics.gauge('datacanvas_dispatcher_in_flight', "Renderings forwarded to render backends and not answered yet", function=lambda: render_dispatcher.in_flight)
+if render_cpu_scheduler is not None:
+    metrics.gauge('datacanvas_cpu_core_slots_free', "Slots of CPU cores not held by a Blender process", function=lambda: render_cpu_scheduler.free_slots)
+
+# A quick low-resolution preview first, then refinements up to a denoised full-resolution image
+PROGRESSIVE_RENDER_PASSES = [
+    {'scale': 0.25, 'samples': 1, 'denoise': False},
+    {'scale': 0.5, 'samples': 4, 'denoise': False},
+    {'scale': 1.0, 'samples': 16, 'denoise': False},
+    {'scale': 1.0, 'samples': 64, 'denoise': True},
+]
+MULTIPART_BOUNDARY = 'datacanvas-rendering'
+
+# Stages reported by the Blender script, see render_job in headless-renderer-blender.py
+# Lines of Blender's output, which includes its events
+BLENDER_STDOUT_LINE_LIMIT = 2 ** 20
+# Entries of timings that are no durations, and are left out of the Server-Timing header
+TIMING_COUNTS = ['scene_elements_reused']
+BLENDER_TIMING_STAGES = ['scene_payload_read', 'device_setup', 'scene_build', 'blend_file_write', 'render_sync', 'render_sampling', 'image_write', 'blender_script']
+
+
+@app.on_event("startup")
+def prepare_blender_startup():
+    # Runs before the worker pool starts, as its workers load the fast-start scene
+    if blender_startup_profile_name == 'fast' and not os.path.isfile(BLENDER_FAST_START_SCENE_FILE):
+        logging.info(f"Creating the fast-start scene {BLENDER_FAST_START_SCENE_FILE}")
+        create_fast_start_scene_file()
+
+
+@app.on_event("startup")
+def start_blender_worker_pool():
+    global blender_worker_pool
+    if blender_worker_pool_size > 0:
+        blender_worker_pool = BlenderWorkerPool(
+            blender_worker_pool_size,
+            max_jobs_per_worker=int(os.environ.get('BLENDER_WORKER_MAX_JOBS', '100')),
+            startup_timeout=float(os.environ.get('BLENDER_WORKER_STARTUP_TIMEOUT', '120')),
+            render_timeout=float(os.environ.get('BLENDER_WORKER_RENDER_TIMEOUT', '600')),
+            acquire_timeout=float(os.environ.get('BLENDER_WORKER_ACQUIRE_TIMEOUT', '600')),
+            health_check_interval=float(os.environ.get('BLENDER_WORKER_HEALTH_CHECK_INTERVAL', '30')),
+            on_worker_started=lambda worker: blender_worker_startup_seconds.observe(worker.startup_seconds),
+            cpu_scheduler=render_cpu_scheduler,
+        )
+        blender_worker_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_blender_worker_pool():
+    if blender_worker_pool:
+        blender_worker_pool.shutdown()
+
+
+@app.on_event("startup")
+def start_render_job_expiry():
+    asyncio.ensure_future(render_jobs.expire_periodically(10))
+
+
+@app.on_event("startup")
+def start_render_session_expiry():
+    asyncio.ensure_future(render_sessions.expire_periodically(10))
+
+
+@app.on_event("shutdown")
+def stop_render_sessions():
+    render_sessions.close_all()
+
+
+@app.on_event("startup")
+def start_render_artifact_janitor():
+    asyncio.ensure_future(render_artifacts.sweep_periodically(60))
+
+
+async def run_blender_job(job, on_event=None, session=None):
+    # Returns the timings that the Blender script reports with its 'timings' event, which is not passed on to on_event
+    timings = {}
+
+    def handle_event(event):
+        if event.get('type') == 'timings':
+            timings.update(event['timings'])
+        elif on_event:
+            on_event(event)
+
+    if blender_worker_pool or session is not None:
+        loop = asyncio.get_running_loop()
+        cancel_event = threading.Event()
+
+        def forward_event(event):
+            loop.call_soon_threadsafe(handle_event, event)
+
+        # Sessions render on their own worker, which keeps the session's scene
+        render = partial(render_sessions.render, session) if session is not None else blender_worker_pool.render
+        try:
+            await loop.run_in_executor(render_executor, partial(render, job, on_event=forward_event, cancel_event=cancel_event))
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+        except BlenderWorkerUnavailable as error:
+            raise HTTPException(status_code=503, detail=f"{error}, try again later")
+        except RenderSessionClosed as error:
+            # Like requests to sessions that were closed before
+            raise HTTPException(status_code=404, detail=f"{error}")
+        except BlenderWorkerError as error:
+            raise HTTPException(status_code=500, detail=f"Rendering failed: {error}")
+        # Workers started before the job, their startup is observed when they become ready
+        timings.pop('script_started_at', None)
+        return timings
+
+    cores = await acquire_cpu_cores() if render_cpu_scheduler is not None else None
+    try:
+        return await run_blender_process(job, handle_event, timings, cores)
+    finally:
+        if cores is not None:
+            render_cpu_scheduler.release(cores)
+
+
+async def acquire_cpu_cores(poll_interval=0.1):
+    # The admission limit usually leaves a slot free, so this only waits while too many threads per job were configured
+    deadline = monotonic() + render_admission.max_queue_wait_seconds
+    while True:
+        try:
+            return render_cpu_scheduler.acquire(timeout=0)
+        except CpuCoresUnavailable:
+            if monotonic() >= deadline:
+                raise HTTPException(status_code=503, detail="All CPU cores are in use by other renderings, try again later")
+        await asyncio.sleep(poll_interval)
+
+
+async def run_blender_process(job, handle_event, timings, cores=None):
+    args = blender_args([
+        "--datacanvas-blend-file-filename", job['file_uuid'],
+        "--datacanvas-output-file", job['output_file'],
+        "--datacanvas-width", f"{job['width']}",
+        "--datacanvas-height", f"{job['height']}",
+        "--datacanvas-camera-eye", f"{job['camera_eye']}",
+        "--datacanvas-camera-center", f"{job['camera_center']}",
+        "--datacanvas-camera-fov-y-degrees", f"{job['camera_fov_y_degrees']}",
+        "--datacanvas-scene-elements-file" if job['scene_elements_file'] else "",
+        job['scene_elements_file'] if job['scene_elements_file'] else "",
+        "--datacanvas-level-of-detail" if job['level_of_detail'] else "",
+        json.dumps(job['level_of_detail']) if job['level_of_detail'] else "",
+        "--datacanvas-point-representation" if job['point_representation'] else "",
+        json.dumps(job['point_representation']) if job['point_representation'] else "",
+        "--datacanvas-save-blend-file" if job['save_blend_file'] else "",
+        "--datacanvas-profile-file" if job['profile_file'] else "",
+        job['profile_file'] if job['profile_file'] else "",
+        "--datacanvas-render-passes" if job['render_passes'] else "",
+        json.dumps(job['render_passes']) if job['render_passes'] else "",
+        "--datacanvas-render-views" if job['render_views'] else "",
+        json.dumps(job['render_views']) if job['render_views'] else "",
+        "--datacanvas-time-budget-seconds" if job['time_budget_seconds'] is not None else "",
+        f"{job['time_budget_seconds']}" if job['time_budget_seconds'] is not None else "",
+        "--datacanvas-render-region" if job['render_region'] else "",
+        json.dumps(job['render_region']) if job['render_region'] else "",
+        "--datacanvas-output-format", job['output_format'],
+    ], threads=len(cores) if cores else None)
+    logging.debug(f"Start blender with args: %s", args)
+
+    started_at = time()
+    if cores:
+        args = render_cpu_scheduler.command_prefix(cores) + args
+    process = await asyncio.create_subprocess_exec(*args, env=blender_env(), stdout=asyncio.subprocess.PIPE, limit=BLENDER_STDOUT_LINE_LIMIT)
+    try:
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except ValueError:
+                # The line was discarded, the rest of it is read as a line of its own, which is no event
+                logging.warning(f"Skipping a line of Blender's output longer than {BLENDER_STDOUT_LINE_LIMIT} bytes")
+                continue
+            if not line:
+                break
+            if line.startswith(BLENDER_EVENT_LINE_PREFIX):
+                handle_event(json.loads(line[len(BLENDER_EVENT_LINE_PREFIX):]))
+        return_code = await process.wait()
+    finally:
+        if process.returncode is None:
+            # Stops Cycles right away when the rendering was cancelled or failed, instead of finishing a rendering nobody waits for
+            process.kill()
+            await process.wait()
+    if return_code != 0:
+        raise HTTPException(status_code=500, detail=f"Rendering failed, Blender exited with code {return_code}")
+
+    # Loading the default scene, the add-ons, and the script, until the script started
+    if 'script_started_at' in timings:
+        timings['blender_startup'] = timings.pop('script_started_at') - started_at
+    return timings
+
+
+class SceneRenderRequest:
+    def __init__(self, config: SceneRenderConfiguration, cache_key, scene_elements_file=None):
+        self.config = config
+        self.cache_key = cache_key
+        # Binary scene payload, written to disk while the request was received
+        self.scene_elements_file = scene_elements_file
+        # Set once a rendering uses the scene payload, which then releases it -- otherwise the request releases it
+        self.claimed = False
+        self.point_count = 0
+        self.scene_element_count = 0
+        # See render_client_name, renderings are scheduled fairly between clients
+        self.client_name = None
+        # Stages of this request, and of the rendering that served it (if any), in seconds
+        self.timings = {}
+        self.profile_id = None
+
+    def on_event(self, event):
+        if event.get('type') == 'timings':
+            self.timings.update(event['timings'])
+            self.profile_id = event.get('profile_id')
+
+    @property
+    def etag(self):
+        return f'"{self.cache_key}"'
+
+    @property
+    def cost(self):
+        return render_cost(self.point_count, self.config.width, self.config.height, self.scene_element_count)
+
+
+def parse_scene_render_configuration(configuration):
+    try:
+        return SceneRenderConfiguration.parse_obj(configuration)
+    except ValidationError as error:
+        raise HTTPException(status_code=422, detail=error.errors())
+
+
+class RequestBodyStream:
+    # Hands the chunks of a request body from the event loop to a consumer thread, via a bounded queue for backpressure
+    def __init__(self, max_queued_chunks=16, poll_interval=0.1, put_poll_interval=0.005):
+        self.chunks = queue.Queue(maxsize=max_queued_chunks)
+        self.poll_interval = poll_interval
+        self.put_poll_interval = put_poll_interval
+        self.aborted = threading.Event()
+        self.finished = threading.Event()
+
+    def next_chunk(self):
+        # Called on the consumer thread, returns b'' at the end of the body
+        while True:
+            if self.aborted.is_set():
+                raise HTTPException(status_code=400, detail="Request body was not received completely")
+            try:
+                return self.chunks.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+
+    async def put_chunk(self, chunk):
+        # Waits on the event loop rather than on a thread, as the consumers may hold all of the executor's threads
+        while not self.finished.is_set():
+            try:
+                self.chunks.put_nowait(chunk)
+                return
+            except queue.Full:
+                await asyncio.sleep(self.put_poll_interval)
+
+    async def consume(self, request: Request, consumer, max_bytes):
+        loop = asyncio.get_running_loop()
+
+        def run_consumer():
+            try:
+                return consumer(self.next_chunk)
+            finally:
+                self.finished.set()
+
+        consumer_future = loop.run_in_executor(None, run_consumer)
+        try:
+            received_bytes = 0
+            async for chunk in request.stream():
+                received_bytes += len(chunk)
+                if received_bytes > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {max_bytes} bytes")
+                if chunk:
+                    await self.put_chunk(chunk)
+                if self.finished.is_set():
+                    break
+            await self.put_chunk(b'')
+        except BaseException:
+            self.aborted.set()
+            await asyncio.wait({consumer_future})
+            # The consumer fails as well once aborted, its exception is superseded by this one
+            consumer_future.exception()
+            raise
+        return await consumer_future
+
+
+def ensure_content_length(request: Request):
+    # Rejects oversized bodies before receiving them, bodies without Content-Length are checked while they are streamed
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > render_max_payload_bytes:
+        raise HTTPException(status_code=413, detail=f"Request body exceeds {render_max_payload_bytes} bytes")
+
+
+def render_client_name(request: Request):
+    # Set by clients (or a dispatching server) that share an address, e.g., behind a proxy; not authenticated
+    client_name = request.headers.get('x-datacanvas-client')
+    if client_name:
+        return client_name[:64]
+    return request.client.host if request.client else None
+
+
+async def receive_scene_render_request(request: Request):
+    # JSON bodies are parsed as SceneRenderConfiguration, application/octet-stream bodies are binary scene payloads (see scene_payload.py).
+    # Both are written to disk as binary scene payload while they are received, so their points are never held in memory as a whole.
+    ensure_content_length(request)
+
+    is_scene_payload = request.headers.get('content-type', '').startswith('application/octet-stream')
+    scene_elements_file = f"./blender-temp-data/{uuid.uuid4()}_scene_elements.bin"
+    render_artifacts.register(scene_elements_file)
+
+    # Both return (configuration, scene payload digest, point count, scene element count, seconds spent writing and hashing the payload)
+    def write_scene_payload_file(next_chunk):
+        digest = hashlib.sha256()
+        write_seconds = 0.0
+        with open(scene_elements_file, 'wb') as f:
+            for chunk in iter(next_chunk, b''):
+                t_write_start = perf_counter()
+                digest.update(chunk)
+                f.write(chunk)
+                write_seconds += perf_counter() - t_write_start
+        with open(scene_elements_file, 'rb') as f:
+            index = read_scene_payload_index(f)
+        validate_scene_colormaps(index.get('scene_elements'))
+        point_count = sum(scene_element['points']['count'] for scene_element in index.get('scene_elements', []) if scene_element.get('points'))
+        return index.get('configuration'), digest.hexdigest(), point_count, len(index.get('scene_elements', [])), write_seconds
+
+    def parse_json_to_scene_payload_file(next_chunk):
+        with open(scene_elements_file, 'w+b') as f:
+            configuration, point_count, write_seconds = parse_scene_stream(next_chunk, f, chunk_points=render_stream_chunk_points)
+            # The written payload is canonical (sorted index, float32 points), unlike the JSON text
+            t_hash_start = perf_counter()
+            f.seek(0)
+            digest = hashlib.sha256()
+            for chunk in iter(partial(f.read, 2 ** 20), b''):
+                digest.update(chunk)
+            write_seconds += perf_counter() - t_hash_start
+            f.seek(0)
+            scene_elements = read_scene_payload_index(f).get('scene_elements')
+            validate_scene_colormaps(scene_elements)
+        logging.info(f"Parsed {point_count} points while receiving the request")
+        return configuration, digest.hexdigest(), point_count, len(scene_elements or []), write_seconds
+
+    t_receive_start = perf_counter()
+    try:
+        configuration, scene_payload_sha256, point_count, scene_element_count, write_seconds = await RequestBodyStream().consume(
+            request,
+            write_scene_payload_file if is_scene_payload else parse_json_to_scene_payload_file,
+            render_max_payload_bytes,
+        )
+    except (ScenePayloadError, SceneStreamError, ColormapError, ValueError) as error:
+        render_artifacts.release(scene_elements_file)
+        raise HTTPException(status_code=400, detail=f"Invalid {'scene payload' if is_scene_payload else 'JSON'}: {error}")
+    except BaseException:
+        render_artifacts.release(scene_elements_file)
+        raise
+    t_receive_end = perf_counter()
+    logging.info(f"Receiving and parsing the request took {t_receive_end - t_receive_start:.2f}s")
+
+    try:
+        config = parse_scene_render_configuration(configuration)
+    except HTTPException:
+        render_artifacts.release(scene_elements_file)
+        raise
+    cache_key = render_cache_key({'configuration': config.dict(exclude=UNCACHED_CONFIGURATION_PROPERTIES), 'scene_payload_sha256': scene_payload_sha256}, blender_renderer_version)
+    render_request = SceneRenderRequest(config, cache_key, scene_elements_file=scene_elements_file)
+
+    render_request.point_count = point_count
+    render_request.scene_element_count = scene_element_count
+    render_request.client_name = render_client_name(request)
+    request_points_total.inc(point_count)
+    request_points.observe(point_count)
+    # Receiving, parsing, and writing are interleaved, writing is timed separately
+    render_request.timings['request_parse'] = t_receive_end - t_receive_start - write_seconds
+    render_request.timings['payload_write'] = write_seconds
+    for stage in ['request_parse', 'payload_write']:
+        render_stage_seconds.observe(render_request.timings[stage], stage=stage)
+    return render_request
+
+
+async def prepare_render_job(render_request: SceneRenderRequest, render_passes=None, render_views=None):
+    config = render_request.config
     random_uuid = str(uuid.uuid4())
 
-    logging.basicConfig(filename=f"./blender-temp-data/{random_uuid}.log", level=logging.INFO)
-
-    scene_elements_file = None
-    if (config.scene_elements):
-        scene_elements_file = f"./blender-temp-data/{random_uuid}_scene_elements.json"
-        with open(scene_elements_file, 'w') as f:
-            json.dump(config.scene_elements, f, indent=4, sort_keys=True)
-    
-    args = [
-        os.environ.get('BLENDER_PATH', '') + "blender", 
-        "--background",
-        "--addons", "cycles",
-        # "--python-use-system-env",
-        "--python-exit-code", "1",
-        "--log-level", "1",
-        # "--debug-python",
-        "blender_3.0.1_default-scene.blend",
-        "-o", f"./blender-temp-data/{random_uuid}.png",
-        "--python", "headless-renderer-blender.py",
-        "-f", "1",
-        "--",
-        "--cycles-device", "CUDA",
-        "--datacanvas-blend-file-filename", f"./blender-temp-data/{random_uuid}",
-        "--datacanvas-width", f"{config.width}",
-        "--datacanvas-height", f"{config.height}",
-        "--datacanvas-camera-eye", f"{config.camera_eye}",
-        "--datacanvas-camera-center", f"{config.camera_center}",
-        "--datacanvas-camera-fov-y-degrees", f"{config.camera_fov_y_degrees}",
-        "--datacanvas-scene-elements-file" if scene_elements_file else "",
-        scene_elements_file if scene_elements_file else "",
+    # Each pass of a progressive rendering, and each view of a batch rendering, writes its own image
+    if render_passes:
+        render_passes = [dict(render_pass, output_file=f"./blender-temp-data/{random_uuid}_pass{index}.png") for index, render_pass in enumerate(render_passes)]
+        render_artifacts.register(*(render_pass['output_file'] for render_pass in render_passes))
+    if render_views:
+        render_views = [dict(render_view, output_file=f"./blender-temp-data/{random_uuid}_view{index}.png") for index, render_view in enumerate(render_views)]
+        render_artifacts.register(*(render_view['output_file'] for render_view in render_views))
+
+    render_artifacts.register(f"./blender-temp-data/{random_uuid}.blend", f"./blender-temp-data/{random_uuid}.log", f"./blender-temp-data/{random_uuid}.png")
+    if config.profile:
+        render_artifacts.register(f"./blender-temp-data/{random_uuid}.prof")
+
+    return {
+        'file_uuid': f"./blender-temp-data/{random_uuid}",
+        'output_file': f"./blender-temp-data/{random_uuid}.png",
+        'width': config.width,
+        'height': config.height,
+        'camera_eye': config.camera_eye,
+        'camera_center': config.camera_center,
+        'camera_fov_y_degrees': config.camera_fov_y_degrees,
+        'scene_elements_file': render_request.scene_elements_file,
+        'level_of_detail': config.level_of_detail.dict() if config.level_of_detail else None,
+        'point_representation': config.point_representation,
+        'save_blend_file': render_save_blend_file,
+        'profile_file': f"./blender-temp-data/{random_uuid}.prof" if config.profile else None,
+        'render_passes': render_passes,
+        'render_views': render_views,
+        # Set once the rendering got a slot, to what remains of the request's time budget
+        'time_budget_seconds': None,
+        # Only set for the tiles of a tiled rendering, see execute_tiled_render_job
+        'render_region': None,
+        'output_format': 'PNG',
+        # Only used to schedule the rendering, see RenderAdmissionController; a batch rendering costs as much as its views together
+        'client_name': render_request.client_name,
+        'cost': sum(render_cost(render_request.point_count, view['width'], view['height'], render_request.scene_element_count) for view in render_views) if render_views else render_request.cost,
+    }
+
+
+async def execute_render_job(job, on_start=None, on_event=None, session=None):
+    # Returns the timings of the rendering, i.e., its wait for a free slot and the stages reported by Blender
+    t_queue_start = perf_counter()
+    async with render_admission.admit(job.get('client_name'), job.get('cost', 1)):
+        if on_start:
+            on_start()
+        t_render_start = perf_counter()
+        timings = await run_blender_job(job, on_event=on_event, session=session)
+        t_render_end = perf_counter()
+
+    logging.info(f"Creating and rendering scene in blender took {t_render_end - t_render_start:.2f}s overall")
+    timings['queue_wait'] = t_render_start - t_queue_start
+    timings['blender'] = t_render_end - t_render_start
+    return timings
+
+
+def render_tile_count(config: SceneRenderConfiguration):
+    if config.tiles is None:
+        return 1
+    # Workers (or one-shot slots) that are idle right now, each tile waits for one like any other rendering, so more tiles than
+    # those would render one after another and only add scene builds
+    available_workers = render_admission.max_concurrent - render_admission.in_flight
+    if config.tiles == 'auto':
+        return auto_tile_count(config.width, config.height, available_workers, render_tile_min_pixels, render_max_tiles)
+    return max(1, min(config.tiles, available_workers, render_max_tiles))
+
+
+def prepare_tile_jobs(job, tiles):
+    tile_jobs = []
+    for index, tile in enumerate(tiles):
+        file_uuid = f"{job['file_uuid']}_tile{index}"
+        render_artifacts.register(f"{file_uuid}.blend", f"{file_uuid}.log", f"{file_uuid}.tga")
+        tile_jobs.append(dict(
+            job,
+            file_uuid=file_uuid,
+            # Uncompressed, so that neither Blender nor the server spend time on compression before the tiles are stitched
+            output_file=f"{file_uuid}.tga",
+            output_format='TARGA_RAW',
+            render_region=blender_render_region(tile, job['width'], job['height']),
+            # Only the first tile is profiled, the others run the same code
+            profile_file=job['profile_file'] if index == 0 else None,
+            cost=job['cost'] / len(tiles),
+        ))
+    return tile_jobs
+
+
+async def execute_tiled_render_job(job, tile_count, on_start=None, on_event=None):
+    # Renders the job's tiles in parallel, each like a rendering of its own, and returns the timings and the stitched PNG
+    tiles = tile_grid(job['width'], job['height'], tile_count)
+    tile_jobs = prepare_tile_jobs(job, tiles)
+    logging.info(f"Rendering {job['width']}x{job['height']} pixels in {len(tiles)} tiles")
+
+    started = False
+    progress_by_stage = {}
+
+    def on_tile_start():
+        nonlocal started
+        if not started:
+            started = True
+            if on_start:
+                on_start()
+
+    def on_tile_event(index, event):
+        if not on_event:
+            return
+        if event.get('type') == 'progress':
+            # Progress of the whole image, as the mean of the tiles' progress
+            progress = progress_by_stage.setdefault(event['stage'], [0.0] * len(tiles))
+            progress[index] = event['progress']
+            on_event(dict(event, progress=sum(progress) / len(progress)))
+        else:
+            on_event(event)
+
+    tasks = [
+        asyncio.ensure_future(execute_render_job(tile_job, on_start=on_tile_start, on_event=partial(on_tile_event, index)))
+        for index, tile_job in enumerate(tile_jobs)
     ]
+    failed = True
+    try:
+        tile_timings = await asyncio.gather(*tasks)
+        t_stitch_start = perf_counter()
+        png = await asyncio.get_running_loop().run_in_executor(None, stitch_tile_files, tiles, [tile_job['output_file'] for tile_job in tile_jobs], job['width'], job['height'])
+        failed = False
+    finally:
+        if failed:
+            # A failed tile fails the whole image, so the other tiles are not finished
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+        for tile_job in tile_jobs:
+            cleanup_render_job(tile_job, failed)
 
-    env = os.environ.copy()
-    blender_python_path = os.environ.get('BLENDER_PYTHON_PATH', '')
-    if blender_python_path:
-        env['PYTHONPATH'] = blender_python_path
+    # The tiles render in parallel, so the slowest one of each stage is what the image waited for
+    timings = {
+        stage: max(timings[stage] for timings in tile_timings if stage in timings)
+        for stage in set().union(*tile_timings)
+        if all(isinstance(timings.get(stage, 0), (int, float)) for timings in tile_timings)
+    }
+    timings['scene_elements'] = tile_timings[0].get('scene_elements', [])
+    timings['tile_stitch'] = perf_counter() - t_stitch_start
+    return timings, png
 
-    render_thread = threading.Thread(target=lambda: subprocess.check_output(args, env=env))
 
-    logging.debug(f"Start blender with args: %s", args)
+def observe_render_timings(timings):
+    for stage in ['dispatch', 'queue_wait', 'blender_startup', 'blender'] + BLENDER_TIMING_STAGES:
+        if stage in timings:
+            render_stage_seconds.observe(timings[stage], stage=stage)
+    for scene_element_timings in timings.get('scene_elements', []):
+        scene_element_build_seconds.observe(scene_element_timings['seconds'], type=scene_element_timings['type'])
+
+
+def cleanup_render_job(job, failed):
+    render_artifacts.release(f"{job['file_uuid']}.blend", f"{job['file_uuid']}.log", job['output_file'], job['scene_elements_file'], succeeded=not failed)
+    render_artifacts.release(*(render_pass['output_file'] for render_pass in job['render_passes'] or []), succeeded=not failed)
+    render_artifacts.release(*(render_view['output_file'] for render_view in job['render_views'] or []), succeeded=not failed)
+    # Profiles are kept for download until the janitor's retention period ends, regardless of the retention mode
+    render_artifacts.keep(job['profile_file'])
+
+
+def release_scene_render_request(render_request: SceneRenderRequest):
+    # Requests served from the cache (or by an identical rendering in flight) do not render their own scene payload
+    if not render_request.claimed:
+        render_artifacts.release(render_request.scene_elements_file)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def dispatch_scene_request(render_request: SceneRenderRequest, on_start, on_event):
+    # The scene payload goes to a render backend as it is, with the request's configuration in its index
+    failed = False
+    try:
+        on_start()
+        # Backends schedule the rendering as the original client's, not the dispatching server's
+        headers = {'X-Datacanvas-Client': render_request.client_name} if render_request.client_name else None
+        png, timings = await render_dispatcher.dispatch(render_request.scene_elements_file, render_request.cost, headers=headers)
+        observe_render_timings(timings)
+        on_event({'type': 'timings', 'timings': timings, 'profile_id': None})
+        return png
+    except Exception:
+        failed = True
+        raise
+    finally:
+        render_artifacts.release(render_request.scene_elements_file, succeeded=not failed)
+
+
+def ensure_local_rendering(renderings):
+    # Only single images are forwarded to render backends, the dispatcher does not need a Blender of its own
+    if render_dispatcher is not None:
+        raise HTTPException(status_code=501, detail=f"{renderings} are not supported by a dispatching server, send them to one of its render backends")
+
+
+def render_scene_request(render_request: SceneRenderRequest):
+    async def render(on_start, on_event):
+        render_request.claimed = True
+        if render_dispatcher is not None:
+            return await dispatch_scene_request(render_request, on_start, on_event)
+        job = await prepare_render_job(render_request)
+        tile_count = render_tile_count(render_request.config)
+        failed = False
+        try:
+            if tile_count > 1:
+                timings, png = await execute_tiled_render_job(job, tile_count, on_start=on_start, on_event=on_event)
+            else:
+                timings = await execute_render_job(job, on_start=on_start, on_event=on_event)
+                png = None
+            observe_render_timings(timings)
+            # Requests joining this rendering get its timings, too, see RenderCache.get_or_render
+            on_event({'type': 'timings', 'timings': timings, 'profile_id': os.path.basename(job['file_uuid']) if job['profile_file'] else None})
+            if png is not None:
+                return png
+            return await asyncio.get_running_loop().run_in_executor(None, read_file, job['output_file'])
+        except Exception:
+            failed = True
+            raise
+        finally:
+            cleanup_render_job(job, failed)
+    return render
+
 
-    t_render_thread_start = perf_counter()
-    render_thread.start()
-    render_thread.join()
-    t_render_thread_end = perf_counter()
+def etag_matches(request: Request, etag):
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
 
-    logging.info(f"Creating and rendering scene in blender took {t_render_thread_end - t_render_thread_start:.2f}s overall")
 
-    def cleanup():
-        # os.remove(f"./blender-temp-data/{random_uuid}.blend")
-        # os.remove(f"./blender-temp-data/{random_uuid}.png0001.png")
-        # os.remove(f"./blender-temp-data/{random_uuid}_scene_elements.json")
-        pass
+def observe_response_seconds(t_response_start):
+    # Until the image was sent, which is after its Server-Timing header was, so the stage is only part of the metrics
+    render_stage_seconds.observe(perf_counter() - t_response_start, stage='response')
 
-    return FileResponse(
-        f"./blender-temp-data/{random_uuid}.png0001.png",
-        background=BackgroundTask(cleanup)
+
+def png_response(png, etag=None, headers=None, t_response_start=None):
+    headers = {**({'ETag': etag} if etag else {}), **(headers or {})}
+    return Response(png, media_type='image/png', headers=headers, background=BackgroundTask(observe_response_seconds, t_response_start or perf_counter()))
+
+
+def server_timing_header(timings):
+    # See https://www.w3.org/TR/server-timing/, durations in milliseconds
+    return ', '.join(
+        f"{stage};dur={seconds * 1000:.1f}"
+        for stage, seconds in timings.items()
+        if isinstance(seconds, (int, float)) and not isinstance(seconds, bool) and stage not in TIMING_COUNTS
     )
+
+
+async def cancel_on_disconnect(request: Request, coroutine, poll_interval=0.5):
+    task = asyncio.ensure_future(coroutine)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logging.info(f"Client disconnected, cancelling its rendering")
+                task.cancel()
+                raise HTTPException(status_code=400, detail="Client disconnected")
+    finally:
+        task.cancel()
+
+
+@app.post("/renderings/")
+async def create_rendering(request: Request):
+    render_request = await receive_scene_render_request(request)
+    try:
+        # Renderings are content-addressed, so a matching ETag means the client already has this image, but not its profile
+        if etag_matches(request, render_request.etag) and not render_request.config.profile:
+            renderings_total.inc(outcome='not_modified')
+            return Response(status_code=304, headers={'ETag': render_request.etag})
+
+        try:
+            png = await cancel_on_disconnect(request, render_cache.get_or_render(render_request.cache_key, render_scene_request(render_request), on_event=render_request.on_event, use_cached=not render_request.config.profile))
+        except Exception:
+            renderings_total.inc(outcome='failed')
+            raise
+    finally:
+        release_scene_render_request(render_request)
+
+    t_response_start = perf_counter()
+    renderings_total.inc(outcome='rendered' if render_request.claimed else 'cached')
+    headers = {'Server-Timing': server_timing_header(render_request.timings)}
+    if render_request.profile_id:
+        headers['X-Datacanvas-Profile'] = f"/profiles/{render_request.profile_id}"
+    return png_response(png, render_request.etag, headers, t_response_start=t_response_start)
+
+
+def multipart_part(content, content_type, headers):
+    header_lines = ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return f"--{MULTIPART_BOUNDARY}\r\nContent-Type: {content_type}\r\nContent-Length: {len(content)}\r\n{header_lines}\r\n".encode('utf-8') + content + b'\r\n'
+
+
+def json_part(content):
+    return multipart_part(json.dumps(content).encode('utf-8'), 'application/json', {})
+
+
+async def stream_rendered_images(request: Request, job, image_event_type, part_headers, media_type, on_start=None, request_timings=None):
+    # Runs the job and streams the image of each image_event_type event as soon as Blender wrote it, as one part of a multipart
+    # response with the headers part_headers(event); with request_timings, a last application/json part holds them and the job's timings
+    image_events = asyncio.Queue()
+
+    def on_event(event):
+        if event.get('type') == image_event_type:
+            image_events.put_nowait(event)
+
+    async def render():
+        try:
+            timings = await execute_render_job(job, on_start=on_start, on_event=on_event)
+            observe_render_timings(timings)
+            return timings
+        finally:
+            image_events.put_nowait(None)
+
+    render_task = asyncio.ensure_future(render())
+
+    def finish(failed):
+        render_task.cancel()
+        renderings_total.inc(outcome='failed' if failed else 'rendered')
+        cleanup_render_job(job, failed)
+
+    # Errors before the first image, e.g., a full queue or a failing Blender, are answered with their status code
+    try:
+        first_event = await cancel_on_disconnect(request, image_events.get())
+        if first_event is None:
+            await render_task
+            raise HTTPException(status_code=500, detail="Rendering finished without an image")
+    except BaseException:
+        finish(failed=True)
+        raise
+
+    async def stream_images():
+        event = first_event
+        failed = True
+        try:
+            while event is not None:
+                png = await asyncio.get_running_loop().run_in_executor(None, read_file, event['output_file'])
+                yield multipart_part(png, 'image/png', dict(part_headers(event), **{'Server-Timing': server_timing_header(event['timings'])}))
+                event = await image_events.get()
+            timings = await render_task
+            failed = False
+            if request_timings is not None:
+                yield json_part({'timings': dict(request_timings, **timings)})
+        except HTTPException as error:
+            # The status code was sent with the first image already
+            yield json_part({'detail': error.detail})
+        finally:
+            finish(failed)
+        yield f"--{MULTIPART_BOUNDARY}--\r\n".encode('utf-8')
+
+    return StreamingResponse(stream_images(), media_type=f"{media_type}; boundary={MULTIPART_BOUNDARY}")
+
+
+@app.post("/progressive-renderings/")
+async def create_progressive_rendering(request: Request):
+    t_request_start = perf_counter()
+    ensure_local_rendering("Progressive renderings")
+    render_admission.ensure_queue_capacity(render_client_name(request))
+
+    render_request = await receive_scene_render_request(request)
+    render_request.claimed = True
+    config = render_request.config
+    render_passes = [render_pass.dict() for render_pass in config.render_passes] if config.render_passes else PROGRESSIVE_RENDER_PASSES
+    job = await prepare_render_job(render_request, render_passes=render_passes)
+
+    def on_start():
+        if config.time_budget_seconds is not None:
+            job['time_budget_seconds'] = max(0.0, config.time_budget_seconds - (perf_counter() - t_request_start))
+
+    def part_headers(event):
+        render_pass = job['render_passes'][event['index']]
+        return {
+            'X-Datacanvas-Render-Pass': f"{event['index'] + 1}/{event['count']}",
+            'X-Datacanvas-Scale': render_pass['scale'],
+            'X-Datacanvas-Samples': render_pass['samples'],
+            'X-Datacanvas-Denoise': 'true' if render_pass['denoise'] else 'false',
+        }
+
+    return await stream_rendered_images(request, job, 'render_pass', part_headers, 'multipart/x-mixed-replace', on_start=on_start)
+
+
+@app.post("/batch-renderings/")
+async def create_batch_rendering(request: Request):
+    ensure_local_rendering("Batch renderings")
+    render_admission.ensure_queue_capacity(render_client_name(request))
+
+    render_request = await receive_scene_render_request(request)
+    config = render_request.config
+    if not config.views:
+        release_scene_render_request(render_request)
+        raise HTTPException(status_code=422, detail="Batch renderings need at least one view")
+    if len(config.views) > render_max_batch_views:
+        release_scene_render_request(render_request)
+        raise HTTPException(status_code=422, detail=f"Batch renderings are limited to {render_max_batch_views} views")
+
+    render_request.claimed = True
+    # Views without their own camera or size use the request's
+    render_views = [
+        {
+            'camera_eye': view.camera_eye or config.camera_eye,
+            'camera_center': view.camera_center or config.camera_center,
+            'camera_fov_y_degrees': view.camera_fov_y_degrees or config.camera_fov_y_degrees,
+            'width': view.width or config.width,
+            'height': view.height or config.height,
+        }
+        for view in config.views
+    ]
+    job = await prepare_render_job(render_request, render_views=render_views)
+    # Points and lines that are reduced for one camera would look wrong from the others
+    job['level_of_detail'] = None
+
+    def part_headers(event):
+        return {
+            'Content-Disposition': f'attachment; name="view-{event["index"]}"; filename="view-{event["index"]}.png"',
+            'X-Datacanvas-View': f"{event['index'] + 1}/{event['count']}",
+        }
+
+    return await stream_rendered_images(request, job, 'render_view', part_headers, 'multipart/mixed', request_timings=render_request.timings)
+
+
+@app.post("/render-jobs/", status_code=202)
+async def create_render_job(request: Request):
+    render_admission.ensure_queue_capacity(render_client_name(request))
+
+    render_request = await receive_scene_render_request(request)
+
+    async def run(render_job):
+        render_job.etag = render_request.etag
+        render_job.timings.update(render_request.timings)
+        try:
+            render_job.result = await render_cache.get_or_render(render_request.cache_key, render_scene_request(render_request), on_start=render_job.mark_running, on_event=render_job.on_event, use_cached=not render_request.config.profile)
+        except Exception:
+            renderings_total.inc(outcome='failed')
+            raise
+        finally:
+            release_scene_render_request(render_request)
+        renderings_total.inc(outcome='rendered' if render_request.claimed else 'cached')
+
+    return render_jobs.submit(run).to_dict()
+
+
+@app.get("/render-jobs/{job_id}")
+async def get_render_job(job_id: str):
+    return render_jobs.get(job_id).to_dict()
+
+
+@app.get("/render-jobs/{job_id}/result")
+async def get_render_job_result(job_id: str, request: Request, wait: bool = False):
+    render_job = render_jobs.get(job_id)
+    if wait and not render_job.is_finished:
+        # Waiting does not cancel the job when the waiting client goes away -- DELETE does -- and keeps it from being abandoned
+        await render_jobs.wait(render_job)
+    if render_job.status != 'succeeded':
+        raise HTTPException(status_code=409, detail=f"Rendering job {job_id} is {render_job.status}")
+    if etag_matches(request, render_job.etag):
+        return Response(status_code=304, headers={'ETag': render_job.etag})
+    return png_response(render_job.result, render_job.etag)
+
+
+@app.post("/sessions/", status_code=201)
+async def create_render_session():
+    ensure_local_rendering("Rendering sessions")
+    session = await render_sessions.create()
+    return session.to_dict(render_sessions.idle_seconds)
+
+
+@app.get("/sessions/{session_id}")
+async def get_render_session(session_id: str):
+    return render_sessions.get(session_id).to_dict(render_sessions.idle_seconds)
+
+
+@app.delete("/sessions/{session_id}")
+async def close_render_session(session_id: str):
+    session = await render_sessions.close(session_id)
+    return session.to_dict(render_sessions.idle_seconds)
+
+
+@app.post("/sessions/{session_id}/renderings/")
+async def create_session_rendering(session_id: str, request: Request):
+    ensure_local_rendering("Rendering sessions")
+    session = render_sessions.get(session_id)
+    render_request = await receive_scene_render_request(request)
+    render_request.claimed = True
+    config = render_request.config
+    job = await prepare_render_job(render_request)
+    # The session's scene elements are kept for all cameras, while level of detail reduces them for one
+    job['level_of_detail'] = None
+    job['session'] = {'removed_scene_element_ids': config.removed_scene_element_ids, 'replace_scene_elements': config.replace_scene_elements}
+
+    async def render():
+        async with session.lock:
+            # The session may have been closed while the request was received or waited for the session's previous rendering
+            render_sessions.get(session.id)
+            return await execute_render_job(job, session=session)
+
+    failed = False
+    try:
+        timings = await cancel_on_disconnect(request, render())
+        observe_render_timings(timings)
+        t_response_start = perf_counter()
+        png = await asyncio.get_running_loop().run_in_executor(None, read_file, job['output_file'])
+    except Exception:
+        failed = True
+        renderings_total.inc(outcome='failed')
+        raise
+    finally:
+        cleanup_render_job(job, failed)
+
+    renderings_total.inc(outcome='rendered')
+    render_request.timings.update(timings)
+    return png_response(png, headers={'Server-Timing': server_timing_header(render_request.timings)}, t_response_start=t_response_start)
+
+
+@app.get("/scheduler/clients")
+async def get_scheduler_clients():
+    return render_admission.to_dict()
+
+
+@app.get("/dispatcher/backends")
+async def get_dispatcher_backends():
+    if render_dispatcher is None:
+        raise HTTPException(status_code=404, detail="The server is not in dispatcher mode, see RENDER_DISPATCHER_BACKENDS")
+    return render_dispatcher.to_dict()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    try:
+        profile_id = str(uuid.UUID(profile_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    profile_file = f"./blender-temp-data/{profile_id}.prof"
+    if not os.path.isfile(profile_file):
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return FileResponse(profile_file, media_type='application/octet-stream', filename=f"{profile_id}.prof")
+
+
+@app.delete("/render-jobs/{job_id}")
+async def cancel_render_job(job_id: str):
+    render_job = render_jobs.cancel(job_id)
+    await asyncio.wait({render_job.task})
+    return render_job.to_dict()
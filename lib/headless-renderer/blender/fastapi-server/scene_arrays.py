@@ -0,0 +1,51 @@
+import numpy as np
+
+from operator import itemgetter
+
+# Per-point properties sent by datacanvas, see App.tsx
+POINT_FIELDS = ['x', 'y', 'z', 'size', 'r', 'g', 'b']
+# Points with a scalar value instead of a color, which their scene element's colormap maps to colors (see scene_colormaps.py)
+COLORMAP_POINT_FIELDS = ['x', 'y', 'z', 'size', 'value']
+
+
+def point_fields(points):
+    # Fields of a point object or a dict of columns
+    return COLORMAP_POINT_FIELDS if 'value' in points and 'r' not in points else POINT_FIELDS
+
+
+def points_to_columns(points, fields=POINT_FIELDS):
+    try:
+        return {field: np.fromiter(map(itemgetter(field), points), dtype=np.float32, count=len(points)) for field in fields}
+    except (KeyError, TypeError):
+        pass
+
+    # Slower fallback for points with missing properties or values (None), which become NaN
+    rows = np.array([[point.get(field) for field in fields] for point in points], dtype=np.float64).reshape(-1, len(fields))
+    return {field: np.ascontiguousarray(rows[:, field_index], dtype=np.float32) for field_index, field in enumerate(fields)}
+
+
+def valid_point_mask(columns):
+    # Same rule as the per-point path: points with a missing or zero coordinate are skipped
+    mask = np.ones(len(columns['x']), dtype=bool)
+    for field in ['x', 'y', 'z']:
+        values = columns[field]
+        mask &= ~np.isnan(values) & (values != 0)
+    return mask
+
+
+def webgl_to_blender_positions(x, y, z):
+    # Same mapping as vec3_transform_webgl_to_blender, i.e., (x, y, z) -> (x, -z, y)
+    positions = np.empty((len(x), 3), dtype=np.float32)
+    positions[:, 0] = x
+    positions[:, 1] = -z
+    positions[:, 2] = y
+    return positions
+
+
+def srgb_to_linear(values):
+    return np.power(values, 2.2, dtype=np.float32)
+
+
+def line_edges(vertex_count):
+    indices = np.arange(max(vertex_count - 1, 0), dtype=np.int32)
+    return np.stack([indices, indices + 1], axis=1)
@@ -0,0 +1,154 @@
+# Colormaps of point and line primitives whose points carry a scalar 'value' instead of an 'r', 'g', 'b' color. A scene element
+# references one of the presets that the frontend offers (see public/*.json, e.g., colorbrewer.json) or gives the gradient inline:
+#   {"preset": "colorbrewer", "identifier": "Spectral", "stops": 7, "interpolate": true, "domain": [0, 1]}
+#   {"colors": [[r, g, b], ...], "positions": [0, ..., 1], "interpolate": true, "domain": [0, 1]}
+# with sRGB colors in [0, 1] and values mapped from domain to [0, 1]. Each colormap becomes a lookup table of linear colors, so
+# that the colormap and the gamma conversion are applied to all points of a scene element as one gather.
+
+import os
+import re
+import json
+
+from functools import lru_cache
+
+import numpy as np
+
+from scene_arrays import srgb_to_linear
+
+# The frontend's presets, relative to fastapi-server
+COLORMAP_PRESETS_DIRECTORY = os.environ.get('RENDER_COLORMAP_PRESETS_DIRECTORY') or os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', '..', '..', 'public')
+PRESET_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+# Entries of lookup tables of interpolated colormaps, i.e., values are quantized to 1/1023 of the domain
+LOOKUP_TABLE_SIZE = 1024
+
+
+class ColormapError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def load_colormap_preset(preset):
+    # Returns {identifier: (type, [colors as (n, 3) sRGB array in [0, 1], ...])}, e.g., the colors of 3 to 11 classes per identifier
+    if not PRESET_NAME_PATTERN.match(preset):
+        raise ColormapError(f"Invalid colormap preset {preset}")
+    path = os.path.join(COLORMAP_PRESETS_DIRECTORY, f"{preset}.json")
+    try:
+        with open(path, 'r') as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        raise ColormapError(f"Unknown colormap preset {preset}")
+
+    colormaps = {}
+    for entry in entries:
+        scale = 255.0 if entry['format'] == 'rgb' else 1.0
+        colormaps[entry['identifier']] = (entry['type'], [np.asarray(colors, dtype=np.float64).reshape(-1, 3) / scale for colors in entry['colors']])
+    return colormaps
+
+
+def resample_colors(colors, count):
+    grid = np.linspace(0, 1, count)
+    positions = np.linspace(0, 1, len(colors))
+    return np.stack([np.interp(grid, positions, colors[:, channel]) for channel in range(3)], axis=1)
+
+
+def preset_colors(colormap):
+    preset = colormap['preset']
+    if not isinstance(preset, str):
+        raise ColormapError(f"Invalid colormap preset {preset!r}")
+    identifier = colormap.get('identifier')
+    colormaps = load_colormap_preset(preset)
+    if not isinstance(identifier, str) or identifier not in colormaps:
+        raise ColormapError(f"Unknown colormap {identifier} in preset {preset}")
+    type, color_arrays = colormaps[identifier]
+
+    # Same as the frontend: the colors for the number of stops if the preset has them, otherwise its most colors resampled
+    stops = colormap.get('stops')
+    colors = max(color_arrays, key=len)
+    if stops is not None:
+        if not isinstance(stops, int) or stops < 2:
+            raise ColormapError(f"Invalid number of colormap stops {stops}")
+        colors = next((candidate for candidate in color_arrays if len(candidate) == stops), None)
+        if colors is None:
+            colors = resample_colors(max(color_arrays, key=len), stops)
+    # Qualitative colormaps are not interpolated by default, see ColorMappingNode.tsx
+    return colors, None, type != 'qualitative'
+
+
+def inline_colors(colormap):
+    try:
+        colors = np.asarray(colormap['colors'], dtype=np.float64).reshape(-1, 3)
+        positions = np.asarray(colormap['positions'], dtype=np.float64) if colormap.get('positions') is not None else None
+    except (TypeError, ValueError):
+        raise ColormapError("Colormap colors must be [r, g, b] triples and positions numbers")
+    if len(colors) == 0:
+        raise ColormapError("Colormap has no colors")
+    if positions is not None and (len(positions) != len(colors) or np.any(np.diff(positions) < 0)):
+        raise ColormapError("Colormap positions must be ascending, one per color")
+    return colors, positions, True
+
+
+def colormap_domain(colormap):
+    domain = colormap.get('domain', [0.0, 1.0])
+    if not isinstance(domain, (list, tuple)) or len(domain) != 2 or not all(isinstance(bound, (int, float)) for bound in domain):
+        raise ColormapError(f"Invalid colormap domain {domain}")
+    return float(domain[0]), float(domain[1])
+
+
+def colormap_lookup_table(colormap):
+    # Returns (linear colors as (n, 3) float32 array, whether values are interpolated between them)
+    if not isinstance(colormap, dict):
+        raise ColormapError(f"Invalid colormap {colormap!r}")
+    if 'preset' in colormap:
+        colors, positions, interpolate = preset_colors(colormap)
+    elif 'colors' in colormap:
+        colors, positions, interpolate = inline_colors(colormap)
+    else:
+        raise ColormapError("Colormap needs either a preset or colors")
+    interpolate = colormap.get('interpolate', interpolate)
+    colormap_domain(colormap)
+
+    if not interpolate or len(colors) == 1:
+        # Each color covers an equal part of the domain
+        return srgb_to_linear(np.clip(colors, 0, 1).astype(np.float32)), False
+
+    # Interpolated in sRGB like the gradients in the frontend, and converted to linear colors afterwards
+    grid = np.linspace(0, 1, LOOKUP_TABLE_SIZE)
+    if positions is None:
+        positions = np.linspace(0, 1, len(colors))
+    lookup_table = np.stack([np.interp(grid, positions, colors[:, channel]) for channel in range(3)], axis=1)
+    return srgb_to_linear(np.clip(lookup_table, 0, 1).astype(np.float32)), True
+
+
+def validate_scene_colormaps(scene_elements):
+    # Raises ColormapError for the first scene element whose colormap cannot be applied, or whose point values have no colormap.
+    # Scene elements are those of a scene payload index, i.e., their points are {"fields": [...], ...}.
+    for scene_element in scene_elements or []:
+        if not isinstance(scene_element, dict):
+            continue
+        colormap = scene_element.get('colormap')
+        points = scene_element.get('points')
+        fields = points.get('fields', []) if isinstance(points, dict) else []
+        if colormap is None:
+            if 'value' in fields and 'r' not in fields:
+                raise ColormapError(f"Scene element {scene_element.get('id')} has point values but no colormap")
+            continue
+        try:
+            colormap_lookup_table(colormap)
+        except ColormapError as error:
+            raise ColormapError(f"Scene element {scene_element.get('id')}: {error}")
+
+
+def apply_colormap(values, colormap):
+    # Returns linear r, g, b columns, values outside the domain are clamped, missing values (NaN) take the lowest color
+    lookup_table, interpolate = colormap_lookup_table(colormap)
+    minimum, maximum = colormap_domain(colormap)
+    extent = maximum - minimum
+    normalized = (np.asarray(values, dtype=np.float64) - minimum) / extent if extent else np.zeros(len(values))
+    normalized = np.clip(np.nan_to_num(normalized, nan=0.0), 0, 1)
+    if interpolate:
+        indices = np.rint(normalized * (len(lookup_table) - 1)).astype(np.intp)
+    else:
+        indices = np.minimum((normalized * len(lookup_table)).astype(np.intp), len(lookup_table) - 1)
+    # Gathered per channel, as foreach_set copies contiguous arrays fastest
+    channels = np.ascontiguousarray(lookup_table.T)
+    return channels[0][indices], channels[1][indices], channels[2][indices]
@@ -0,0 +1,132 @@
+# Level of detail: reduces point and line primitives in screen space of the request camera, before their meshes are built.
+# Positions are in Blender world co-ordinates, i.e., after vec3_transform_webgl_to_blender and the scene element's transform.
+
+import numpy as np
+
+LEVEL_OF_DETAIL_DEFAULTS = {
+    # Points whose projections share a square cell of this size are reduced to one point
+    'point_cell_size_pixels': 1.0,
+    # 'nearest' keeps the point closest to the camera of each cell, 'merge' averages the points of each cell
+    'point_reduction': 'nearest',
+    # Maximum screen-space deviation of simplified lines from the original polylines (Douglas-Peucker)
+    'line_tolerance_pixels': 0.5,
+}
+
+
+class CameraProjection:
+    # Same camera as add_camera: vertical field of view, looking from eye at center with world Z as up axis (TRACK_TO constraint)
+    def __init__(self, eye, center, fov_y_degrees, width, height):
+        self.eye = np.asarray(eye, dtype=np.float64)
+        self.width = width
+        self.height = height
+
+        forward = np.asarray(center, dtype=np.float64) - self.eye
+        forward /= np.linalg.norm(forward)
+        right = np.cross(forward, [0.0, 0.0, 1.0])
+        if np.linalg.norm(right) < 1e-9:
+            right = np.cross(forward, [0.0, 1.0, 0.0])
+        right /= np.linalg.norm(right)
+        up = np.cross(right, forward)
+        self.view = np.stack([right, up, forward])
+
+        self.tan_half_fov_y = np.tan(np.radians(fov_y_degrees) / 2)
+        self.aspect = width / height
+
+    def project(self, positions):
+        # Returns pixel co-ordinates (origin top left) and depths, points with depth <= 0 are behind the camera
+        view_positions = (positions - self.eye) @ self.view.T
+        depths = view_positions[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ndc_x = view_positions[:, 0] / (depths * self.tan_half_fov_y * self.aspect)
+            ndc_y = view_positions[:, 1] / (depths * self.tan_half_fov_y)
+        pixels = np.stack([(ndc_x + 1) / 2 * self.width, (1 - ndc_y) / 2 * self.height], axis=1)
+        return pixels, depths
+
+
+def take_columns(columns, indices):
+    return {field: values[indices] for field, values in columns.items()}
+
+
+def reduce_points(columns, positions, projection, cell_size_pixels=1.0, reduction='nearest'):
+    # Points behind the camera have no screen-space density and are kept as they are
+    pixels, depths = projection.project(positions)
+    in_front = (depths > 0) & np.isfinite(pixels).all(axis=1)
+    front_indices = np.flatnonzero(in_front)
+    behind_indices = np.flatnonzero(~in_front)
+
+    cells = np.floor(pixels[front_indices] / cell_size_pixels).astype(np.int64)
+    # Sorting by cell, then depth, puts the nearest point of each cell first
+    order = np.lexsort((depths[front_indices], cells[:, 1], cells[:, 0]))
+    sorted_cells = cells[order]
+    is_first_of_cell = np.ones(len(order), dtype=bool)
+    is_first_of_cell[1:] = (sorted_cells[1:] != sorted_cells[:-1]).any(axis=1)
+
+    if reduction == 'nearest':
+        kept_indices = np.sort(np.concatenate([front_indices[order[is_first_of_cell]], behind_indices]))
+        return take_columns(columns, kept_indices)
+
+    if reduction == 'merge':
+        cell_ids = np.cumsum(is_first_of_cell) - 1
+        cell_counts = np.bincount(cell_ids)
+        merged = {}
+        for field, values in columns.items():
+            sorted_values = values[front_indices[order]].astype(np.float64)
+            merged_values = np.bincount(cell_ids, weights=sorted_values, minlength=len(cell_counts)) / cell_counts
+            merged[field] = np.concatenate([merged_values.astype(values.dtype), values[behind_indices]])
+        return merged
+
+    raise ValueError(f"Unknown point reduction {reduction}")
+
+
+def douglas_peucker_mask(pixels, tolerance_pixels):
+    keep = np.zeros(len(pixels), dtype=bool)
+    if len(pixels) == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    segments = [(0, len(pixels) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        direction = pixels[end] - pixels[start]
+        offsets = pixels[start + 1:end] - pixels[start]
+        length = np.hypot(direction[0], direction[1])
+        if length > 0:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        else:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_pixels:
+            split = start + 1 + farthest
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+    return keep
+
+
+def simplify_polyline(columns, positions, projection, tolerance_pixels=0.5):
+    pixels, depths = projection.project(positions)
+    in_front = (depths > 0) & np.isfinite(pixels).all(axis=1)
+
+    # Vertices behind the camera (and their neighbours) are kept, and the runs in between are simplified separately
+    keep = ~in_front
+    keep[:-1] |= ~in_front[1:]
+    keep[1:] |= ~in_front[:-1]
+    if len(keep):
+        keep[0] = keep[-1] = True
+
+    anchors = np.flatnonzero(keep)
+    for start, end in zip(anchors[:-1], anchors[1:]):
+        if end - start >= 2 and in_front[start:end + 1].all():
+            keep[start:end + 1] |= douglas_peucker_mask(pixels[start:end + 1], tolerance_pixels)
+
+    return take_columns(columns, np.flatnonzero(keep))
+
+
+def apply_level_of_detail(columns, positions, projection, level_of_detail, type=None):
+    # Returns the reduced columns, columns and positions contain valid points only (see valid_point_mask)
+    settings = dict(LEVEL_OF_DETAIL_DEFAULTS, **{key: value for key, value in level_of_detail.items() if value is not None})
+    if type == 'line-primitive':
+        return simplify_polyline(columns, positions, projection, settings['line_tolerance_pixels'])
+    return reduce_points(columns, positions, projection, settings['point_cell_size_pixels'], settings['point_reduction'])
@@ -0,0 +1,187 @@
+# Binary scene payload: the scene configuration and scene elements as JSON index, with each element's points as float32 columns.
+#
+# Layout (little-endian):
+#   0   4 bytes  magic b'DCSE'
+#   4   uint32   format version
+#   8   uint64   byte offset of the JSON index
+#   16  uint64   byte length of the JSON index
+#   24  ...      point chunks, each 16-byte aligned; a chunk of n points stores n float32 values per field, field after field
+#   ...          UTF-8 JSON index:
+#                {
+#                    "configuration": {"camera_eye": [...], "camera_center": [...], "camera_fov_y_degrees": ..., "width": ..., "height": ...},
+#                    "scene_elements": [
+#                        {"id": ..., "type": ..., ..., "points": {"fields": ["x", "y", "z", "size", "r", "g", "b"], "count": n, "chunks": [{"offset": ..., "count": ...}, ...]}},
+#                        {"id": ..., "type": ..., "colormap": {...}, ..., "points": {"fields": ["x", "y", "z", "size", "value"], ...}},
+#                        ...
+#                    ]
+#                }
+#
+# The index comes last, so that writers can stream points without knowing the element count or properties up front.
+
+import json
+import struct
+
+from time import perf_counter
+
+import numpy as np
+
+from scene_arrays import POINT_FIELDS, COLORMAP_POINT_FIELDS, point_fields, points_to_columns
+
+MAGIC = b'DCSE'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sIQQ')
+CHUNK_ALIGNMENT = 16
+
+
+class ScenePayloadError(ValueError):
+    pass
+
+
+def is_scene_payload(prefix):
+    return prefix[:len(MAGIC)] == MAGIC
+
+
+class ScenePayloadWriter:
+    def __init__(self, f):
+        self.f = f
+        self.f.write(PREAMBLE.pack(MAGIC, VERSION, 0, 0))
+        self.offset = PREAMBLE.size
+        # Time spent converting and writing, as opposed to producing the points
+        self.write_seconds = 0.0
+
+    def write_points_chunk(self, columns, fields=POINT_FIELDS):
+        t_write_start = perf_counter()
+        count = len(columns[fields[0]])
+        padding = -self.offset % CHUNK_ALIGNMENT
+        self.f.write(b'\0' * padding)
+        self.offset += padding
+
+        chunk = {'offset': self.offset, 'count': count}
+        for field in fields:
+            values = np.ascontiguousarray(columns[field], dtype='<f4')
+            if len(values) != count:
+                raise ScenePayloadError(f"Column {field} has {len(values)} instead of {count} values")
+            self.f.write(values.tobytes())
+            self.offset += values.nbytes
+        self.write_seconds += perf_counter() - t_write_start
+        return chunk
+
+    def finish(self, configuration, scene_elements):
+        t_write_start = perf_counter()
+        index = json.dumps({'configuration': configuration, 'scene_elements': scene_elements}, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        index_offset = self.offset
+        self.f.write(index)
+        self.offset += len(index)
+        self.f.seek(0)
+        self.f.write(PREAMBLE.pack(MAGIC, VERSION, index_offset, len(index)))
+        self.f.seek(self.offset)
+        self.write_seconds += perf_counter() - t_write_start
+
+
+def write_scene_payload(f, configuration, scene_elements, fields=None):
+    # Points may be given as list of point objects (as in the JSON API) or as dict of columns, by default with the fields they have
+    writer = ScenePayloadWriter(f)
+    indexed_scene_elements = []
+    for scene_element in scene_elements:
+        indexed_scene_element = dict(scene_element)
+        points = scene_element.get('points')
+        if points is not None:
+            if isinstance(points, dict):
+                columns = points
+                element_fields = fields or point_fields(points)
+            else:
+                element_fields = fields or (point_fields(points[0]) if points else POINT_FIELDS)
+                columns = points_to_columns(points, element_fields)
+            chunk = writer.write_points_chunk(columns, element_fields)
+            indexed_scene_element['points'] = {'fields': element_fields, 'count': chunk['count'], 'chunks': [chunk]}
+        indexed_scene_elements.append(indexed_scene_element)
+    writer.finish(configuration, indexed_scene_elements)
+
+
+def read_scene_payload_index(f):
+    preamble = f.read(PREAMBLE.size)
+    if len(preamble) != PREAMBLE.size:
+        raise ScenePayloadError("Scene payload is truncated")
+    magic, version, index_offset, index_length = PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ScenePayloadError("Not a scene payload")
+    if version != VERSION:
+        raise ScenePayloadError(f"Unsupported scene payload version {version}")
+    f.seek(index_offset)
+    index = f.read(index_length)
+    if len(index) != index_length:
+        raise ScenePayloadError("Scene payload is truncated")
+    try:
+        index = json.loads(index)
+    except ValueError as error:
+        raise ScenePayloadError(f"Invalid scene payload index: {error}")
+    validate_scene_payload_index(index, index_offset)
+    return index
+
+
+def is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def validate_scene_payload_index(index, points_end):
+    # Points are stored between the preamble and the index, which starts at points_end
+    if not isinstance(index, dict) or not isinstance(index.get('configuration'), dict) or not isinstance(index.get('scene_elements'), list):
+        raise ScenePayloadError("Scene payload index needs a configuration object and a scene_elements list")
+    for scene_element in index['scene_elements']:
+        if not isinstance(scene_element, dict):
+            raise ScenePayloadError("Scene elements must be objects")
+        points = scene_element.get('points')
+        if points is None:
+            continue
+        element_id = scene_element.get('id')
+        if not isinstance(points, dict) or not isinstance(points.get('fields'), list) or not isinstance(points.get('chunks'), list) or not is_count(points.get('count')):
+            raise ScenePayloadError(f"Points of scene element {element_id} need fields, a count, and chunks")
+        fields = points['fields']
+        if not fields or not all(isinstance(field, str) for field in fields) or len(set(fields)) != len(fields):
+            raise ScenePayloadError(f"Points of scene element {element_id} need distinct field names")
+        # Blender reads positions, sizes, and colors or values of every point
+        if not (set(POINT_FIELDS) <= set(fields) or set(COLORMAP_POINT_FIELDS) <= set(fields)):
+            raise ScenePayloadError(f"Points of scene element {element_id} need the fields {POINT_FIELDS} or {COLORMAP_POINT_FIELDS}, not {fields}")
+        chunk_point_count = 0
+        for chunk in points['chunks']:
+            if not isinstance(chunk, dict) or not is_count(chunk.get('offset')) or not is_count(chunk.get('count')):
+                raise ScenePayloadError(f"Point chunks of scene element {element_id} need an offset and a count")
+            if chunk['offset'] < PREAMBLE.size or chunk['offset'] + len(fields) * chunk['count'] * 4 > points_end:
+                raise ScenePayloadError(f"Points of scene element {element_id} exceed the scene payload")
+            chunk_point_count += chunk['count']
+        if chunk_point_count != points['count']:
+            raise ScenePayloadError(f"Scene element {element_id} has {points['count']} points, but its chunks have {chunk_point_count}")
+
+
+def read_scene_payload(path, fields=None):
+    # Returns (configuration, scene_elements), with points as dict of float32 columns that map the file without copying it, by
+    # default the fields each scene element has, otherwise the given fields, NaN if a scene element does not have them
+    with open(path, 'rb') as f:
+        index = read_scene_payload_index(f)
+
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+
+    scene_elements = index['scene_elements']
+    for scene_element in scene_elements:
+        points = scene_element.get('points')
+        if points is None:
+            continue
+
+        chunk_columns = []
+        for chunk in points['chunks']:
+            columns = {}
+            for field_index, field in enumerate(points['fields']):
+                offset = chunk['offset'] + field_index * chunk['count'] * 4
+                columns[field] = np.frombuffer(data, dtype='<f4', count=chunk['count'], offset=offset)
+            chunk_columns.append(columns)
+
+        scene_element['points'] = {}
+        for field in fields or points['fields']:
+            if field not in points['fields']:
+                scene_element['points'][field] = np.full(points['count'], np.nan, dtype=np.float32)
+            elif len(chunk_columns) == 1:
+                scene_element['points'][field] = chunk_columns[0][field]
+            else:
+                scene_element['points'][field] = np.concatenate([columns[field] for columns in chunk_columns] or [np.empty(0, dtype=np.float32)])
+
+    return index['configuration'], scene_elements
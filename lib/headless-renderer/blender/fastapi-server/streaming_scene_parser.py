@@ -0,0 +1,205 @@
+# Incremental parser for JSON SceneRenderConfiguration bodies, which converts them into a binary scene payload (see scene_payload.py)
+# while they are received: points are parsed in batches and spilled to disk chunk by chunk, so memory stays bounded by the chunk size.
+
+import json
+import codecs
+
+from scene_arrays import POINT_FIELDS, point_fields, points_to_columns
+from scene_payload import ScenePayloadWriter
+
+WHITESPACE = ' \t\n\r'
+# Characters that may continue a JSON number, e.g., '45' of '45.5' or '1.5e' of '1.5e-3'
+NUMBER_CHARACTERS = '0123456789.eE+-'
+
+
+class SceneStreamError(ValueError):
+    pass
+
+
+class _TextReader:
+    def __init__(self, next_chunk, max_value_chars):
+        # next_chunk() returns the next bytes of the body, or b'' at its end
+        self.next_chunk = next_chunk
+        self.max_value_chars = max_value_chars
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.next_chunk()
+        if not chunk:
+            self.eof = True
+            text = self.decoder.decode(b'', final=True)
+        else:
+            text = self.decoder.decode(chunk)
+        # Drops everything that was consumed already
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise SceneStreamError("Unexpected end of JSON")
+
+    def next(self):
+        character = self.peek()
+        self.position += 1
+        return character
+
+    def expect(self, expected):
+        character = self.next()
+        if character != expected:
+            raise SceneStreamError(f"Expected '{expected}' but found '{character}'")
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.position)
+                # A number at the end of the buffer, or followed by what its parsed part stopped at (e.g., '45.' or '1.5e'), may
+                # continue in the next chunk
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                is_complete = end < len(self.buffer) and not (is_number and self.buffer[end] in NUMBER_CHARACTERS)
+                if is_complete or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError as error:
+                if self.eof:
+                    raise SceneStreamError(f"{error}")
+            if len(self.buffer) - self.position > self.max_value_chars:
+                raise SceneStreamError(f"JSON value exceeds {self.max_value_chars} characters")
+            self.fill()
+
+    def decode_object_batch(self):
+        # Fast path for arrays of flat objects: decodes all complete objects in the buffer at once. A cut inside a string or a
+        # nested value always yields invalid JSON, in which case None is returned and the caller falls back to decode_value().
+        array_end = self.buffer.find(']', self.position)
+        end = array_end if array_end != -1 else self.buffer.rfind('}', self.position) + 1
+        text = self.buffer[self.position:end]
+        if not text.strip(WHITESPACE):
+            return None
+        try:
+            values = json.loads(f"[{text}]")
+        except json.JSONDecodeError:
+            return None
+        self.position = end
+        return values
+
+
+def _iterate_object(reader):
+    # Yields the keys of a JSON object, the caller consumes each value
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.next()
+        return
+    while True:
+        key = reader.decode_value()
+        if not isinstance(key, str):
+            raise SceneStreamError(f"Expected an object key but found {key!r}")
+        reader.expect(':')
+        yield key
+        character = reader.next()
+        if character == '}':
+            return
+        if character != ',':
+            raise SceneStreamError(f"Expected ',' or '}}' but found '{character}'")
+
+
+def _parse_points(reader, writer, chunk_points):
+    chunks = []
+    pending_points = []
+    # The first point decides whether the scene element's points have colors or values, see point_fields
+    fields = []
+
+    def flush():
+        if pending_points:
+            if not fields:
+                fields.extend(point_fields(pending_points[0]))
+            chunks.append(writer.write_points_chunk(points_to_columns(pending_points, fields), fields))
+            pending_points.clear()
+
+    # Points with nested values never decode as batch, so they are decoded one at a time after the first failed attempt
+    batching = True
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.next()
+    else:
+        while True:
+            batch = reader.decode_object_batch() if batching else None
+            if batch is None:
+                batching = batching and reader.buffer.find('}', reader.position) == -1
+                batch = [reader.decode_value()]
+            for point in batch:
+                if not isinstance(point, dict):
+                    raise SceneStreamError(f"Expected a point object but found {point!r}")
+            pending_points.extend(batch)
+            if len(pending_points) >= chunk_points:
+                flush()
+
+            character = reader.next()
+            if character == ']':
+                break
+            if character != ',':
+                raise SceneStreamError(f"Expected ',' or ']' but found '{character}'")
+    flush()
+
+    return {'fields': fields or POINT_FIELDS, 'count': sum(chunk['count'] for chunk in chunks), 'chunks': chunks}
+
+
+def _parse_scene_element(reader, writer, chunk_points):
+    scene_element = {}
+    for key in _iterate_object(reader):
+        if key == 'points' and reader.peek() == '[':
+            scene_element[key] = _parse_points(reader, writer, chunk_points)
+        else:
+            scene_element[key] = reader.decode_value()
+    return scene_element
+
+
+def _parse_scene_elements(reader, writer, chunk_points):
+    scene_elements = []
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.next()
+        return scene_elements
+    while True:
+        if reader.peek() != '{':
+            raise SceneStreamError(f"Expected a scene element object but found '{reader.peek()}'")
+        scene_elements.append(_parse_scene_element(reader, writer, chunk_points))
+        character = reader.next()
+        if character == ']':
+            return scene_elements
+        if character != ',':
+            raise SceneStreamError(f"Expected ',' or ']' but found '{character}'")
+
+
+def parse_scene_stream(next_chunk, f, chunk_points=65536, max_value_chars=2 ** 20):
+    # Writes the binary scene payload to f and returns (configuration, point_count, write_seconds), configuration without the scene elements
+    reader = _TextReader(next_chunk, max_value_chars)
+    writer = ScenePayloadWriter(f)
+
+    configuration = {}
+    scene_elements = None
+    for key in _iterate_object(reader):
+        if key == 'scene_elements' and reader.peek() == '[':
+            scene_elements = _parse_scene_elements(reader, writer, chunk_points)
+        else:
+            configuration[key] = reader.decode_value()
+
+    while reader.position < len(reader.buffer) or reader.fill():
+        if reader.buffer[reader.position:].strip(WHITESPACE):
+            raise SceneStreamError("Unexpected data after JSON")
+        reader.position = len(reader.buffer)
+
+    writer.finish(configuration, scene_elements or [])
+    point_count = sum(scene_element['points']['count'] for scene_element in scene_elements or [] if isinstance(scene_element.get('points'), dict))
+    return configuration, point_count, writer.write_seconds
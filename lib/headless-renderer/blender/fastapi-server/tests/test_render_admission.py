@@ -0,0 +1,147 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+from render_admission import RenderAdmissionController, render_cost
+
+
+def admission_controller(**kwargs):
+    return RenderAdmissionController(**dict({'max_concurrent': 1, 'max_queue_depth': 10, 'max_queue_wait_seconds': 5}, **kwargs))
+
+
+async def render(admission, client, cost, started, release):
+    # Records the order in which renderings start, and holds the slot until release is set
+    async with admission.admit(client, cost):
+        started.append((client, cost))
+        await release.wait()
+
+
+class RenderAdmissionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.started = []
+        self.release = asyncio.Event()
+        self.tasks = []
+
+    async def asyncTearDown(self):
+        self.release.set()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def queue(self, admission, client, cost, release=None):
+        task = asyncio.ensure_future(render(admission, client, cost, self.started, release or self.release))
+        self.tasks.append(task)
+        await asyncio.sleep(0)
+        return task
+
+    async def finish_all(self):
+        self.release.set()
+        await asyncio.wait_for(asyncio.gather(*self.tasks), timeout=5)
+
+    async def test_small_renderings_pass_large_ones(self):
+        admission = admission_controller()
+        await self.queue(admission, 'blocker', 1)
+        await self.queue(admission, 'a', 100)
+        await self.queue(admission, 'b', 1)
+        self.assertEqual((admission.in_flight, admission.queue_depth), (1, 2))
+        await self.finish_all()
+        self.assertEqual(self.started, [('blocker', 1), ('b', 1), ('a', 100)])
+        self.assertEqual((admission.in_flight, admission.queue_depth), (0, 0))
+
+    async def test_clients_take_turns(self):
+        # Client a already rendered a lot, so b's rendering starts before a's, although it was queued last
+        admission = admission_controller()
+        await self.queue(admission, 'a', 100)
+        await self.queue(admission, 'a', 10)
+        await self.queue(admission, 'a', 10)
+        await self.queue(admission, 'b', 10)
+        await self.finish_all()
+        self.assertEqual([client for client, _ in self.started], ['a', 'b', 'a', 'a'])
+        self.assertEqual({client['client']: client['started'] for client in admission.to_dict()['clients']}, {'a': 3, 'b': 1})
+
+    async def test_recent_cost_decays(self):
+        admission = admission_controller(fairness_half_life_seconds=0.05)
+        await self.queue(admission, 'a', 100)
+        await self.queue(admission, 'a', 10)
+        await asyncio.sleep(0.5)
+        await self.queue(admission, 'b', 11)
+        await self.finish_all()
+        self.assertEqual(self.started, [('a', 100), ('a', 10), ('b', 11)])
+
+    async def test_starving_rendering_starts_first(self):
+        admission = admission_controller(starvation_seconds=0.05)
+        await self.queue(admission, 'blocker', 1)
+        await self.queue(admission, 'a', 1000)
+        await asyncio.sleep(0.1)
+        await self.queue(admission, 'b', 1)
+        await self.finish_all()
+        self.assertEqual(self.started, [('blocker', 1), ('a', 1000), ('b', 1)])
+
+    async def test_queue_depth(self):
+        admission = admission_controller(max_queue_depth=2, max_client_queue_depth=1)
+        await self.queue(admission, 'blocker', 1)
+        await self.queue(admission, 'a', 1)
+        with self.assertRaises(HTTPException) as context:
+            admission.ensure_queue_capacity('a')
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(admission.clients['a'].rejected, 1)
+
+        await self.queue(admission, 'b', 1)
+        for client in ['b', 'c', None]:
+            with self.subTest(client=client):
+                with self.assertRaises(HTTPException) as context:
+                    async with admission.admit(client, 1):
+                        pass
+                self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(admission.queue_depth, 2)
+
+    async def test_queue_wait_timeout(self):
+        admission = admission_controller(max_queue_wait_seconds=0.05)
+        await self.queue(admission, 'blocker', 1)
+        with self.assertRaises(HTTPException) as context:
+            async with admission.admit('a', 1):
+                pass
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(admission.clients['a'].rejected, 1)
+        self.assertEqual((admission.in_flight, admission.queue_depth), (1, 0))
+
+    async def test_cancelled_renderings_leave_the_queue(self):
+        admission = admission_controller()
+        blocker_release = asyncio.Event()
+        await self.queue(admission, 'blocker', 1, release=blocker_release)
+        queued = await self.queue(admission, 'a', 1)
+        await self.queue(admission, 'b', 1)
+        queued.cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual((admission.in_flight, admission.queue_depth), (1, 1))
+        self.assertEqual(len(admission.clients['a'].queued), 0)
+
+        # Cancelling a rendering that holds a slot frees the slot for the next one
+        self.tasks[0].cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.started, [('blocker', 1), ('b', 1)])
+        self.assertEqual((admission.in_flight, admission.queue_depth), (1, 0))
+
+        self.release.set()
+        await asyncio.wait_for(self.tasks[2], timeout=5)
+        self.assertEqual((admission.in_flight, admission.queue_depth), (0, 0))
+        self.assertEqual([client['in_flight'] for client in admission.to_dict()['clients']], [0, 0, 0])
+
+
+class RenderCostTest(unittest.TestCase):
+    def test_render_cost(self):
+        self.assertEqual(render_cost(10, 4, 2), 80)
+        self.assertEqual(render_cost(10, 4, 2, scene_element_count=2), 2010 * 8)
+        # Scenes without points still cost their resolution
+        self.assertEqual(render_cost(0, 4, 2), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import os
+import sys
+import uuid
+import tempfile
+import unittest
+import subprocess
+
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render_artifacts import RenderArtifactJanitor
+
+
+class RenderArtifactJanitorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def artifact(self, name=None, age_seconds=0, size=10):
+        path = os.path.join(self.directory.name, name or f"{uuid.uuid4()}.log")
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (time() - age_seconds, time() - age_seconds))
+        return path
+
+    def remaining(self, *paths):
+        return [path for path in paths if os.path.exists(path)]
+
+    def test_release(self):
+        cases = [('none', True, False), ('none', False, False), ('on-failure', True, False), ('on-failure', False, True), ('keep', True, True)]
+        for retention, succeeded, kept in cases:
+            with self.subTest(retention=retention, succeeded=succeeded):
+                janitor = RenderArtifactJanitor(self.directory.name, retention=retention)
+                paths = [self.artifact(), self.artifact()]
+                janitor.register(*paths, None)
+                janitor.release(*paths, os.path.join(self.directory.name, 'missing.png'), None, succeeded=succeeded)
+                self.assertEqual(self.remaining(*paths), paths if kept else [])
+
+    def test_unknown_retention(self):
+        with self.assertRaises(ValueError):
+            RenderArtifactJanitor(self.directory.name, retention='always')
+
+    def test_sweep_retention_period(self):
+        janitor = RenderArtifactJanitor(self.directory.name, retention='keep', retention_seconds=60)
+        recent = self.artifact(age_seconds=10)
+        expired = self.artifact(age_seconds=100)
+        active = self.artifact(age_seconds=100)
+        kept_profile = self.artifact(f"{uuid.uuid4()}.prof", age_seconds=10)
+        # Files that are not renderings' are left alone
+        other = self.artifact('scene.blend', age_seconds=100)
+        janitor.register(active, kept_profile)
+        janitor.keep(kept_profile)
+        janitor.sweep()
+        self.assertEqual(self.remaining(recent, expired, active, kept_profile, other), [recent, active, kept_profile, other])
+
+    def test_sweep_size_limit(self):
+        # Newest first, until the limit
+        janitor = RenderArtifactJanitor(self.directory.name, retention='keep', max_bytes=25)
+        paths = [self.artifact(age_seconds=age_seconds) for age_seconds in [30, 20, 10]]
+        janitor.sweep()
+        self.assertEqual(self.remaining(*paths), paths[1:])
+
+    def test_sweep_worker_logs(self):
+        janitor = RenderArtifactJanitor(self.directory.name, retention_seconds=60)
+        # Logs of running workers are kept however old they are
+        exited_process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited_process.wait()
+        running_worker_log = self.artifact(f"worker_{os.getpid()}.log", age_seconds=100)
+        exited_worker_log = self.artifact(f"worker_{exited_process.pid}.log", age_seconds=100)
+        janitor.sweep()
+        self.assertEqual(self.remaining(running_worker_log, exited_worker_log), [running_worker_log])
+
+
+if __name__ == '__main__':
+    unittest.main()
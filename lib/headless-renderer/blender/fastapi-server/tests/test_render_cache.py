@@ -0,0 +1,149 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render_cache import RenderCache, render_cache_key, renderer_version
+
+
+class Renderer:
+    # Renders b'png <key>' after release is set, and counts its renderings
+    def __init__(self, key):
+        self.key = key
+        self.renderings = 0
+        self.started = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, on_start, on_event):
+        self.started += 1
+        on_start()
+        on_event({'type': 'progress', 'progress': 0.5})
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.renderings += 1
+        return f"png {self.key}".encode('utf-8')
+
+
+class RenderCacheKeyTest(unittest.TestCase):
+    def test_render_cache_key(self):
+        key = render_cache_key({'width': 2, 'camera_eye': [1, 2, 3]}, 'v1')
+        self.assertEqual(key, render_cache_key({'camera_eye': [1, 2, 3], 'width': 2}, 'v1'))
+        self.assertNotEqual(key, render_cache_key({'camera_eye': [1, 2, 3], 'width': 2}, 'v2'))
+        self.assertNotEqual(key, render_cache_key({'camera_eye': [1, 2, 3], 'width': 3}, 'v1'))
+
+    def test_renderer_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'script.py')
+            with open(path, 'w') as f:
+                f.write('a')
+            version = renderer_version([path], {'profile': 'fast'})
+            self.assertEqual(version, renderer_version([path], {'profile': 'fast'}))
+            self.assertNotEqual(version, renderer_version([path], {'profile': 'default'}))
+            with open(path, 'w') as f:
+                f.write('b')
+            self.assertNotEqual(version, renderer_version([path], {'profile': 'fast'}))
+
+
+class RenderCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def render_cache(self, memory_max_bytes=1000, disk_max_bytes=1000, disk_max_age_seconds=3600):
+        return RenderCache(self.directory.name, memory_max_bytes, disk_max_bytes, disk_max_age_seconds)
+
+    async def test_identical_renderings_are_rendered_once(self):
+        render_cache = self.render_cache()
+        render = Renderer('a')
+        started, events = [], []
+        waiters = [asyncio.ensure_future(render_cache.get_or_render('a', render, on_start=lambda: started.append(True), on_event=events.append)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        render.release.set()
+        self.assertEqual(await asyncio.wait_for(asyncio.gather(*waiters), timeout=5), [b'png a'] * 3)
+        self.assertEqual(render.renderings, 1)
+        self.assertEqual(len(started), 3)
+        self.assertEqual(len(events), 3)
+
+        # Cached from here on, unless the rendering must run, e.g., to be profiled
+        self.assertEqual(await render_cache.get_or_render('a', render), b'png a')
+        self.assertEqual(render.renderings, 1)
+        self.assertEqual(await render_cache.get_or_render('a', render, use_cached=False), b'png a')
+        self.assertEqual(render.renderings, 2)
+
+    async def test_rendering_is_cancelled_once_nobody_waits(self):
+        render_cache = self.render_cache()
+        render = Renderer('a')
+        waiters = [asyncio.ensure_future(render_cache.get_or_render('a', render)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(render.cancelled, 0)
+        waiters[1].cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(render.cancelled, 1)
+
+        # The next request renders anew
+        render.release.set()
+        self.assertEqual(await render_cache.get_or_render('a', render), b'png a')
+        self.assertEqual(render.started, 2)
+
+    async def test_failed_renderings_are_not_cached(self):
+        render_cache = self.render_cache()
+
+        async def fail(on_start, on_event):
+            raise RuntimeError("Blender crashed")
+
+        with self.assertRaises(RuntimeError):
+            await render_cache.get_or_render('a', fail)
+        self.assertIsNone(render_cache.get('a'))
+        render = Renderer('a')
+        render.release.set()
+        self.assertEqual(await render_cache.get_or_render('a', render), b'png a')
+
+    async def test_memory_eviction(self):
+        # Least recently used first, the disk tier is off
+        render_cache = self.render_cache(memory_max_bytes=30, disk_max_bytes=0)
+        for key in ['a', 'b', 'c']:
+            render_cache.put(key, b'x' * 10)
+        render_cache.get('a')
+        render_cache.put('d', b'x' * 10)
+        self.assertEqual([key for key in 'abcd' if render_cache.get(key) is not None], ['a', 'c', 'd'])
+        # Images larger than the memory tier are not kept in it
+        render_cache.put('e', b'x' * 31)
+        self.assertIsNone(render_cache.get('e'))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    async def test_disk_tier(self):
+        render_cache = self.render_cache(memory_max_bytes=0)
+        render_cache.put('a', b'png a')
+        self.assertEqual(render_cache.get('a'), b'png a')
+        # Another server process shares the directory
+        self.assertEqual(self.render_cache().get('a'), b'png a')
+
+    async def test_disk_eviction(self):
+        render_cache = self.render_cache(memory_max_bytes=0, disk_max_bytes=25)
+        for key, age_seconds in [('a', 300), ('b', 200), ('c', 10)]:
+            render_cache.put(key, b'x' * 10)
+            os.utime(os.path.join(self.directory.name, f"{key}.png"), (time() - age_seconds, time() - age_seconds))
+        render_cache.prune_disk()
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['b.png', 'c.png'])
+
+        # Entries expire by the time they were last used
+        render_cache = self.render_cache(memory_max_bytes=0, disk_max_age_seconds=60)
+        self.assertIsNone(render_cache.get('b'))
+        self.assertEqual(os.listdir(self.directory.name), ['c.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
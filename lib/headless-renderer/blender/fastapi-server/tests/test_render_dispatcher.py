@@ -0,0 +1,92 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+from time import monotonic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render_dispatcher import RenderDispatcher, parse_server_timing
+
+
+def render_dispatcher(backend_count=2, **kwargs):
+    return RenderDispatcher([f"http://backend{index}:8000/" for index in range(backend_count)], **kwargs)
+
+
+class RenderDispatcherTest(unittest.TestCase):
+    def test_backend_that_finishes_first(self):
+        dispatcher = render_dispatcher()
+        fast, slow = dispatcher.backends
+        fast.cost_per_second, slow.cost_per_second = 10.0, 1.0
+        self.assertIs(dispatcher.choose_backend(10, []), fast)
+        self.assertEqual((fast.in_flight, fast.in_flight_cost), (1, 10))
+        # 100 in flight on the fast backend take as long as 10 on the slow one
+        fast.in_flight_cost = 100
+        self.assertIs(dispatcher.choose_backend(10, []), slow)
+        self.assertEqual(dispatcher.in_flight, 2)
+
+    def test_backends_without_throughput(self):
+        # Backends that did not render yet are assumed to be as fast as the median of the others
+        dispatcher = render_dispatcher(3)
+        dispatcher.backends[0].cost_per_second = 1.0
+        dispatcher.backends[1].cost_per_second = 4.0
+        dispatcher.backends[1].in_flight_cost = 20
+        dispatcher.backends[2].in_flight_cost = 30
+        self.assertIs(dispatcher.choose_backend(10, []), dispatcher.backends[1])
+
+        # With none measured, by cost in flight, then by renderings in flight
+        dispatcher = render_dispatcher(3)
+        dispatcher.backends[0].in_flight_cost = 5
+        self.assertIs(dispatcher.choose_backend(10, []), dispatcher.backends[1])
+        self.assertIs(dispatcher.choose_backend(0, []), dispatcher.backends[2])
+
+    def test_excluded_backends(self):
+        dispatcher = render_dispatcher()
+        self.assertIs(dispatcher.choose_backend(10, [dispatcher.backends[0]]), dispatcher.backends[1])
+        self.assertIsNone(dispatcher.choose_backend(10, dispatcher.backends))
+
+    def test_failed_backends_cool_down(self):
+        dispatcher = render_dispatcher(failure_cooldown_seconds=60)
+        failing, other = dispatcher.backends
+        other.in_flight_cost = 1000
+        self.assertIs(dispatcher.choose_backend(10, []), failing)
+        dispatcher.finish(failing, 10, failed=True)
+        self.assertEqual((failing.failed, failing.consecutive_failures, failing.in_flight, failing.in_flight_cost), (1, 1, 0, 0))
+        self.assertAlmostEqual(failing.unavailable_until - monotonic(), 60, delta=1)
+        self.assertIs(dispatcher.choose_backend(10, []), other)
+        dispatcher.finish(other, 10)
+
+        # If all other backends are excluded, a cooling down one is tried anyway, and its cooldown doubles with each failure in a row
+        self.assertIs(dispatcher.choose_backend(10, [other]), failing)
+        dispatcher.finish(failing, 10, failed=True)
+        self.assertEqual((failing.failed, failing.consecutive_failures), (2, 2))
+        self.assertAlmostEqual(failing.unavailable_until - monotonic(), 120, delta=1)
+        self.assertFalse(dispatcher.to_dict()['backends'][0]['available'])
+
+        self.assertIs(dispatcher.choose_backend(10, [other]), failing)
+        dispatcher.finish(failing, 10)
+        self.assertEqual((failing.consecutive_failures, failing.unavailable_until), (0, 0.0))
+        self.assertTrue(dispatcher.to_dict()['backends'][0]['available'])
+
+    def test_throughput(self):
+        dispatcher = render_dispatcher(throughput_smoothing=0.5)
+        backend = dispatcher.backends[0]
+        for cost, seconds, cost_per_second in [(100, 10, 10.0), (300, 10, 20.0), (300, None, 20.0)]:
+            dispatcher.choose_backend(cost, [dispatcher.backends[1]])
+            dispatcher.finish(backend, cost, seconds=seconds)
+            self.assertEqual(backend.cost_per_second, cost_per_second)
+        # Renderings served from the backend's cache (without seconds) are not counted
+        self.assertEqual((backend.rendered, backend.in_flight, backend.in_flight_cost), (2, 0, 0))
+        self.assertEqual(dispatcher.to_dict()['backends'][0]['url'], 'http://backend0:8000')
+
+
+class ServerTimingTest(unittest.TestCase):
+    def test_parse_server_timing(self):
+        self.assertEqual(parse_server_timing('queue_wait;dur=1.5, blender;dur=2000, tile_stitch;desc="x";dur=3, invalid;dur=a, count'), {'queue_wait': 0.0015, 'blender': 2.0, 'tile_stitch': 0.003})
+        self.assertEqual(parse_server_timing(None), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
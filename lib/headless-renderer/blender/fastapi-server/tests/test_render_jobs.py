@@ -0,0 +1,110 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+from render_jobs import RenderJobRegistry
+
+
+async def render_png(render_job):
+    render_job.mark_running()
+    render_job.on_event({'type': 'progress', 'stage': 'render', 'progress': 0.5})
+    render_job.on_event({'type': 'timings', 'timings': {'blender': 1.0}, 'profile_id': 'p'})
+    render_job.result = b'png'
+
+
+async def render_forever(render_job):
+    render_job.mark_running()
+    await asyncio.Event().wait()
+
+
+def fail_with(error):
+    async def run(render_job):
+        raise error
+    return run
+
+
+class RenderJobRegistryTest(unittest.IsolatedAsyncioTestCase):
+    async def test_succeeded(self):
+        registry = RenderJobRegistry()
+        render_job = registry.submit(render_png)
+        self.assertEqual(render_job.status, 'queued')
+        await registry.wait(render_job)
+
+        self.assertIs(registry.get(render_job.id), render_job)
+        self.assertEqual(render_job.result, b'png')
+        job = render_job.to_dict()
+        self.assertEqual((job['status'], job['stage'], job['progress'], job['error']), ('succeeded', 'render', 1.0, None))
+        self.assertEqual(job['timings'], {'blender': 1.0})
+        self.assertEqual(job['profile_url'], '/profiles/p')
+        self.assertLessEqual(job['created_at'], job['started_at'])
+        self.assertLessEqual(job['started_at'], job['finished_at'])
+
+    async def test_failed(self):
+        registry = RenderJobRegistry()
+        for error, message in [(HTTPException(status_code=503, detail="No worker"), "No worker"), (RuntimeError("Blender crashed"), "Blender crashed")]:
+            with self.subTest(error=error):
+                render_job = registry.submit(fail_with(error))
+                await registry.wait(render_job)
+                self.assertEqual((render_job.status, render_job.error), ('failed', message))
+                self.assertIsNotNone(render_job.finished_at)
+
+    async def test_cancel(self):
+        registry = RenderJobRegistry()
+        render_job = registry.submit(render_forever)
+        await asyncio.sleep(0)
+        self.assertEqual(render_job.status, 'running')
+        registry.cancel(render_job.id)
+        await registry.wait(render_job)
+        self.assertEqual(render_job.status, 'cancelled')
+        self.assertTrue(render_job.is_finished)
+
+        # Cancelling a finished job leaves it as it is
+        render_job = registry.submit(render_png)
+        await registry.wait(render_job)
+        registry.cancel(render_job.id)
+        self.assertEqual(render_job.status, 'succeeded')
+
+    async def test_unknown_job(self):
+        registry = RenderJobRegistry()
+        for method in [registry.get, registry.cancel]:
+            with self.subTest(method=method.__name__):
+                with self.assertRaises(HTTPException) as context:
+                    method('unknown')
+                self.assertEqual(context.exception.status_code, 404)
+
+    async def test_expire(self):
+        registry = RenderJobRegistry(abandon_after_seconds=0, keep_finished_seconds=0)
+        abandoned = registry.submit(render_forever)
+        waited_for = registry.submit(render_forever)
+        waiter = asyncio.ensure_future(registry.wait(waited_for))
+        finished = registry.submit(render_png)
+        await registry.wait(finished)
+        await asyncio.sleep(0.01)
+
+        # Abandoned jobs are cancelled, and removed once they were kept as finished long enough, unless a request waits for them
+        registry.expire()
+        await asyncio.sleep(0)
+        self.assertEqual(abandoned.status, 'cancelled')
+        self.assertEqual(waited_for.status, 'running')
+        with self.assertRaises(HTTPException):
+            registry.get(finished.id)
+        await asyncio.sleep(0.01)
+        registry.expire()
+        with self.assertRaises(HTTPException):
+            registry.get(abandoned.id)
+        self.assertIs(registry.get(waited_for.id), waited_for)
+
+        registry.cancel(waited_for.id)
+        await asyncio.wait_for(waiter, timeout=5)
+        self.assertEqual((waited_for.status, waited_for.waiters), ('cancelled', 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import os
+import sys
+import zlib
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render_tiles import PNG_SIGNATURE, TileImageError, auto_tile_count, blender_render_region, read_targa, stitch_tile_files, stitch_tiles, tile_grid
+
+
+def image(width, height, channels=4):
+    # Pixels that encode their position, so that misplaced tiles show
+    ys, xs = np.mgrid[0:height, 0:width]
+    return np.stack([xs % 256, ys % 256, (xs * ys) % 256, np.full_like(xs, 255)][:channels], axis=2).astype(np.uint8)
+
+
+def targa(pixels, top_left=False):
+    # As Blender writes with TARGA_RAW: BGR(A) rows from the bottom, unless the descriptor says top-left origin
+    height, width, channels = pixels.shape
+    rows = pixels[:, :, [2, 1, 0, 3][:channels]] if channels >= 3 else pixels
+    if not top_left:
+        rows = rows[::-1]
+    header = struct.pack('<BBBHHBHHHHBB', 0, 0, 2 if channels >= 3 else 3, 0, 0, 0, 0, 0, width, height, channels * 8, 0x20 if top_left else 0)
+    return header + np.ascontiguousarray(rows).tobytes()
+
+
+def decode_png(png):
+    # Only the PNGs of encode_png: one IDAT chunk, Up filter on all rows
+    width, height, _, color_type = struct.unpack('>IIBB', png[16:26])
+    channels = {0: 1, 4: 2, 2: 3, 6: 4}[color_type]
+    idat_length = struct.unpack('>I', png[33:37])[0]
+    rows = np.frombuffer(zlib.decompress(png[41:41 + idat_length]), dtype=np.uint8).reshape(height, width * channels + 1)
+    assert (rows[:, 0] == 2).all()
+    return np.cumsum(rows[:, 1:], axis=0, dtype=np.uint8).reshape(height, width, channels)
+
+
+class TileGridTest(unittest.TestCase):
+    def test_auto_tile_count(self):
+        cases = [
+            ((2560, 379, 4, 100000, 16), 4),
+            ((2560, 379, 32, 100000, 16), 9),
+            ((2560, 379, 32, 10000, 16), 16),
+            ((100, 100, 4, 100000, 16), 1),
+            ((2560, 379, 0, 100000, 16), 1),
+        ]
+        for args, count in cases:
+            with self.subTest(args=args):
+                self.assertEqual(auto_tile_count(*args), count)
+
+    def test_tile_grid_covers_the_image(self):
+        for width, height, count in [(2560, 379, 4), (1000, 1000, 4), (7, 5, 6), (10, 10, 5), (3, 1, 8), (1, 1, 4)]:
+            with self.subTest(width=width, height=height, count=count):
+                covered = np.zeros((height, width), dtype=np.int32)
+                tiles = tile_grid(width, height, count)
+                for tile in tiles:
+                    covered[tile['y']:tile['y'] + tile['height'], tile['x']:tile['x'] + tile['width']] += 1
+                    self.assertGreater(tile['width'] * tile['height'], 0)
+                self.assertTrue((covered == 1).all())
+                self.assertEqual(len(tiles), min(count, width * height))
+
+    def test_tile_grid_is_square(self):
+        # A wide image is split into columns, a square one into a grid
+        self.assertEqual({tile['y'] for tile in tile_grid(2560, 379, 4)}, {0})
+        self.assertEqual(len({tile['x'] for tile in tile_grid(1000, 1000, 4)}), 2)
+
+    def test_blender_render_region(self):
+        # Blender's pixels of the region, whether it truncates or rounds border * size, are the tile's
+        for width, height, count in [(2560, 379, 7), (7, 5, 6), (1920, 1080, 16)]:
+            for tile in tile_grid(width, height, count):
+                with self.subTest(width=width, height=height, tile=tile):
+                    region = blender_render_region(tile, width, height)
+                    for to_pixel in [int, round]:
+                        self.assertEqual((to_pixel(region['min_x'] * width), to_pixel(region['max_x'] * width)), (tile['x'], tile['x'] + tile['width']))
+                        self.assertEqual((to_pixel(region['min_y'] * height), to_pixel(region['max_y'] * height)), (height - tile['y'] - tile['height'], height - tile['y']))
+
+
+class TileStitchingTest(unittest.TestCase):
+    def test_read_targa(self):
+        for channels in [1, 3, 4]:
+            for top_left in [False, True]:
+                with self.subTest(channels=channels, top_left=top_left):
+                    pixels = image(5, 3, channels)
+                    np.testing.assert_array_equal(read_targa(targa(pixels, top_left)), pixels)
+
+    def test_invalid_targa(self):
+        data = targa(image(5, 3))
+        run_length_encoded = data[:2] + bytes([10]) + data[3:]
+        sixteen_bits = data[:16] + bytes([16]) + data[17:]
+        for name, invalid in [('truncated header', data[:10]), ('truncated pixels', data[:-1]), ('run-length encoded', run_length_encoded), ('16 bits', sixteen_bits)]:
+            with self.subTest(name):
+                with self.assertRaises(TileImageError):
+                    read_targa(invalid)
+
+    def test_stitch_tile_files(self):
+        width, height = 23, 11
+        pixels = image(width, height)
+        tiles = tile_grid(width, height, 6)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for index, tile in enumerate(tiles):
+                paths.append(os.path.join(directory, f"tile{index}.tga"))
+                with open(paths[-1], 'wb') as f:
+                    f.write(targa(pixels[tile['y']:tile['y'] + tile['height'], tile['x']:tile['x'] + tile['width']]))
+            png = stitch_tile_files(tiles, paths, width, height)
+        self.assertTrue(png.startswith(PNG_SIGNATURE))
+        np.testing.assert_array_equal(decode_png(png), pixels)
+
+    def test_stitch_tiles_of_wrong_size(self):
+        tiles = tile_grid(10, 10, 2)
+        with self.assertRaises(TileImageError):
+            stitch_tiles(tiles, [image(5, 10), image(4, 10)], 10, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
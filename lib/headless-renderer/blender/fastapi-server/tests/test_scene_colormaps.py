@@ -0,0 +1,96 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_colormaps import LOOKUP_TABLE_SIZE, ColormapError, apply_colormap, colormap_lookup_table, validate_scene_colormaps
+
+BLACK_TO_WHITE = {'colors': [[0, 0, 0], [1, 1, 1]]}
+RED_GREEN_BLUE = {'colors': [[1, 0, 0], [0, 1, 0], [0, 0, 1]], 'interpolate': False}
+
+
+def colors(values, colormap):
+    return np.stack(apply_colormap(np.asarray(values, dtype=np.float32), colormap), axis=1)
+
+
+class ColormapLookupTest(unittest.TestCase):
+    def test_interpolated(self):
+        r, g, b = apply_colormap(np.array([0, 0.5, 1], dtype=np.float32), BLACK_TO_WHITE)
+        # Interpolated in sRGB, converted to linear colors
+        np.testing.assert_allclose(r, [0, 0.5 ** 2.2, 1], atol=1e-3)
+        np.testing.assert_array_equal(r, g)
+        np.testing.assert_array_equal(r, b)
+
+    def test_classes(self):
+        # Each color covers an equal part of the domain
+        np.testing.assert_array_equal(colors([0, 0.3, 0.34, 0.66, 0.67, 1], RED_GREEN_BLUE), [[1, 0, 0], [1, 0, 0], [0, 1, 0], [0, 1, 0], [0, 0, 1], [0, 0, 1]])
+
+    def test_domain(self):
+        colormap = dict(RED_GREEN_BLUE, domain=[10, 40])
+        # Values outside the domain are clamped, missing values take the lowest color
+        np.testing.assert_array_equal(colors([15, 25, 35, -100, 100, np.nan], colormap), [[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 0, 0], [0, 0, 1], [1, 0, 0]])
+        np.testing.assert_array_equal(colors([5, 15], dict(RED_GREEN_BLUE, domain=[10, 10])), [[1, 0, 0], [1, 0, 0]])
+
+    def test_positions(self):
+        colormap = dict(BLACK_TO_WHITE, colors=[[0, 0, 0], [1, 1, 1], [1, 1, 1]], positions=[0, 0.25, 1])
+        np.testing.assert_allclose(colors([0.125, 0.5], colormap)[:, 0], [0.5 ** 2.2, 1], atol=1e-2)
+
+    def test_presets(self):
+        cases = [
+            # Diverging and sequential presets are interpolated by default, qualitative ones are not
+            ({'preset': 'colorbrewer', 'identifier': 'Spectral'}, LOOKUP_TABLE_SIZE, True),
+            ({'preset': 'colorbrewer', 'identifier': 'Set2'}, 8, False),
+            # The preset's colors for the number of stops, or its most colors resampled
+            ({'preset': 'colorbrewer', 'identifier': 'Set2', 'stops': 4}, 4, False),
+            ({'preset': 'colorbrewer', 'identifier': 'Set2', 'stops': 20}, 20, False),
+            ({'preset': 'colorbrewer', 'identifier': 'Spectral', 'stops': 5, 'interpolate': False}, 5, False),
+        ]
+        for colormap, size, interpolate in cases:
+            with self.subTest(colormap=colormap):
+                lookup_table, interpolated = colormap_lookup_table(colormap)
+                self.assertEqual(lookup_table.shape, (size, 3))
+                self.assertEqual(lookup_table.dtype, np.float32)
+                self.assertEqual(interpolated, interpolate)
+                self.assertTrue(np.all((lookup_table >= 0) & (lookup_table <= 1)))
+
+        # Set2 starts with rgb(102, 194, 165)
+        lookup_table, _ = colormap_lookup_table({'preset': 'colorbrewer', 'identifier': 'Set2', 'stops': 3})
+        np.testing.assert_allclose(lookup_table[0], (np.array([102, 194, 165]) / 255) ** 2.2, rtol=1e-5)
+
+    def test_invalid_colormaps(self):
+        colormaps = {
+            'not an object': [0, 1],
+            'neither preset nor colors': {'identifier': 'Spectral'},
+            'unknown preset': {'preset': 'unknown', 'identifier': 'Spectral'},
+            'preset outside the directory': {'preset': '../colorbrewer', 'identifier': 'Spectral'},
+            'preset not a name': {'preset': 3, 'identifier': 'Spectral'},
+            'unknown identifier': {'preset': 'colorbrewer', 'identifier': 'Unknown'},
+            'one stop': {'preset': 'colorbrewer', 'identifier': 'Spectral', 'stops': 1},
+            'no colors': {'colors': []},
+            'colors not triples': {'colors': [[0, 0], [1, 1]]},
+            'positions descending': dict(BLACK_TO_WHITE, positions=[1, 0]),
+            'positions not one per color': dict(BLACK_TO_WHITE, positions=[0]),
+            'domain not two numbers': dict(BLACK_TO_WHITE, domain=[0, 'a']),
+        }
+        for name, colormap in colormaps.items():
+            with self.subTest(name):
+                with self.assertRaises(ColormapError):
+                    colormap_lookup_table(colormap)
+
+    def test_validate_scene_colormaps(self):
+        color_points = {'fields': ['x', 'y', 'z', 'size', 'r', 'g', 'b']}
+        value_points = {'fields': ['x', 'y', 'z', 'size', 'value']}
+        validate_scene_colormaps([{'id': 1, 'points': color_points}, {'id': 2, 'points': value_points, 'colormap': BLACK_TO_WHITE}, {'id': 3, 'points': None}])
+        for scene_element in [{'id': 4, 'points': value_points}, {'id': 4, 'points': value_points, 'colormap': {'colors': []}}]:
+            with self.subTest(scene_element=scene_element):
+                with self.assertRaisesRegex(ColormapError, 'Scene element 4'):
+                    validate_scene_colormaps([scene_element])
+
+
+if __name__ == '__main__':
+    unittest.main()
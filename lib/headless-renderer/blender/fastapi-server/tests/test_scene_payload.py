@@ -0,0 +1,75 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import io
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_payload import PREAMBLE, MAGIC, VERSION, ScenePayloadError, read_scene_payload_index, write_scene_payload
+
+CONFIGURATION = {'camera_eye': [1, 2, 3], 'camera_center': [0, 0, 0], 'camera_fov_y_degrees': 45}
+SCENE_ELEMENTS = [
+    {'id': 1, 'type': 'dataset', 'points': None},
+    {'id': 2, 'type': 'point-primitive', 'points': [{'x': 1, 'y': 2, 'z': 3, 'size': 1, 'r': 0.1, 'g': 0.2, 'b': 0.3}] * 4},
+]
+
+
+def scene_payload_with_index(change_index=None, index=None):
+    # A valid scene payload whose index was changed in place by change_index(index), or replaced by index
+    f = io.BytesIO()
+    write_scene_payload(f, CONFIGURATION, SCENE_ELEMENTS)
+    _, _, index_offset, _ = PREAMBLE.unpack(f.getvalue()[:PREAMBLE.size])
+    if index is None:
+        index = json.loads(f.getvalue()[index_offset:])
+        change_index(index)
+    index = json.dumps(index).encode('utf-8') if not isinstance(index, bytes) else index
+    return io.BytesIO(PREAMBLE.pack(MAGIC, VERSION, index_offset, len(index)) + f.getvalue()[PREAMBLE.size:index_offset] + index)
+
+
+def points(index):
+    return index['scene_elements'][1]['points']
+
+
+class ScenePayloadIndexTest(unittest.TestCase):
+    def test_valid_index(self):
+        index = read_scene_payload_index(scene_payload_with_index(lambda index: None))
+        self.assertEqual(index['configuration'], CONFIGURATION)
+        self.assertEqual(points(index)['count'], 4)
+
+    def test_colormap_fields(self):
+        index = read_scene_payload_index(scene_payload_with_index(lambda index: points(index).update(fields=['x', 'y', 'z', 'size', 'value', 'w', 'v'])))
+        self.assertEqual(points(index)['fields'][4], 'value')
+
+    def test_invalid_index(self):
+        for index in [b'{"configuration": ', b'\xff', [], {'configuration': CONFIGURATION}, {'configuration': None, 'scene_elements': []}]:
+            with self.subTest(index=index):
+                with self.assertRaises(ScenePayloadError):
+                    read_scene_payload_index(scene_payload_with_index(index=index))
+
+    def test_invalid_points(self):
+        changes = {
+            'scene element not an object': lambda index: index['scene_elements'].append(3),
+            'points not an object': lambda index: index['scene_elements'][1].update(points=[1, 2]),
+            'no fields': lambda index: points(index).pop('fields'),
+            'duplicate fields': lambda index: points(index).update(fields=['x', 'x']),
+            'no position': lambda index: points(index).update(fields=['size', 'r', 'g', 'b', 'value', 'w', 'v']),
+            'no color': lambda index: points(index).update(fields=['x', 'y', 'z', 'size', 'r', 'g', 'w']),
+            'no size': lambda index: points(index).update(fields=['x', 'y', 'z', 'r', 'g', 'b', 'value']),
+            'count not a number': lambda index: points(index).update(count='4'),
+            'negative count': lambda index: points(index).update(count=-1),
+            'chunk without offset': lambda index: points(index)['chunks'][0].pop('offset'),
+            'chunk before the points': lambda index: points(index)['chunks'][0].update(offset=0),
+            'chunk beyond the points': lambda index: [points(index)['chunks'][0].update(count=1000), points(index).update(count=1000)],
+            'count not the chunks': lambda index: points(index).update(count=5),
+        }
+        for name, change_index in changes.items():
+            with self.subTest(name):
+                with self.assertRaises(ScenePayloadError):
+                    read_scene_payload_index(scene_payload_with_index(change_index))
+
+
+if __name__ == '__main__':
+    unittest.main()
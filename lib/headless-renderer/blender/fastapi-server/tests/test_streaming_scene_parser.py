@@ -0,0 +1,118 @@
+# Run from the fastapi-server directory: python3 -m unittest discover tests
+
+import io
+import os
+import sys
+import json
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_payload import read_scene_payload, read_scene_payload_index
+from streaming_scene_parser import SceneStreamError, parse_scene_stream
+
+BODY = {
+    'camera_eye': [2.2737033367156982, 2.015049934387207, -3.8e-2],
+    'camera_center': [0, 0.5, 0],
+    'camera_fov_y_degrees': 45.5,
+    'width': 1280,
+    'height': 720,
+    'level_of_detail': {'point_cell_size_pixels': 1.5e-3, 'point_reduction': 'merge'},
+    'profile': False,
+    'scene_elements': [
+        {
+            'id': 4294967295,
+            'type': 'dataset',
+            'colorRGB': [0.1, 0.25, 1.0],
+            'translateXZ': {'0': -0.75, '1': 1.5E+2},
+            'translateY': 0.25,
+            'scaleY': 0.5,
+            'extent': None,
+            'idBufferOnly': False,
+            'points': None,
+            'label': 'Größe "a" ✓',
+        },
+        {
+            'id': 7,
+            'type': 'point-primitive',
+            'colorRGB': None,
+            'idBufferOnly': True,
+            'points': [
+                {'x': 0.5, 'y': 0.125, 'z': 1e-2, 'size': 1, 'r': 0.0, 'g': 0.5, 'b': 1.0, 'index': 0},
+                {'x': -12.75, 'y': 3, 'z': 0.0625, 'size': 2.5, 'r': 1, 'g': 0, 'b': 0.25, 'index': 1, 'tags': [1, 2]},
+                {'x': 45.5, 'y': 0.1, 'z': 7.25e1, 'size': 0.5, 'r': 0.2, 'g': 0.3, 'b': 0.4, 'index': 2},
+            ],
+        },
+        {
+            'id': 8,
+            'type': 'point-primitive',
+            'colormap': {'preset': 'smithwalt', 'identifier': 'viridis', 'domain': [-1, 1]},
+            'points': [
+                {'x': 1.5, 'y': 2.25, 'z': 3.125, 'size': 1, 'value': -0.5},
+                {'x': 0.75, 'y': 0.5, 'z': 0.25, 'size': 1, 'value': 0.75},
+            ],
+        },
+    ],
+}
+
+
+def parse_chunks(chunks, chunk_points=2):
+    # Like RequestBodyStream, which passes on non-empty chunks only and ends the body with b''
+    chunk_iterator = iter([chunk for chunk in chunks if chunk] + [b''])
+    f = io.BytesIO()
+    configuration, point_count, _ = parse_scene_stream(lambda: next(chunk_iterator), f, chunk_points=chunk_points)
+    return configuration, point_count, f.getvalue()
+
+
+class StreamingSceneParserTest(unittest.TestCase):
+    def assert_matches_json(self, body, chunks, path):
+        expected = json.loads(body)
+        configuration, point_count, payload = parse_chunks(chunks)
+
+        expected_configuration = {key: value for key, value in expected.items() if key != 'scene_elements'}
+        self.assertEqual(configuration, expected_configuration)
+        self.assertEqual(point_count, sum(len(element['points']) for element in expected['scene_elements'] if element['points']))
+
+        self.assertEqual(read_scene_payload_index(io.BytesIO(payload))['configuration'], expected_configuration)
+        with open(path, 'wb') as f:
+            f.write(payload)
+        _, scene_elements = read_scene_payload(path)
+        self.assertEqual(len(scene_elements), len(expected['scene_elements']))
+        for scene_element, expected_element in zip(scene_elements, expected['scene_elements']):
+            self.assertEqual({key: value for key, value in scene_element.items() if key != 'points'}, {key: value for key, value in expected_element.items() if key != 'points'})
+            if not expected_element['points']:
+                self.assertEqual(scene_element['points'], expected_element['points'])
+                continue
+            for field, values in scene_element['points'].items():
+                expected_values = np.array([point[field] for point in expected_element['points']], dtype=np.float32)
+                np.testing.assert_array_equal(values, expected_values, err_msg=f"Field {field} of scene element {expected_element['id']}")
+
+    def test_split_at_every_byte(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"scene_payload_{os.getpid()}.bin")
+        try:
+            for indent in [None, 1]:
+                body = json.dumps(BODY, indent=indent, ensure_ascii=False).encode('utf-8')
+                for offset in range(len(body) + 1):
+                    with self.subTest(indent=indent, offset=offset, around=body[max(offset - 8, 0):offset + 8]):
+                        self.assert_matches_json(body, [body[:offset], body[offset:]], path)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_split_into_single_bytes(self):
+        body = json.dumps(BODY).encode('utf-8')
+        configuration, point_count, _ = parse_chunks([body[index:index + 1] for index in range(len(body))])
+        self.assertEqual(configuration['camera_fov_y_degrees'], 45.5)
+        self.assertEqual(point_count, 5)
+
+    def test_invalid_json(self):
+        for body in [b'{"camera_fov_y_degrees": 45.}', b'{"scene_elements": [{"points": [{"x": 1}]}', b'{"width": 1} x']:
+            with self.subTest(body=body):
+                with self.assertRaises(SceneStreamError):
+                    parse_chunks([body])
+
+
+if __name__ == '__main__':
+    unittest.main()